@@ -15,6 +15,7 @@ from pydantic import BaseModel
 from starlette.websockets import WebSocketState
 
 from .core import OpenInterpreter
+from .utils.blob_store import json_default
 
 last_start_time = 0
 
@@ -82,9 +83,9 @@ class AsyncInterpreter(OpenInterpreter):
             run_code = None  # Will later default to auto_run unless the user makes a command here
 
             # But first, process any commands.
-            if self.messages[-1].get("type") == "command":
-                command = self.messages[-1]["content"]
-                self.messages = self.messages[:-1]
+            if self._messages[-1].get("type") == "command":
+                command = self._messages[-1]["content"]
+                self._messages = self._messages[:-1]
 
                 if command == "stop":
                     # Any start flag would have stopped it a moment ago, but to be sure:
@@ -161,7 +162,7 @@ class AsyncInterpreter(OpenInterpreter):
 
                 if not sent_chunks:
                     print("ERROR. NO CHUNKS SENT. TRYING AGAIN.")
-                    print("Messages:", self.messages)
+                    print("Messages:", self._messages)
                     messages = [
                         "Hello? Answer please.",
                         "Just say something, anything.",
@@ -169,7 +170,7 @@ class AsyncInterpreter(OpenInterpreter):
                         "Can you respond?",
                         "Please reply.",
                     ]
-                    self.messages.append(
+                    self._messages.append(
                         {
                             "role": "user",
                             "type": "message",
@@ -219,45 +220,45 @@ class AsyncInterpreter(OpenInterpreter):
                 pass
 
             elif "content" in chunk and not (
-                len(self.messages) > 0
+                len(self._messages) > 0
                 and (
                     (
-                        "type" in self.messages[-1]
-                        and chunk.get("type") != self.messages[-1].get("type")
+                        "type" in self._messages[-1]
+                        and chunk.get("type") != self._messages[-1].get("type")
                     )
                     or (
-                        "format" in self.messages[-1]
-                        and chunk.get("format") != self.messages[-1].get("format")
+                        "format" in self._messages[-1]
+                        and chunk.get("format") != self._messages[-1].get("format")
                     )
                 )
             ):
-                if len(self.messages) == 0:
+                if len(self._messages) == 0:
                     raise Exception(
                         "You must send a 'start: True' chunk first to create this message."
                     )
                 # Append to an existing message
                 if (
-                    "type" not in self.messages[-1]
+                    "type" not in self._messages[-1]
                 ):  # It was created with a type-less start message
-                    self.messages[-1]["type"] = chunk["type"]
+                    self._messages[-1]["type"] = chunk["type"]
                 if (
-                    chunk.get("format") and "format" not in self.messages[-1]
+                    chunk.get("format") and "format" not in self._messages[-1]
                 ):  # It was created with a type-less start message
-                    self.messages[-1]["format"] = chunk["format"]
-                if "content" not in self.messages[-1]:
-                    self.messages[-1]["content"] = chunk["content"]
+                    self._messages[-1]["format"] = chunk["format"]
+                if "content" not in self._messages[-1]:
+                    self._messages[-1]["content"] = chunk["content"]
                 else:
-                    self.messages[-1]["content"] += chunk["content"]
+                    self._messages[-1]["content"] += chunk["content"]
 
-            # elif "content" in chunk and (len(self.messages) > 0 and self.messages[-1] == {'role': 'user', 'start': True}):
+            # elif "content" in chunk and (len(self._messages) > 0 and self._messages[-1] == {'role': 'user', 'start': True}):
             #     # Last message was {'role': 'user', 'start': True}. Just populate that with this chunk
-            #     self.messages[-1] = chunk.copy()
+            #     self._messages[-1] = chunk.copy()
 
             elif "start" in chunk or (
-                len(self.messages) > 0
+                len(self._messages) > 0
                 and (
-                    chunk.get("type") != self.messages[-1].get("type")
-                    or chunk.get("format") != self.messages[-1].get("format")
+                    chunk.get("type") != self._messages[-1].get("type")
+                    or chunk.get("format") != self._messages[-1].get("format")
                 )
             ):
                 # Create a new message
@@ -268,12 +269,14 @@ class AsyncInterpreter(OpenInterpreter):
                     chunk_copy.pop("start")
                 if "content" not in chunk_copy:
                     chunk_copy["content"] = ""
-                self.messages.append(chunk_copy)
+                self._messages.append(chunk_copy)
 
         elif type(chunk) == bytes:
-            if self.messages[-1]["content"] == "":  # We initialize as an empty string ^
-                self.messages[-1]["content"] = b""  # But it actually should be bytes
-            self.messages[-1]["content"] += chunk
+            if (
+                self._messages[-1]["content"] == ""
+            ):  # We initialize as an empty string ^
+                self._messages[-1]["content"] = b""  # But it actually should be bytes
+            self._messages[-1]["content"] += chunk
 
 
 def authenticate_function(key):
@@ -574,7 +577,9 @@ def create_router(async_interpreter):
                                 output["id"] = id
                             if async_interpreter.debug:
                                 print("Sending this over the websocket:", output)
-                            await websocket.send_text(json.dumps(output))
+                            await websocket.send_text(
+                                json.dumps(output, default=json_default)
+                            )
 
                         if async_interpreter.require_acknowledge:
                             acknowledged = False
@@ -671,7 +676,7 @@ def create_router(async_interpreter):
         if hasattr(async_interpreter, setting):
             setting_value = getattr(async_interpreter, setting)
             try:
-                return json.dumps({setting: setting_value})
+                return json.dumps({setting: setting_value}, default=json_default)
             except TypeError:
                 return {"error": "Failed to serialize the setting value"}, 500
         else:
@@ -851,13 +856,13 @@ def create_router(async_interpreter):
 
         run_code = False
         if (
-            async_interpreter.messages
-            and async_interpreter.messages[-1]["type"] == "code"
+            async_interpreter._messages
+            and async_interpreter._messages[-1]["type"] == "code"
             and last_message.content.lower().strip(".!?").strip() == "yes"
         ):
             run_code = True
         elif type(last_message.content) == str:
-            async_interpreter.messages.append(
+            async_interpreter._messages.append(
                 {
                     "role": "user",
                     "type": "message",
@@ -868,7 +873,7 @@ def create_router(async_interpreter):
         elif type(last_message.content) == list:
             for content in last_message.content:
                 if content["type"] == "text":
-                    async_interpreter.messages.append(
+                    async_interpreter._messages.append(
                         {"role": "user", "type": "message", "content": str(content)}
                     )
                     print(">", content)
@@ -886,7 +891,7 @@ def create_router(async_interpreter):
 
                     data = url.split("base64,")[1]
                     format = "base64." + url.split(";")[0].split("/")[1]
-                    async_interpreter.messages.append(
+                    async_interpreter._messages.append(
                         {
                             "role": "user",
                             "type": "image",
@@ -900,13 +905,13 @@ def create_router(async_interpreter):
                 # In context mode, we only respond if we recieved a {START} message
                 # Otherwise, we're just accumulating context
                 if last_message.content == "{START}":
-                    if async_interpreter.messages[-1]["content"] == "{START}":
+                    if async_interpreter._messages[-1]["content"] == "{START}":
                         # Remove that {START} message that would have just been added
-                        async_interpreter.messages = async_interpreter.messages[:-1]
+                        async_interpreter._messages = async_interpreter._messages[:-1]
                     last_start_time = time.time()
                     if (
-                        async_interpreter.messages
-                        and async_interpreter.messages[-1].get("role") != "user"
+                        async_interpreter._messages
+                        and async_interpreter._messages[-1].get("role") != "user"
                     ):
                         return
                 else:
@@ -923,7 +928,7 @@ def create_router(async_interpreter):
                 if last_message.content == "{START}":
                     # This just sometimes happens I guess
                     # Remove that {START} message that would have just been added
-                    async_interpreter.messages = async_interpreter.messages[:-1]
+                    async_interpreter._messages = async_interpreter._messages[:-1]
                     return
 
         async_interpreter.stop_event.set()
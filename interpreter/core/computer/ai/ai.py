@@ -1,122 +1,188 @@
+import collections
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 
-import tiktoken
+from .chunking import get_encoding, iter_chunks
+
+# Seconds to wait before retrying a failed chunk (doubles each attempt)
+RETRY_BACKOFF = 1
 
 
 def split_into_chunks(text, tokens, llm, overlap):
-    try:
-        encoding = tiktoken.encoding_for_model(llm.model)
-        tokenized_text = encoding.encode(text)
-        chunks = []
-        for i in range(0, len(tokenized_text), tokens - overlap):
-            chunk = encoding.decode(tokenized_text[i : i + tokens])
-            chunks.append(chunk)
-    except Exception:
-        chunks = []
-        for i in range(0, len(text), tokens * 4 - overlap):
-            chunk = text[i : i + tokens * 4]
-            chunks.append(chunk)
-    return chunks
-
-
-def chunk_responses(responses, tokens, llm):
-    try:
-        encoding = tiktoken.encoding_for_model(llm.model)
-        chunked_responses = []
-        current_chunk = ""
-        current_tokens = 0
-
-        for response in responses:
-            tokenized_response = encoding.encode(response)
-            new_tokens = current_tokens + len(tokenized_response)
-
-            # If the new token count exceeds the limit, handle the current chunk
-            if new_tokens > tokens:
-                # If current chunk is empty or response alone exceeds limit, add response as standalone
-                if current_tokens == 0 or len(tokenized_response) > tokens:
-                    chunked_responses.append(response)
-                else:
-                    chunked_responses.append(current_chunk)
-                    current_chunk = response
-                    current_tokens = len(tokenized_response)
-                continue
-
-            # Add response to the current chunk
-            current_chunk += "\n\n" + response if current_chunk else response
-            current_tokens = new_tokens
-
-        # Add remaining chunk if not empty
-        if current_chunk:
-            chunked_responses.append(current_chunk)
-    except Exception:
-        chunked_responses = []
-        current_chunk = ""
-        current_chars = 0
-
-        for response in responses:
-            new_chars = current_chars + len(response)
-
-            # If the new char count exceeds the limit, handle the current chunk
-            if new_chars > tokens * 4:
-                # If current chunk is empty or response alone exceeds limit, add response as standalone
-                if current_chars == 0 or len(response) > tokens * 4:
-                    chunked_responses.append(response)
-                else:
-                    chunked_responses.append(current_chunk)
-                    current_chunk = response
-                    current_chars = len(response)
-                continue
-
-            # Add response to the current chunk
-            current_chunk += "\n\n" + response if current_chunk else response
-            current_chars = new_chars
-
-        # Add remaining chunk if not empty
-        if current_chunk:
-            chunked_responses.append(current_chunk)
-    return chunked_responses
-
-
-def fast_llm(llm, system_message, user_message):
-    old_messages = llm.interpreter.messages
-    old_system_message = llm.interpreter.system_message
-    try:
-        llm.interpreter.system_message = system_message
-        llm.interpreter.messages = []
-        response = llm.interpreter.chat(user_message)
-    finally:
-        llm.interpreter.messages = old_messages
-        llm.interpreter.system_message = old_system_message
-        return response[-1].get("content")
-
-
-def query_map_chunks(chunks, llm, query):
-    """Query the chunks of text using query_chunk_map."""
-    with ThreadPoolExecutor() as executor:
-        responses = list(
-            executor.map(lambda chunk: fast_llm(llm, query, chunk), chunks)
-        )
+    """
+    Splits `text` (a string, path, open file or iterator of strings) into chunks of `tokens`
+    tokens. Returns a generator, so large files are read as the chunks are used.
+    """
+    return iter_chunks(text, tokens, llm.model, overlap)
+
+
+def token_counter(llm):
+    """
+    Returns a function that counts the tokens in a string for `llm.model`.
+    """
+    encoding = get_encoding(llm.model)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def group_responses(responses, tokens, count_tokens):
+    """
+    Groups consecutive responses so each group fits in `tokens`. Every group gets at least
+    two responses (when there are two left), so each round of reducing shrinks the list.
+    Returns a list of lists.
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for response in responses:
+        response_tokens = count_tokens(response)
+        if len(current) >= 2 and current_tokens + response_tokens > tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(response)
+        current_tokens += response_tokens
+
+    if current:
+        if len(current) == 1 and groups:
+            # Don't leave one response on its own, it would never be reduced
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+
+    return groups
+
+
+def complete(llm, system_message, user_message):
+    """
+    A single call to the LLM, without tools or conversation history.
+    Doesn't read or change any interpreter state, so it's safe to call from many threads.
+    """
+    model = llm.model
+    if model == "i":
+        model = "openai/i"
+
+    params = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message},
+        ],
+        "stream": True,
+    }
+    if llm.api_key:
+        params["api_key"] = llm.api_key
+    if llm.api_base:
+        params["api_base"] = llm.api_base
+    if llm.api_version:
+        params["api_version"] = llm.api_version
+    if llm.max_tokens:
+        params["max_tokens"] = llm.max_tokens
+    if llm.temperature:
+        params["temperature"] = llm.temperature
+
+    response = ""
+    for chunk in llm.completions(**params):
+        if "choices" not in chunk or len(chunk["choices"]) == 0:
+            continue
+        content = chunk["choices"][0]["delta"].get("content")
+        if content:
+            response += content
+    return response
+
+
+def run_all(llm, system_message, inputs, max_workers, max_retries, progress, stage):
+    """
+    Runs `complete` on every input with at most `max_workers` calls at once, retrying
+    each failed call (with backoff) up to `max_retries` times. Returns responses in order.
+
+    `inputs` can be a generator. It's only read a little ahead of the calls, so inputs
+    don't all have to be in memory at once.
+    """
+    total = len(inputs) if hasattr(inputs, "__len__") else None
+    done = 0
+    lock = threading.Lock()
+
+    def run_one(user_message):
+        nonlocal done
+        for attempt in range(max_retries + 1):
+            try:
+                response = complete(llm, system_message, user_message)
+                if response.strip() == "":
+                    raise ValueError("The LLM returned an empty response.")
+                break
+            except Exception:
+                if attempt == max_retries:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2**attempt)
+        if progress:
+            with lock:
+                done += 1
+                progress(stage, done, total)
+        return response
+
+    if total == 1:
+        return [run_one(inputs[0])]
+
+    responses = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        for user_message in inputs:
+            if len(pending) >= 2 * max_workers:
+                responses.append(pending.popleft().result())
+            pending.append(executor.submit(run_one, user_message))
+        while pending:
+            responses.append(pending.popleft().result())
     return responses
 
 
-def query_reduce_chunks(responses, llm, chunk_size, query):
-    """Reduce query responses in a while loop."""
+def query_map_chunks(chunks, llm, query, max_workers=8, max_retries=3, progress=None):
+    """Query each chunk of text (the "map" step)."""
+    return run_all(llm, query, chunks, max_workers, max_retries, progress, "map")
+
+
+def query_reduce_chunks(
+    responses,
+    llm,
+    chunk_size,
+    query,
+    max_workers=8,
+    max_retries=3,
+    progress=None,
+):
+    """
+    Reduce query responses in a tree: responses are grouped to fit `chunk_size` tokens,
+    each group is reduced to one response, and so on until one is left.
+    """
+    count_tokens = token_counter(llm)
+    level = 0
     while len(responses) > 1:
-        chunks = chunk_responses(responses, chunk_size, llm)
-
-        # Use multithreading to summarize each chunk simultaneously
-        with ThreadPoolExecutor() as executor:
-            summaries = list(
-                executor.map(lambda chunk: fast_llm(llm, query, chunk), chunks)
-            )
+        level += 1
+        groups = group_responses(responses, chunk_size, count_tokens)
+        responses = run_all(
+            llm,
+            query,
+            ["\n\n".join(group) for group in groups],
+            max_workers,
+            max_retries,
+            progress,
+            f"reduce {level}",
+        )
 
-    return summaries[0]
+    return responses[0]
 
 
 class Ai:
     def __init__(self, computer):
         self.computer = computer
 
+        # For query / summarize
+        self.chunk_size = 2000  # Tokens
+        self.overlap = 50
+        self.max_workers = 8  # LLM calls at once
+        self.max_retries = 3
+
     def chat(self, text, base64=None):
         messages = [
             {
@@ -164,29 +230,51 @@ class Ai:
 
             return response[-1].get("content")
 
-    def query(self, text, query, custom_reduce_query=None):
+    def query(self, text, query, custom_reduce_query=None, progress=None):
+        """
+        Runs `query` over `text` of any length: the text is split into chunks, each chunk is
+        queried (several at once), then the answers are merged with `custom_reduce_query`.
+        `text` can also be a path, an open file or an iterator of strings, which is read
+        as it's queried (so `computer.ai.summarize(open(path))` works on huge files).
+
+        `progress`, if given, is called as progress(stage, done, total) as chunks finish.
+        """
         if custom_reduce_query == None:
             custom_reduce_query = query
 
-        chunk_size = 2000
-        overlap = 50
+        llm = self.computer.interpreter.llm
+        if not llm._is_loaded:
+            llm.load()
 
-        # Split the text into chunks
-        chunks = split_into_chunks(
-            text, chunk_size, self.computer.interpreter.llm, overlap
-        )
+        # Split the text into chunks (lazily, `text` might be a huge file)
+        chunks = split_into_chunks(text, self.chunk_size, llm, self.overlap)
 
         # (Map) Query each chunk
-        responses = query_map_chunks(chunks, self.computer.interpreter.llm, query)
+        responses = query_map_chunks(
+            chunks,
+            llm,
+            query,
+            max_workers=self.max_workers,
+            max_retries=self.max_retries,
+            progress=progress,
+        )
+        if not responses:
+            return ""
 
         # (Reduce) Compress the responses
         response = query_reduce_chunks(
-            responses, self.computer.interpreter.llm, chunk_size, custom_reduce_query
+            responses,
+            llm,
+            self.chunk_size,
+            custom_reduce_query,
+            max_workers=self.max_workers,
+            max_retries=self.max_retries,
+            progress=progress,
         )
 
         return response
 
-    def summarize(self, text):
+    def summarize(self, text, progress=None):
         query = "You are a highly skilled AI trained in language comprehension and summarization. I would like you to read the following text and summarize it into a concise abstract paragraph. Aim to retain the most important points, providing a coherent and readable summary that could help a person understand the main points of the discussion without needing to read the entire text. Please avoid unnecessary details or tangential points."
         custom_reduce_query = "You are tasked with taking multiple summarized texts and merging them into one unified and concise summary. Maintain the core essence of the content and provide a clear and comprehensive summary that encapsulates all the main points from the individual summaries."
-        return self.query(text, query, custom_reduce_query)
+        return self.query(text, query, custom_reduce_query, progress=progress)
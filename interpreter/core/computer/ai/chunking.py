@@ -0,0 +1,143 @@
+"""
+Splits text into overlapping chunks of an exact number of tokens, lazily.
+
+The text can be a string, a path, an open file, or any iterator of strings, and is read
+and tokenized a block at a time, so it never has to fit in memory:
+
+    for chunk in iter_chunks(open("huge.log"), 2000, "gpt-4o", overlap=50):
+        ...
+"""
+
+import codecs
+import os
+
+from ....terminal_interface.utils.count_tokens import get_encoder
+
+# Characters read (and tokenized) at a time
+BLOCK_SIZE = 64 * 1024
+
+
+def get_encoding(model):
+    """
+    The tiktoken encoding for `model` (from the shared registry in count_tokens, so each is
+    loaded once). If no encoding can be loaded (tiktoken downloads them), we count characters.
+    """
+    return get_encoder(model) or APPROXIMATE_ENCODING
+
+
+class ApproximateEncoding:
+    """
+    Stands in for a tokenizer when we don't have one. A "token" is 4 characters.
+    """
+
+    name = "approximate"
+
+    def encode(self, text, disallowed_special=()):
+        return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+APPROXIMATE_ENCODING = ApproximateEncoding()
+
+
+def iter_text(source, block_size=BLOCK_SIZE):
+    """
+    Yields `source` as strings of about `block_size` characters.
+    `source` is text (str), a path (os.PathLike), an open file (text or binary), or an
+    iterator of strings.
+    """
+    if isinstance(source, str):
+        for i in range(0, len(source), block_size):
+            yield source[i : i + block_size]
+        return
+
+    if isinstance(source, os.PathLike):
+        with open(source, "rb") as f:
+            yield from iter_text(f, block_size)
+        return
+
+    if hasattr(source, "read"):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            block = source.read(block_size)
+            if not block:
+                break
+            if isinstance(block, bytes):
+                block = decoder.decode(block)
+            yield block
+        yield decoder.decode(b"", final=True)
+        return
+
+    for block in source:
+        if isinstance(block, bytes):
+            block = block.decode("utf-8", errors="replace")
+        yield block
+
+
+def iter_tokens(source, encoding, block_size=BLOCK_SIZE):
+    """
+    Yields lists of tokens for `source`, tokenizing a block at a time.
+
+    Blocks are cut just after a newline, where the tokenizer would split anyway, so the
+    tokens are the same as encoding the whole text at once. (A single line longer than a
+    block is cut before a space instead, which is almost always the same.)
+    """
+    pending = ""
+    for block in iter_text(source, block_size):
+        pending += block
+        if len(pending) < block_size:
+            continue
+        cut = _safe_cut(pending)
+        if cut is None and len(pending) > 4 * block_size:
+            # No good place to cut at all. Give up on being exact rather than on memory.
+            cut = len(pending)
+        if cut:
+            yield encoding.encode(pending[:cut], disallowed_special=())
+            pending = pending[cut:]
+    if pending:
+        yield encoding.encode(pending, disallowed_special=())
+
+
+def iter_chunks(source, tokens, model, overlap=0, block_size=BLOCK_SIZE):
+    """
+    Yields chunks of `tokens` tokens (the last may be shorter), each starting `overlap`
+    tokens before the previous one ended.
+    """
+    if overlap >= tokens:
+        raise ValueError("`overlap` must be smaller than the chunk size.")
+
+    encoding = get_encoding(model)
+    buffer = []
+    new_tokens = 0  # Tokens in the buffer that haven't been in a chunk yet
+
+    for block_tokens in iter_tokens(source, encoding, block_size):
+        buffer.extend(block_tokens)
+        new_tokens += len(block_tokens)
+        while len(buffer) >= tokens:
+            yield encoding.decode(buffer[:tokens])
+            buffer = buffer[tokens - overlap :]
+            new_tokens = len(buffer) - overlap
+
+    if new_tokens > 0:
+        yield encoding.decode(buffer)
+
+
+def _safe_cut(text):
+    # After the last newline that's followed by something other than whitespace
+    end = len(text) - 1
+    while end > 0:
+        newline = text.rfind("\n", 0, end)
+        if newline == -1:
+            break
+        if not text[newline + 1].isspace():
+            return newline + 1
+        end = newline
+    # Otherwise before the last space that's followed by a letter
+    space = text.rfind(" ", 0, len(text) - 1)
+    while space > 0:
+        if text[space + 1].isalpha() and not text[space - 1].isspace():
+            return space
+        space = text.rfind(" ", 0, space)
+    return None
@@ -13,6 +13,7 @@ import requests
 from IPython.display import display
 from PIL import Image
 
+from ....terminal_interface.utils.oi_dir import oi_dir
 from ...utils.lazy_import import lazy_import
 from ..utils.recipient_utils import format_to_recipient
 
@@ -49,7 +50,7 @@ class Display:
         # set width and height to None initially to prevent pyautogui from importing until it's needed
         self._width = None
         self._height = None
-        self._hashes = {}
+        self._hashes = None  # Icon embedding cache, opened on first use of find()
 
     # We use properties here so that this code only executes when height/width are accessed for the first time
     @property
@@ -214,10 +215,20 @@ class Display:
         return screenshot  # this will be a list of combine_screens == False
 
     def find(self, description, screenshot=None):
+        """
+        Finds an icon (or, if `description` is in quotes, text) on the screen.
+        Pass a list of descriptions to look for several at once on the same screenshot.
+        """
+        if isinstance(description, (list, tuple)):
+            return self._find_many(list(description), screenshot)
+
         if description.startswith('"') and description.endswith('"'):
             return self.find_text(description.strip('"'), screenshot)
         else:
             try:
+                if self._hashes is None:
+                    self._hashes = open_embedding_cache()
+
                 if self.computer.debug:
                     print("DEBUG MODE ON")
                     print("NUM HASHES:", len(self._hashes))
@@ -228,9 +239,6 @@ class Display:
                     )
                     print(message)
 
-                if len(self._hashes) > 5000:
-                    self._hashes = dict(list(self._hashes.items())[-5000:])
-
                 from .point.point import point
 
                 result = point(
@@ -274,6 +282,42 @@ class Display:
                         + "\n\nIcon locating API not available, or we were unable to find the icon. Please try another method to find this icon."
                     )
 
+    def _find_many(self, descriptions, screenshot=None):
+        if screenshot == None:
+            screenshot = self.screenshot(show=False)
+
+        results = [None] * len(descriptions)
+        icon_positions = []
+        for i, description in enumerate(descriptions):
+            if description.startswith('"') and description.endswith('"'):
+                results[i] = self.find_text(description.strip('"'), screenshot)
+            else:
+                icon_positions.append(i)
+
+        if not icon_positions:
+            return results
+
+        icon_descriptions = [descriptions[i] for i in icon_positions]
+        try:
+            if self._hashes is None:
+                self._hashes = open_embedding_cache()
+
+            from .point.point import find_icons
+
+            # Icons are detected and embedded once, then matched against every description
+            icon_results = find_icons(
+                icon_descriptions, screenshot, self.computer.debug, self._hashes
+            )
+        except:
+            if self.computer.debug or self.computer.offline:
+                raise
+            # Fall back to finding them one by one (through the API)
+            icon_results = [self.find(d, screenshot) for d in icon_descriptions]
+
+        for i, result in zip(icon_positions, icon_results):
+            results[i] = result
+        return results
+
     def find_text(self, text, screenshot=None):
         """
         Searches for specified text within a screenshot or the current screen if no screenshot is provided.
@@ -438,6 +482,23 @@ def take_screenshot_to_pil(screen=0, combine_screens=True):
         )
 
 
+def open_embedding_cache():
+    """
+    Opens the icon embedding cache shared by all interpreter processes,
+    falling back to an in-memory dict if it can't be used.
+    """
+    max_entries = int(os.getenv("OI_POINT_EMBEDDING_CACHE_SIZE", "5000"))
+    try:
+        from .point.embedding_cache import EmbeddingCache
+
+        return EmbeddingCache(
+            os.path.join(oi_dir, "icon_embeddings"), max_entries=max_entries
+        )
+    except Exception as e:
+        print("Could not open the icon embedding cache, using memory instead:", e)
+        return {}
+
+
 def get_displays():
     monitors = get_monitors()
     return monitors
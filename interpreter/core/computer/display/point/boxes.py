@@ -0,0 +1,213 @@
+"""
+Finds the bounding boxes of GUI elements (icons, buttons...) on a screenshot.
+
+Everything works on (N, 4) integer arrays of [x, y, width, height] rather than lists of
+dicts, so each step is a handful of numpy operations instead of Python loops over every
+box (and, worse, every pair of boxes).
+"""
+
+import random
+
+import cv2
+import numpy as np
+
+# Default adaptive threshold parameters (these worked best across the screenshots we tried)
+DEFAULT_PARAMETERS = {
+    "contrast_level": 1.8,
+    "adaptive_method": cv2.ADAPTIVE_THRESH_MEAN_C,
+    "threshold_type": cv2.THRESH_BINARY_INV,
+    "block_size": 11,
+    "C": 3,
+}
+
+
+def random_parameters():
+    """
+    A random set of threshold parameters, for experimenting (OI_POINT_PERMUTATE).
+    """
+    return {
+        "contrast_level": random.uniform(1, 40),
+        "adaptive_method": random.choice(
+            [cv2.ADAPTIVE_THRESH_MEAN_C, cv2.ADAPTIVE_THRESH_GAUSSIAN_C]
+        ),
+        "threshold_type": random.choice([cv2.THRESH_BINARY, cv2.THRESH_BINARY_INV]),
+        "block_size": 11,
+        "C": random.randint(-10, 10),
+    }
+
+
+def enhance_contrast(gray, contrast_level):
+    """
+    Same as PIL's ImageEnhance.Contrast on a grayscale image, without leaving numpy.
+    """
+    mean = int(gray.mean() + 0.5)
+    return cv2.convertScaleAbs(
+        gray, alpha=contrast_level, beta=mean * (1 - contrast_level)
+    )
+
+
+def binarize(gray, parameters=None):
+    """
+    Contrast + adaptive threshold, in one pass. Returns a binary (0/255) image.
+    """
+    parameters = {**DEFAULT_PARAMETERS, **(parameters or {})}
+    contrasted = enhance_contrast(gray, parameters["contrast_level"])
+    return cv2.adaptiveThreshold(
+        src=contrasted,
+        maxValue=255,
+        adaptiveMethod=parameters["adaptive_method"],
+        thresholdType=parameters["threshold_type"],
+        blockSize=parameters["block_size"],
+        C=parameters["C"],
+    )
+
+
+def element_boxes(gray, parameters=None):
+    """
+    Returns the bounding box of every connected blob in the thresholded image, as an
+    (N, 4) array of [x, y, width, height].
+    """
+    binary = binarize(gray, parameters)
+    # Grana's block-based labelling is several times faster than the default on large screens
+    _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+        binary, 8, cv2.CV_32S, cv2.CCL_GRANA
+    )
+    # Row 0 is the background
+    return stats[1:, :4].astype(np.int64)
+
+
+def within_size(boxes, min_width, max_width, min_height, max_height):
+    """
+    Returns a mask of which boxes are within the given size limits.
+    """
+    widths, heights = boxes[:, 2], boxes[:, 3]
+    return (
+        (widths >= min_width)
+        & (widths <= max_width)
+        & (heights >= min_height)
+        & (heights <= max_height)
+    )
+
+
+def overlaps_any(boxes, other_boxes, image_size):
+    """
+    Returns a mask of which boxes overlap any of `other_boxes` (e.g. text) by at least one pixel.
+
+    Rather than testing every pair, we paint `other_boxes` onto a mask and use its integral
+    image, so each box is checked with four lookups.
+    """
+    if len(boxes) == 0 or len(other_boxes) == 0:
+        return np.zeros(len(boxes), dtype=bool)
+
+    width, height = image_size
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for x, y, w, h in np.asarray(other_boxes):
+        if w > 0 and h > 0:
+            mask[max(y, 0) : y + h, max(x, 0) : x + w] = 1
+    integral = cv2.integral(mask)
+
+    x0 = np.clip(boxes[:, 0], 0, width)
+    y0 = np.clip(boxes[:, 1], 0, height)
+    x1 = np.clip(boxes[:, 0] + boxes[:, 2], 0, width)
+    y1 = np.clip(boxes[:, 1] + boxes[:, 3], 0, height)
+    covered = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    return covered > 0
+
+
+def expand_boxes(boxes, pixels, image_size):
+    """
+    Grows each box by `pixels` on every side, without going past the edges of the image.
+    """
+    width, height = image_size
+    boxes = boxes.copy()
+    x0 = np.maximum(boxes[:, 0] - pixels, 0)
+    y0 = np.maximum(boxes[:, 1] - pixels, 0)
+    x1 = np.minimum(boxes[:, 0] + boxes[:, 2] + pixels, width)
+    y1 = np.minimum(boxes[:, 1] + boxes[:, 3] + pixels, height)
+    boxes[:, 0], boxes[:, 1] = x0, y0
+    boxes[:, 2], boxes[:, 3] = x1 - x0, y1 - y0
+    return boxes
+
+
+def overlapping_pairs(boxes, cell_size=64):
+    """
+    Returns (i, j) index arrays (i < j) of every pair of boxes that overlap.
+
+    Boxes are bucketed into a grid of `cell_size` squares, and only boxes that share a
+    cell are compared, so this is roughly linear in the number of boxes.
+    """
+    cells = {}
+    x0 = boxes[:, 0] // cell_size
+    y0 = boxes[:, 1] // cell_size
+    x1 = (boxes[:, 0] + np.maximum(boxes[:, 2] - 1, 0)) // cell_size
+    y1 = (boxes[:, 1] + np.maximum(boxes[:, 3] - 1, 0)) // cell_size
+    for index in range(len(boxes)):
+        for cx in range(x0[index], x1[index] + 1):
+            for cy in range(y0[index], y1[index] + 1):
+                cells.setdefault((cx, cy), []).append(index)
+
+    candidates = set()
+    for members in cells.values():
+        for a in range(len(members)):
+            for b in range(a + 1, len(members)):
+                candidates.add((members[a], members[b]))
+    if not candidates:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    pairs = np.array(sorted(candidates), dtype=np.int64)
+    i, j = pairs[:, 0], pairs[:, 1]
+    a, b = boxes[i], boxes[j]
+    overlap = (
+        (a[:, 0] < b[:, 0] + b[:, 2])
+        & (a[:, 0] + a[:, 2] > b[:, 0])
+        & (a[:, 1] < b[:, 1] + b[:, 3])
+        & (a[:, 1] + a[:, 3] > b[:, 1])
+    )
+    return i[overlap], j[overlap]
+
+
+def combine_boxes(boxes, cell_size=64):
+    """
+    Merges overlapping boxes into their union, until no two boxes overlap.
+
+    Returns (combined_boxes, first_member), where `first_member[k]` is the index (into
+    `boxes`) of the first box that went into `combined_boxes[k]`.
+    """
+    first_member = np.arange(len(boxes))
+    while len(boxes) > 1:
+        i, j = overlapping_pairs(boxes, cell_size)
+        if len(i) == 0:
+            break
+
+        # Union-find over the overlap graph
+        parent = list(range(len(boxes)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        for a, b in zip(i.tolist(), j.tolist()):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                # Keep the lowest index as the root, so groups stay in order
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+        roots = np.array([find(index) for index in range(len(boxes))])
+
+        group_ids, group_of = np.unique(roots, return_inverse=True)
+        x0 = np.full(len(group_ids), np.iinfo(np.int64).max)
+        y0 = np.full(len(group_ids), np.iinfo(np.int64).max)
+        x1 = np.zeros(len(group_ids), dtype=np.int64)
+        y1 = np.zeros(len(group_ids), dtype=np.int64)
+        np.minimum.at(x0, group_of, boxes[:, 0])
+        np.minimum.at(y0, group_of, boxes[:, 1])
+        np.maximum.at(x1, group_of, boxes[:, 0] + boxes[:, 2])
+        np.maximum.at(y1, group_of, boxes[:, 1] + boxes[:, 3])
+
+        boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+        # A merged box might now overlap a box it didn't before, so go again
+        first_member = first_member[group_ids]
+
+    return boxes, first_member
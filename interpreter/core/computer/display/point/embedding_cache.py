@@ -0,0 +1,264 @@
+"""
+A persistent icon embedding cache for `computer.display.find`.
+
+Embeddings are stored as rows of a memory-mapped .npy matrix, and a small JSON index
+maps each icon hash to its row (plus when it was last used, for LRU eviction).
+Writes happen under an exclusive file lock and reads under a shared one, so concurrent
+interpreter processes share one cache, and a read never sees a row another process is
+evicting or reusing.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows. We still cache, but without a cross-process lock
+    fcntl = None
+
+
+class EmbeddingCache:
+    """
+    Dict-like store of `hash -> embedding` that survives restarts.
+
+    Supports `hash in cache`, `cache[hash]`, `cache[hash] = embedding`, `cache.update({...})` and `len(cache)`,
+    so it can be passed anywhere the old in-memory `hashes` dict was used.
+    """
+
+    version = 1
+
+    def __init__(self, path, max_entries=5000, refresh_interval=1.0):
+        self.path = path
+        self.max_entries = max_entries
+        # How often (in seconds) we check for other processes' writes
+        self.refresh_interval = refresh_interval
+
+        self._matrix_path = os.path.join(path, "embeddings.npy")
+        self._index_path = os.path.join(path, "index.json")
+        self._lock_path = os.path.join(path, "cache.lock")
+
+        self._matrix = None
+        self._entries = {}  # hash -> [row, last_used]
+        self._dim = None
+        self._generation = 0  # Bumped whenever the matrix file is recreated
+        self._index_stamp = None
+        self._last_refresh = 0
+        self._pending_hits = {}  # hash -> last_used, written out with the next update
+
+        os.makedirs(path, exist_ok=True)
+        self.refresh(force=True)
+
+    # Dict-like interface
+
+    def __contains__(self, key):
+        self._maybe_refresh()
+        return key in self._entries
+
+    def __getitem__(self, key):
+        embedding = self.get(key)
+        if embedding is None:
+            raise KeyError(key)
+        return embedding
+
+    def __setitem__(self, key, embedding):
+        self.update({key: embedding})
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        embedding = self.get_many([key]).get(key)
+        return default if embedding is None else embedding
+
+    def get_many(self, keys):
+        """
+        Returns {hash: embedding} for every key that's in the cache.
+        """
+        self._maybe_refresh()
+        if not any(key in self._entries for key in keys):
+            return {}
+        with self._lock(shared=True):
+            # Writers hold the lock exclusively, so with the index reloaded under it,
+            # every row we read belongs to the key the index says it does
+            self.refresh()
+            if self._matrix is None:
+                return {}
+            found = [key for key in keys if key in self._entries]
+            if not found:
+                return {}
+            # One fancy-indexed read, which also copies the rows out of the memmap
+            rows = self._matrix[[self._entries[key][0] for key in found]]
+        now = time.time()
+        for key in found:
+            self._pending_hits[key] = now
+        return dict(zip(found, rows))
+
+    def update(self, items):
+        """
+        Stores several embeddings at once (one lock, one index write).
+        """
+        items = {
+            key: np.asarray(value, dtype=np.float32).reshape(-1)
+            for key, value in dict(items).items()
+        }
+        if not items and not self._pending_hits:
+            return
+
+        with self._lock():
+            self.refresh(force=True)
+
+            if not items and self._matrix is None:
+                # Nothing stored yet, so there's nothing to mark as used
+                self._pending_hits = {}
+                return
+
+            dim = next(iter(items.values())).shape[0] if items else self._dim
+            if self._matrix is None or dim != self._dim:
+                # First write, or the embedding model changed. Start over.
+                self._create_matrix(dim)
+            elif self._matrix.shape[0] != self.max_entries:
+                self._resize_matrix(self.max_entries)
+
+            # Apply LRU timestamps from cache hits since the last write
+            for key, last_used in self._pending_hits.items():
+                if key in self._entries:
+                    self._entries[key][1] = max(self._entries[key][1], last_used)
+            self._pending_hits = {}
+
+            now = time.time()
+            free_rows = self._free_rows()
+            new_keys = [key for key in items if key not in self._entries]
+
+            # Evict least recently used entries if we're out of room
+            shortfall = len(new_keys) - len(free_rows)
+            if shortfall > 0:
+                evictable = sorted(
+                    (key for key in self._entries if key not in items),
+                    key=lambda key: self._entries[key][1],
+                )
+                for key in evictable[:shortfall]:
+                    free_rows.append(self._entries.pop(key)[0])
+
+            for key, value in items.items():
+                if key in self._entries:
+                    row = self._entries[key][0]
+                elif free_rows:
+                    row = free_rows.pop()
+                else:
+                    # More new items than the cache can hold. Keep the first ones.
+                    continue
+                self._matrix[row] = value
+                self._entries[key] = [row, now]
+
+            # Rows must hit the disk before the index points at them
+            self._matrix.flush()
+            self._write_index()
+
+    # Loading and saving
+
+    def refresh(self, force=False):
+        """
+        Reloads the index (and reopens the matrix) if another process has written to the cache.
+        """
+        self._last_refresh = time.time()
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if not force and stamp == self._index_stamp:
+            return
+
+        try:
+            with open(self._index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            # Corrupted or half-written by something other than us. Ignore it, it'll be rewritten.
+            return
+
+        if index.get("version") != self.version or not os.path.exists(
+            self._matrix_path
+        ):
+            return
+
+        self._index_stamp = stamp
+        self._entries = index.get("entries", {})
+        if self._matrix is None or index.get("generation") != self._generation:
+            self._dim = index.get("dim")
+            self._generation = index.get("generation")
+            self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+
+    def _maybe_refresh(self):
+        if time.time() - self._last_refresh > self.refresh_interval:
+            self.refresh()
+
+    def _write_index(self):
+        index = {
+            "version": self.version,
+            "dim": self._dim,
+            "generation": self._generation,
+            "entries": self._entries,
+        }
+        temp_path = self._index_path + f".{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(index, f)
+        # Atomic, so readers never see half an index
+        os.replace(temp_path, self._index_path)
+        stat = os.stat(self._index_path)
+        self._index_stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def _create_matrix(self, dim):
+        # Write a new file and swap it in, rather than truncating the old one,
+        # because other processes may still have the old one mapped
+        temp_path = self._matrix_path + f".{os.getpid()}.tmp"
+        matrix = np.lib.format.open_memmap(
+            temp_path,
+            mode="w+",
+            dtype=np.float32,
+            shape=(self.max_entries, dim),
+        )
+        os.replace(temp_path, self._matrix_path)
+        self._matrix = matrix
+        self._dim = dim
+        self._generation = (self._generation or 0) + 1
+        self._entries = {}
+
+    def _resize_matrix(self, capacity):
+        # Keep the most recently used entries that still fit
+        keep = sorted(self._entries.items(), key=lambda item: -item[1][1])[:capacity]
+        rows = [self._matrix[entry[0]].copy() for _, entry in keep]
+        self._create_matrix(self._dim)
+        for new_row, ((key, entry), value) in enumerate(zip(keep, rows)):
+            self._matrix[new_row] = value
+            self._entries[key] = [new_row, entry[1]]
+
+    def _free_rows(self):
+        used = {entry[0] for entry in self._entries.values()}
+        return [
+            row for row in range(self._matrix.shape[0] - 1, -1, -1) if row not in used
+        ]
+
+    def _lock(self, shared=False):
+        return _FileLock(self._lock_path, shared)
+
+
+class _FileLock:
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
@@ -0,0 +1,65 @@
+"""
+A small in-memory index for matching text queries against icon embeddings.
+
+All icon embeddings live in one contiguous, L2-normalized float32 matrix, so scoring
+any number of queries is a single matrix product, and picking the best icons is an
+`argpartition` (no full sort, no per-query tensor building).
+"""
+
+import numpy as np
+
+
+def normalize(embeddings):
+    """
+    L2-normalizes each row of `embeddings`. Rows of zeros are left as zeros.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(embeddings / norms)
+
+
+class IconIndex:
+    """
+    Holds the embeddings for a set of icons (usually, every icon on one screenshot).
+
+    >>> index = IconIndex(icon_embeddings)
+    >>> index.search(query_embeddings, top_k=10)
+    [[(icon_position, score), ...], ...]
+    """
+
+    def __init__(self, embeddings):
+        self.matrix = normalize(embeddings)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, queries, top_k=10):
+        """
+        Returns, for each query, a list of (row, cosine similarity) pairs for the `top_k`
+        most similar rows, best first.
+        """
+        queries = normalize(queries)
+        if len(self) == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        # (num_queries, num_icons), one BLAS call for every query at once
+        scores = queries @ self.matrix.T
+
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            # Unordered top k per row, then sort just those k
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), (scores.shape[0], k))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, row_scores)]
+            for rows, row_scores in zip(top, top_scores)
+        ]
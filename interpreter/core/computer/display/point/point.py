@@ -8,11 +8,21 @@ import cv2
 import nltk
 import numpy as np
 import torch
-from PIL import Image, ImageDraw, ImageEnhance, ImageFont
-from sentence_transformers import SentenceTransformer, util
+from PIL import Image, ImageDraw, ImageFont
+from sentence_transformers import SentenceTransformer
 
 from .....terminal_interface.utils.oi_dir import oi_dir
 from ...utils.computer_vision import pytesseract_get_text_bounding_boxes
+from .boxes import (
+    binarize,
+    combine_boxes,
+    element_boxes,
+    expand_boxes,
+    overlaps_any,
+    random_parameters,
+    within_size,
+)
+from .icon_index import IconIndex
 
 try:
     nltk.corpus.words.words()
@@ -43,6 +53,26 @@ from ...utils.computer_vision import find_text_in_image
 
 
 def point(description, screenshot=None, debug=False, hashes=None):
+    """
+    Finds `description` on the screen. Pass a list of descriptions to search for several
+    things on one screenshot at once, in which case you get back a list of results.
+    """
+    if isinstance(description, (list, tuple)):
+        results = [None] * len(description)
+        icon_positions = []
+        for i, d in enumerate(description):
+            if d.startswith('"') and d.endswith('"'):
+                results[i] = find_text_in_image(d.strip('"'), screenshot, debug)
+            else:
+                icon_positions.append(i)
+        if icon_positions:
+            icon_results = find_icons(
+                [description[i] for i in icon_positions], screenshot, debug, hashes
+            )
+            for i, result in zip(icon_positions, icon_results):
+                results[i] = result
+        return results
+
     if description.startswith('"') and description.endswith('"'):
         return find_text_in_image(description.strip('"'), screenshot, debug)
     else:
@@ -50,6 +80,14 @@ def point(description, screenshot=None, debug=False, hashes=None):
 
 
 def find_icon(description, screenshot=None, debug=False, hashes=None):
+    return find_icons([description], screenshot, debug, hashes)[0]
+
+
+def find_icons(descriptions, screenshot=None, debug=False, hashes=None):
+    """
+    Finds several icons on one screenshot. The (slow) icon detection and embedding
+    happens once, then every description is scored against the icons in one go.
+    """
     if debug:
         print("STARTING")
     if screenshot == None:
@@ -68,7 +106,7 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
     #     temp_image_path = temp_file.name
     #   print("yeah took", time.time()-thetime)
 
-    icons_bounding_boxes = get_element_boxes(image_data, debug)
+    boxes = get_element_boxes(image_data, debug)
 
     if debug:
         print("GOT ICON BOUNDING BOXES")
@@ -76,55 +114,24 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
     debug_path = os.path.join(os.path.expanduser("~"), "Desktop", "oi-debug")
 
     if debug:
-        # Create a draw object
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw red rectangles around all blocks
-        for block in icons_bounding_boxes:
-            left, top, width, height = (
-                block["x"],
-                block["y"],
-                block["width"],
-                block["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="red")
-        image_data_copy.save(
-            os.path.join(debug_path, "before_filtering_out_extremes.png")
-        )
+        save_debug_boxes(image_data, boxes, debug_path, "before_filtering_out_extremes")
 
     # Filter out extremes
     min_icon_width = int(os.getenv("OI_POINT_MIN_ICON_WIDTH", "10"))
     max_icon_width = int(os.getenv("OI_POINT_MAX_ICON_WIDTH", "500"))
     min_icon_height = int(os.getenv("OI_POINT_MIN_ICON_HEIGHT", "10"))
     max_icon_height = int(os.getenv("OI_POINT_MAX_ICON_HEIGHT", "500"))
-    icons_bounding_boxes = [
-        box
-        for box in icons_bounding_boxes
-        if min_icon_width <= box["width"] <= max_icon_width
-        and min_icon_height <= box["height"] <= max_icon_height
+    boxes = boxes[
+        within_size(
+            boxes, min_icon_width, max_icon_width, min_icon_height, max_icon_height
+        )
     ]
 
     if debug:
-        # Create a draw object
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw red rectangles around all blocks
-        for block in icons_bounding_boxes:
-            left, top, width, height = (
-                block["x"],
-                block["y"],
-                block["width"],
-                block["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="red")
-        image_data_copy.save(
-            os.path.join(debug_path, "after_filtering_out_extremes.png")
-        )
+        save_debug_boxes(image_data, boxes, debug_path, "after_filtering_out_extremes")
 
-    # Compute center_x and center_y for each box
-    for box in icons_bounding_boxes:
-        box["center_x"] = box["x"] + box["width"] / 2
-        box["center_y"] = box["y"] + box["height"] / 2
+    # Compute the center of each box (before we expand and combine them)
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
 
     # # Filter out text
 
@@ -137,23 +144,13 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
         print("GOT TEXT, processing it")
 
     if debug:
-        # Create a draw object
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw red rectangles around all blocks
-        for block in response:
-            left, top, width, height = (
-                block["left"],
-                block["top"],
-                block["width"],
-                block["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="blue")
-
-        # Save the image to the desktop
-        if not os.path.exists(debug_path):
-            os.makedirs(debug_path)
-        image_data_copy.save(os.path.join(debug_path, "pytesseract_blocks_image.png"))
+        save_debug_boxes(
+            image_data,
+            text_boxes_to_array(response),
+            debug_path,
+            "pytesseract_blocks_image",
+            outline="blue",
+        )
 
     blocks = [
         b for b in response if len(b["text"]) > 2
@@ -170,23 +167,6 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
             filtered_blocks.append(b)
     blocks = filtered_blocks
 
-    if debug:
-        # Create a draw object
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw red rectangles around all blocks
-        for block in blocks:
-            left, top, width, height = (
-                block["left"],
-                block["top"],
-                block["width"],
-                block["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="green")
-        image_data_copy.save(
-            os.path.join(debug_path, "pytesseract_filtered_blocks_image.png")
-        )
-
     if debug:
         # Create a draw object
         image_data_copy = image_data.copy()
@@ -210,184 +190,59 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
             os.path.join(debug_path, "pytesseract_filtered_blocks_image_with_text.png")
         )
 
-    # Create an empty list to store the filtered boxes
-    filtered_boxes = []
-
-    # Filter out boxes that fall inside text
-    for box in icons_bounding_boxes:
-        if not any(
-            text_box["left"] <= box["x"] <= text_box["left"] + text_box["width"]
-            and text_box["top"] <= box["y"] <= text_box["top"] + text_box["height"]
-            and text_box["left"]
-            <= box["x"] + box["width"]
-            <= text_box["left"] + text_box["width"]
-            and text_box["top"]
-            <= box["y"] + box["height"]
-            <= text_box["top"] + text_box["height"]
-            for text_box in blocks
-        ):
-            filtered_boxes.append(box)
-        else:
-            pass
-            # print("Filtered out an icon because I think it is text.")
-
-    icons_bounding_boxes = filtered_boxes
-
-    if debug:
-        # Create a copy of the image data
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw green rectangles around all filtered boxes
-        for box in filtered_boxes:
-            left, top, width, height = (
-                box["x"],
-                box["y"],
-                box["width"],
-                box["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="green")
-        # Save the image with the drawn rectangles
-        image_data_copy.save(
-            os.path.join(debug_path, "pytesseract_filtered_boxes_image.png")
-        )
-
     # Filter out boxes that intersect with text at all
-    filtered_boxes = []
-    for box in icons_bounding_boxes:
-        if not any(
-            max(text_box["left"], box["x"])
-            < min(text_box["left"] + text_box["width"], box["x"] + box["width"])
-            and max(text_box["top"], box["y"])
-            < min(text_box["top"] + text_box["height"], box["y"] + box["height"])
-            for text_box in blocks
-        ):
-            filtered_boxes.append(box)
-    icons_bounding_boxes = filtered_boxes
+    # (this also covers boxes that fall entirely inside text)
+    keep = ~overlaps_any(boxes, text_boxes_to_array(blocks), image_data.size)
+    boxes, centers = boxes[keep], centers[keep]
 
     if debug:
-        # Create a copy of the image data
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        # Draw green rectangles around all filtered boxes
-        for box in icons_bounding_boxes:
-            left, top, width, height = (
-                box["x"],
-                box["y"],
-                box["width"],
-                box["height"],
-            )
-            draw.rectangle([(left, top), (left + width, top + height)], outline="green")
-        # Save the image with the drawn rectangles
-        image_data_copy.save(
-            os.path.join(debug_path, "debug_image_after_filtering_boxes.png")
+        save_debug_boxes(
+            image_data,
+            boxes,
+            debug_path,
+            "debug_image_after_filtering_boxes",
+            outline="green",
         )
 
-    # # (DISABLED)
-    # # Filter to the most icon-like dimensions
-
-    # # Desired dimensions
-    # desired_width = 30
-    # desired_height = 30
-
-    # # Calculating the distance of each box's dimensions from the desired dimensions
-    # for box in icons_bounding_boxes:
-    #     width_diff = abs(box["width"] - desired_width)
-    #     height_diff = abs(box["height"] - desired_height)
-    #     # Sum of absolute differences as a simple measure of "closeness"
-    #     box["distance"] = width_diff + height_diff
-
-    # # Sorting the boxes based on their closeness to the desired dimensions
-    # sorted_boxes = sorted(icons_bounding_boxes, key=lambda x: x["distance"])
-
-    # # Selecting the top 150 closest boxes
-    # icons_bounding_boxes = sorted_boxes  # DISABLED [:150]
-
     # Expand a little
 
     # Define the pixel expansion amount
     pixel_expand = int(os.getenv("OI_POINT_PIXEL_EXPAND", 7))
 
-    # Expand each box by pixel_expand
-    for box in icons_bounding_boxes:
-        # Expand x, y by pixel_expand if they are greater than 0
-        box["x"] = box["x"] - pixel_expand if box["x"] - pixel_expand >= 0 else box["x"]
-        box["y"] = box["y"] - pixel_expand if box["y"] - pixel_expand >= 0 else box["y"]
-
-        # Expand w, h by pixel_expand, but not beyond image_width and image_height
-        box["width"] = (
-            box["width"] + pixel_expand * 2
-            if box["x"] + box["width"] + pixel_expand * 2 <= image_width
-            else image_width - box["x"] - box["width"]
-        )
-        box["height"] = (
-            box["height"] + pixel_expand * 2
-            if box["y"] + box["height"] + pixel_expand * 2 <= image_height
-            else image_height - box["y"] - box["height"]
-        )
+    boxes = expand_boxes(boxes, pixel_expand, image_data.size)
 
     # Save a debug image with a descriptive name for the step we just went through
     if debug:
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        for box in icons_bounding_boxes:
-            left = box["x"]
-            top = box["y"]
-            width = box["width"]
-            height = box["height"]
-            draw.rectangle([(left, top), (left + width, top + height)], outline="red")
-        image_data_copy.save(
-            os.path.join(debug_path, "debug_image_after_expanding_boxes.png")
+        save_debug_boxes(
+            image_data, boxes, debug_path, "debug_image_after_expanding_boxes"
         )
 
-    def combine_boxes(icons_bounding_boxes):
-        while True:
-            combined_boxes = []
-            for box in icons_bounding_boxes:
-                for i, combined_box in enumerate(combined_boxes):
-                    if (
-                        box["x"] < combined_box["x"] + combined_box["width"]
-                        and box["x"] + box["width"] > combined_box["x"]
-                        and box["y"] < combined_box["y"] + combined_box["height"]
-                        and box["y"] + box["height"] > combined_box["y"]
-                    ):
-                        combined_box["x"] = min(box["x"], combined_box["x"])
-                        combined_box["y"] = min(box["y"], combined_box["y"])
-                        combined_box["width"] = (
-                            max(
-                                box["x"] + box["width"],
-                                combined_box["x"] + combined_box["width"],
-                            )
-                            - combined_box["x"]
-                        )
-                        combined_box["height"] = (
-                            max(
-                                box["y"] + box["height"],
-                                combined_box["y"] + combined_box["height"],
-                            )
-                            - combined_box["y"]
-                        )
-                        break
-                else:
-                    combined_boxes.append(box.copy())
-            if len(combined_boxes) == len(icons_bounding_boxes):
-                break
-            else:
-                icons_bounding_boxes = combined_boxes
-        return combined_boxes
-
     if os.getenv("OI_POINT_OVERLAP", "True") == "True":
-        icons_bounding_boxes = combine_boxes(icons_bounding_boxes)
+        boxes, first_member = combine_boxes(boxes)
+        # A combined box points at the center of the first box that went into it
+        centers = centers[first_member]
 
     if debug:
-        image_data_copy = image_data.copy()
-        draw = ImageDraw.Draw(image_data_copy)
-        for box in icons_bounding_boxes:
-            x, y, w, h = box["x"], box["y"], box["width"], box["height"]
-            draw.rectangle([(x, y), (x + w, y + h)], outline="blue")
-        image_data_copy.save(
-            os.path.join(debug_path, "debug_image_after_combining_boxes.png")
+        save_debug_boxes(
+            image_data,
+            boxes,
+            debug_path,
+            "debug_image_after_combining_boxes",
+            outline="blue",
         )
 
+    icons_bounding_boxes = [
+        {
+            "x": int(x),
+            "y": int(y),
+            "width": int(w),
+            "height": int(h),
+            "center_x": float(center_x),
+            "center_y": float(center_y),
+        }
+        for (x, y, w, h), (center_x, center_y) in zip(boxes, centers)
+    ]
+
     icons = []
     for box in icons_bounding_boxes:
         x, y, w, h = box["x"], box["y"], box["width"], box["height"]
@@ -424,29 +279,29 @@ def find_icon(description, screenshot=None, debug=False, hashes=None):
         desktop = os.path.join(os.path.join(os.path.expanduser("~")), "Desktop")
         image_data_copy.save(os.path.join(desktop, "point_vision.png"))
 
-    if "icon" not in description.lower():
-        description += " icon"
+    queries = [
+        description if "icon" in description.lower() else description + " icon"
+        for description in descriptions
+    ]
 
     if debug:
         print("FINALLY, SEARCHING")
 
-    top_icons = image_search(description, icons, hashes, debug)
+    top_icons = image_search_batch(queries, icons, hashes, debug)
 
     if debug:
         print("DONE")
 
-    coordinates = [t["coordinate"] for t in top_icons]
-
-    # Return the top pick icon data
-    return coordinates
+    # Return the top pick icon data, one list of coordinates per description
+    return [[t["coordinate"] for t in matches] for matches in top_icons]
 
 
 # torch.set_num_threads(4)
 
 fast_model = True
 
-# First, we load the respective CLIP model
-model = SentenceTransformer("clip-ViT-B-32")
+# The CLIP model is loaded on first use (see get_model), so a fully cached search never loads it
+model = None
 
 
 import os
@@ -497,58 +352,97 @@ elif torch.backends.mps.is_available():
 else:
     device = torch.device("cpu")
 
-# Move the model to the specified device
-model = model.to(device)
 
+def get_model():
+    global model
+    if model is None:
+        # Load the CLIP model and move it to the specified device
+        model = SentenceTransformer("clip-ViT-B-32").to(device)
+    return model
 
-def image_search(query, icons, hashes, debug):
-    hashed_icons = [icon for icon in icons if icon["hash"] in hashes]
-    unhashed_icons = [icon for icon in icons if icon["hash"] not in hashes]
 
-    # Embed the unhashed icons
+def embed(items, debug):
+    """
+    Embeds a list of strings and/or PIL images. Returns a numpy array, one row per item.
+    """
     if fast_model:
-        query_and_unhashed_icons_embeds = model.encode(
-            [query] + [icon["data"] for icon in unhashed_icons],
+        return get_model().encode(
+            items,
             batch_size=128,
-            convert_to_tensor=True,
+            convert_to_numpy=True,
             show_progress_bar=debug,
         )
     else:
-        query_and_unhashed_icons_embeds = embed_images(
-            [query] + [icon["data"] for icon in unhashed_icons], model, transforms
-        )
+        return embed_images(items, model, transforms).detach().cpu().numpy()
 
-    query_embed = query_and_unhashed_icons_embeds[0]
-    unhashed_icons_embeds = query_and_unhashed_icons_embeds[1:]
 
-    # Store hashes for unhashed icons
-    for icon, emb in zip(unhashed_icons, unhashed_icons_embeds):
-        hashes[icon["hash"]] = emb
+def image_search(query, icons, hashes, debug):
+    return image_search_batch([query], icons, hashes, debug)[0]
 
-    # Move tensors to the specified device before concatenating
-    unhashed_icons_embeds = unhashed_icons_embeds.to(device)
 
-    # Include hashed icons in img_emb
-    img_emb = torch.cat(
-        [unhashed_icons_embeds]
-        + [hashes[icon["hash"]].unsqueeze(0) for icon in hashed_icons]
+def image_search_batch(queries, icons, hashes, debug, top_k=10):
+    """
+    Matches each query against `icons`. Returns one list of icons per query, best first.
+    """
+    if not icons:
+        return [[] for _ in queries]
+
+    # `hashes` maps a hash to its embedding. It's usually the persistent EmbeddingCache,
+    # so icons (and queries) we've seen before, even in past sessions, skip CLIP entirely.
+    query_hashes = [
+        hashlib.sha256(("query:" + query).encode()).hexdigest() for query in queries
+    ]
+    keys = list(dict.fromkeys(query_hashes + [icon["hash"] for icon in icons]))
+
+    if hasattr(hashes, "get_many"):
+        embeddings = hashes.get_many(keys)
+    else:
+        # One lookup per key, so nothing can be evicted between checking and reading
+        embeddings = {}
+        for key in keys:
+            embedding = hashes.get(key)
+            if embedding is not None:
+                embeddings[key] = embedding
+
+    # Embed whatever wasn't cached
+    missing = [key for key in keys if key not in embeddings]
+    if missing:
+        data = {icon["hash"]: icon["data"] for icon in icons}
+        data.update(zip(query_hashes, queries))
+        new_embeddings = dict(
+            zip(missing, embed([data[key] for key in missing], debug))
+        )
+        embeddings.update(new_embeddings)
+    else:
+        new_embeddings = {}
+
+    # Store new embeddings. (We call this even if there are none, so the cache can record its hits.)
+    hashes.update(new_embeddings)
+
+    index = IconIndex(np.stack([embeddings[icon["hash"]] for icon in icons]))
+    all_hits = index.search(
+        np.stack([embeddings[query_hash] for query_hash in query_hashes]), top_k
     )
 
-    # Perform semantic search
-    hits = util.semantic_search(query_embed, img_emb)[0]
+    results = []
+    for hits in all_hits:
+        # Filter hits with score over 90
+        top = [row for row, score in hits if score > 90]
 
-    # Filter hits with score over 90
-    results = [hit for hit in hits if hit["score"] > 90]
+        # Ensure top result is included
+        if hits and hits[0][0] not in top:
+            top.insert(0, hits[0][0])
 
-    # Ensure top result is included
-    if hits and (hits[0] not in results):
-        results.insert(0, hits[0])
+        # Convert results to original icon format
+        results.append([icons[row] for row in top])
 
-    # Convert results to original icon format
-    return [icons[hit["corpus_id"]] for hit in results]
+    return results
 
 
 def get_element_boxes(image_data, debug):
+    """
+    Returns an (N, 4) array of [x, y, width, height] boxes around the elements on the screen.
+    """
     desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
     debug_path = os.path.join(desktop_path, "oi-debug")
 
@@ -556,182 +450,36 @@ def get_element_boxes(image_data, debug):
         if not os.path.exists(debug_path):
             os.makedirs(debug_path)
 
-    # Re-import the original image for contrast adjustment
-    # original_image = cv2.imread(image_path)
-
-    # Convert the image to a format that PIL can work with
-    # pil_image = Image.fromarray(cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB))
-
-    pil_image = image_data
-
     # Convert to grayscale
-    pil_image = pil_image.convert("L")
-
-    def process_image(
-        pil_image,
-        contrast_level=1.8,
-        debug=False,
-        debug_path=None,
-        adaptive_method=cv2.ADAPTIVE_THRESH_MEAN_C,
-        threshold_type=cv2.THRESH_BINARY_INV,
-        block_size=11,
-        C=3,
-    ):
-        # Apply an extreme contrast filter
-        enhancer = ImageEnhance.Contrast(pil_image)
-        contrasted_image = enhancer.enhance(
-            contrast_level
-        )  # Significantly increase contrast
-
-        # Create a string with all parameters
-        parameters_string = f"contrast_level_{contrast_level}-adaptive_method_{adaptive_method}-threshold_type_{threshold_type}-block_size_{block_size}-C_{C}"
-
-        if debug:
-            print("TRYING:", parameters_string)
-            contrasted_image_path = os.path.join(
-                debug_path, f"contrasted_image_{parameters_string}.jpg"
-            )
-            contrasted_image.save(contrasted_image_path)
-            print(f"DEBUG: Contrasted image saved to {contrasted_image_path}")
-
-        # Convert the contrast-enhanced image to OpenCV format
-        contrasted_image_cv = cv2.cvtColor(
-            np.array(contrasted_image), cv2.COLOR_RGB2BGR
-        )
-
-        # Convert the contrast-enhanced image to grayscale
-        gray_contrasted = cv2.cvtColor(contrasted_image_cv, cv2.COLOR_BGR2GRAY)
-        if debug:
-            image_path = os.path.join(
-                debug_path, f"gray_contrasted_image_{parameters_string}.jpg"
-            )
-            cv2.imwrite(image_path, gray_contrasted)
-            print("DEBUG: Grayscale contrasted image saved at:", image_path)
-
-        # Apply adaptive thresholding to create a binary image where the GUI elements are isolated
-        binary_contrasted = cv2.adaptiveThreshold(
-            src=gray_contrasted,
-            maxValue=255,
-            adaptiveMethod=adaptive_method,
-            thresholdType=threshold_type,
-            blockSize=block_size,
-            C=C,
-        )
-
-        if debug:
-            binary_contrasted_image_path = os.path.join(
-                debug_path, f"binary_contrasted_image_{parameters_string}.jpg"
-            )
-            cv2.imwrite(binary_contrasted_image_path, binary_contrasted)
-            print(
-                f"DEBUG: Binary contrasted image saved to {binary_contrasted_image_path}"
-            )
-
-        # Find contours from the binary image
-        contours_contrasted, _ = cv2.findContours(
-            binary_contrasted, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE
-        )
-
-        # Optionally, draw contours on the image for visualization
-        contour_image = np.zeros_like(binary_contrasted)
-        cv2.drawContours(contour_image, contours_contrasted, -1, (255, 255, 255), 1)
-
-        if debug:
-            contoured_contrasted_image_path = os.path.join(
-                debug_path, f"contoured_contrasted_image_{parameters_string}.jpg"
-            )
-            cv2.imwrite(contoured_contrasted_image_path, contour_image)
-            print(
-                f"DEBUG: Contoured contrasted image saved at: {contoured_contrasted_image_path}"
-            )
-
-        return contours_contrasted
+    gray = np.array(image_data.convert("L"))
 
     if os.getenv("OI_POINT_PERMUTATE", "False") == "True":
-        import random
-
-        for _ in range(10):
-            random_contrast = random.uniform(
-                1, 40
-            )  # Random contrast in range 0.5 to 1.5
-            random_block_size = random.choice(
-                range(1, 11, 2)
-            )  # Random block size in range 1 to 10, but only odd numbers
-            random_block_size = 11
-            random_adaptive_method = random.choice(
-                [cv2.ADAPTIVE_THRESH_MEAN_C, cv2.ADAPTIVE_THRESH_GAUSSIAN_C]
-            )  # Random adaptive method
-            random_threshold_type = random.choice(
-                [cv2.THRESH_BINARY, cv2.THRESH_BINARY_INV]
-            )  # Random threshold type
-            random_C = random.randint(-10, 10)  # Random C in range 1 to 10
-            contours_contrasted = process_image(
-                pil_image,
-                contrast_level=random_contrast,
-                block_size=random_block_size,
-                adaptive_method=random_adaptive_method,
-                threshold_type=random_threshold_type,
-                C=random_C,
-                debug=debug,
-                debug_path=debug_path,
-            )
-
-        print("Random Contrast: ", random_contrast)
-        print("Random Block Size: ", random_block_size)
-        print("Random Adaptive Method: ", random_adaptive_method)
-        print("Random Threshold Type: ", random_threshold_type)
-        print("Random C: ", random_C)
+        parameters = random_parameters()
+        print("Random parameters:", parameters)
     else:
-        contours_contrasted = process_image(
-            pil_image, debug=debug, debug_path=debug_path
-        )
+        parameters = None
 
     if debug:
-        print("WE HERE")
+        binary = binarize(gray, parameters)
+        binary_path = os.path.join(debug_path, "binary_contrasted_image.jpg")
+        cv2.imwrite(binary_path, binary)
+        print(f"DEBUG: Binary contrasted image saved to {binary_path}")
 
-    # Initialize an empty list to store the boxes
-    boxes = []
-    for contour in contours_contrasted:
-        # Get the rectangle that bounds the contour
-        x, y, w, h = cv2.boundingRect(contour)
-        # Append the box as a dictionary to the list
-        boxes.append({"x": x, "y": y, "width": w, "height": h})
+    return element_boxes(gray, parameters)
 
-    if debug:
-        print("WE HHERE")
-
-    if (
-        False
-    ):  # Disabled. I thought this would be faster but it's actually slower than just embedding all of them.
-        # Remove any boxes whose edges cross over any contours
-        filtered_boxes = []
-        for box in boxes:
-            crosses_contour = False
-            for contour in contours_contrasted:
-                if (
-                    cv2.pointPolygonTest(contour, (box["x"], box["y"]), False) >= 0
-                    or cv2.pointPolygonTest(
-                        contour, (box["x"] + box["width"], box["y"]), False
-                    )
-                    >= 0
-                    or cv2.pointPolygonTest(
-                        contour, (box["x"], box["y"] + box["height"]), False
-                    )
-                    >= 0
-                    or cv2.pointPolygonTest(
-                        contour,
-                        (box["x"] + box["width"], box["y"] + box["height"]),
-                        False,
-                    )
-                    >= 0
-                ):
-                    crosses_contour = True
-                    break
-            if not crosses_contour:
-                filtered_boxes.append(box)
-        boxes = filtered_boxes
 
-    if debug:
-        print("WE HHHERE")
+def text_boxes_to_array(text_boxes):
+    return np.array(
+        [[b["left"], b["top"], b["width"], b["height"]] for b in text_boxes],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+
 
-    return boxes
+def save_debug_boxes(image_data, boxes, debug_path, name, outline="red"):
+    image_data_copy = image_data.copy()
+    draw = ImageDraw.Draw(image_data_copy)
+    for x, y, w, h in boxes:
+        draw.rectangle([(x, y), (x + w, y + h)], outline=outline)
+    if not os.path.exists(debug_path):
+        os.makedirs(debug_path)
+    image_data_copy.save(os.path.join(debug_path, name + ".png"))
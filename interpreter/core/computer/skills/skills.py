@@ -1,4 +1,4 @@
-import glob
+import ast
 import inspect
 import json
 import os
@@ -26,6 +26,14 @@ class Skills:
         self.path = str(Path(oi_dir) / "skills")
         self.new_skill = NewSkill(self)
 
+        # Skill file -> (mtime, size) when it was last run in the Python kernel
+        self._imported = {}
+        # The Python kernel they were run in (if it's replaced, they're all gone)
+        self._kernel = None
+        self._importing = False
+        # Skill file -> ((mtime, size), [(function name, docstring), ...])
+        self._index = {}
+
     def list(self):
         return [
             file.replace(".py", "()")
@@ -40,59 +48,140 @@ class Skills:
 
     def search(self, query):
         """
-        This just lists all for now.
+        Finds skills by the words in their names and docstrings. Returns
+        "name(): first line of its docstring", best matches first.
         """
-        return [
-            file.replace(".py", "()")
-            for file in os.listdir(self.path)
-            if file.endswith(".py")
-        ]
+        # (Short words like "a" and "in" would match nearly everything)
+        words = {word for word in re.findall(r"\w+", query.lower()) if len(word) > 2}
+        results = []
+        for file, (signature, functions) in sorted(self._update_index().items()):
+            for name, docstring in functions:
+                text = (name.replace("_", " ") + " " + docstring).lower()
+                score = sum(word in text for word in words)
+                if score or not words:
+                    summary = docstring.strip().split("\n")[0]
+                    results.append(
+                        (-score, f"{name}(): {summary}" if summary else f"{name}()")
+                    )
+        results.sort(key=lambda result: result[0])
+        return [result for score, result in results]
+
+    def _update_index(self):
+        # Only the skill files that are new or changed are parsed again
+        files = self._skill_files()
+        for file in list(self._index):
+            if file not in files:
+                del self._index[file]
+        for file, signature in files.items():
+            if file in self._index and self._index[file][0] == signature:
+                continue
+            try:
+                with open(file, "r") as f:
+                    tree = ast.parse(f.read())
+                functions = [
+                    (node.name, ast.get_docstring(node) or "")
+                    for node in tree.body
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+                    and not node.name.startswith("_")
+                ]
+            except (OSError, SyntaxError, ValueError):
+                functions = []
+            self._index[file] = (signature, functions)
+        return self._index
+
+    def _skill_files(self):
+        # Skill file -> (mtime, size), which is how we tell it's changed
+        try:
+            entries = list(os.scandir(self.path))
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for entry in entries:
+            if entry.name.endswith(".py") and entry.is_file():
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return files
 
     def import_skills(self):
-        previous_save_skills_setting = self.computer.save_skills
-
-        self.computer.save_skills = False
+        """
+        Runs the skills that are new or have changed since they were last run (all of
+        them, the first time or if Python was restarted) in the Python kernel.
+        """
+        if self._importing:
+            return  # (We're the ones running Python)
+
+        files = self._skill_files()
+        kernel = self.computer.terminal._active_languages.get("python")
+        if kernel is None or kernel is not self._kernel:
+            self._imported = {}
+        changed = sorted(
+            file
+            for file, signature in files.items()
+            if self._imported.get(file) != signature
+        )
+        if not changed:
+            return
 
         # Make sure it's not over 100mb
-        total_size = 0
-        for path, dirs, files in os.walk(self.path):
-            for f in files:
-                fp = os.path.join(path, f)
-                total_size += os.path.getsize(fp)
+        total_size = sum(size for mtime, size in files.values())
         total_size = total_size / (1024 * 1024)  # convert bytes to megabytes
         if total_size > 100:
             raise Warning(
                 f"Skills at path {self.path} can't exceed 100mb. Try deleting some."
             )
 
-        code_to_run = ""
-        for file in glob.glob(os.path.join(self.path, "*.py")):
-            with open(file, "r") as f:
-                code_to_run += f.read() + "\n"
-
         if self.computer.interpreter.debug:
-            print("IMPORTING SKILLS:\n", code_to_run)
+            print("IMPORTING SKILLS:\n", "\n".join(changed))
 
-        output = self.computer.run("python", code_to_run)
+        previous_save_skills_setting = self.computer.save_skills
+        self.computer.save_skills = False
+        self._importing = True
+        try:
+            output = self.computer.run("python", skills_import_code(changed))
+        finally:
+            self._importing = False
+            self.computer.save_skills = previous_save_skills_setting
+
+        # The kernel prints the ones that failed (with their tracebacks). They aren't
+        # run again until they change
+        printed = "".join(
+            chunk.get("content", "")
+            for chunk in output
+            if chunk.get("format") == "output"
+        )
+        for line in printed.split("\n"):
+            if line.startswith(SKILL_FAILED_MARKER):
+                file = line[len(SKILL_FAILED_MARKER) :].strip()
+                print(
+                    f"Skill at {file} might be broken— it produces a traceback when run."
+                )
 
-        if "traceback" in str(output).lower():
-            # Import them individually
-            for file in glob.glob(os.path.join(self.path, "*.py")):
-                with open(file, "r") as f:
-                    code_to_run = f.read() + "\n"
+        self._kernel = self.computer.terminal._active_languages.get("python")
+        for file in changed:
+            self._imported[file] = files[file]
 
-                if self.computer.interpreter.debug:
-                    print(self.path)
-                    print("IMPORTING SKILL:\n", code_to_run)
 
-                output = self.computer.run("python", code_to_run)
+SKILL_FAILED_MARKER = "##skill_failed##"
 
-                if "traceback" in str(output).lower():
-                    print(
-                        f"Skill at {file} might be broken— it produces a traceback when run."
-                    )
 
-        self.computer.save_skills = previous_save_skills_setting
+def skills_import_code(files):
+    """
+    Code that runs each skill file in the kernel, from its bytecode: the kernel's own
+    import machinery compiles it once into __pycache__ (like any module), and after
+    that only reads it back, until the file changes. A skill that fails is reported
+    with SKILL_FAILED_MARKER and doesn't stop the others.
+    """
+    return f"""
+from importlib.machinery import SourceFileLoader as _oi_Loader
+import traceback as _oi_traceback
+for _oi_file in {files!r}:
+    try:
+        exec(_oi_Loader("_oi_skill", _oi_file).get_code("_oi_skill"))
+    except Exception:
+        _oi_traceback.print_exc()
+        print({SKILL_FAILED_MARKER!r}, _oi_file)
+del _oi_Loader, _oi_traceback, _oi_file
+""".strip()
 
 
 class NewSkill:
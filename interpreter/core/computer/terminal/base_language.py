@@ -6,11 +6,13 @@ class BaseLanguage:
     name = "baselanguage" # Name as it is seen by the LLM
     file_extension = "sh" # (OPTIONAL) File extension, used for safe_mode code scanning
     aliases = ["bash", "sh", "zsh"] # (OPTIONAL) Aliases that will also point to this language if the LLM runs them
+    pid # (OPTIONAL) The process running the code, so the terminal can enforce its limits (timeout, cpu_limit, memory_limit) and measure what each block used
 
     Methods
 
     run (Generator that yields a dictionary in LMC format)
     stop (Halts code execution, but does not terminate state)
+    abort (OPTIONAL) (Stops the whole code block, even if that means losing state. Used when a block goes over a limit)
     terminate (Terminates state)
     """
 
@@ -29,6 +31,13 @@ class BaseLanguage:
         """
         pass
 
+    def abort(self):
+        """
+        Stops the whole code block, so none of it runs after this. Languages that can't
+        do that with `stop` alone restart instead, which loses state.
+        """
+        self.stop()
+
     def terminate(self):
         """
         Terminates state.
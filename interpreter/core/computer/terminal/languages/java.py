@@ -1,6 +1,7 @@
 import os
 import queue
 import re
+import shutil
 import subprocess
 import threading
 import time
@@ -13,12 +14,31 @@ class Java(SubprocessLanguage):
 
     def __init__(self):
         super().__init__()
-        self.start_cmd = None  # We will handle the start command in the run method
+        # A JShell session that stays up between code blocks, so the JVM starts once (and
+        # classes and variables stick around). Without JShell (before Java 9), each block
+        # is compiled and run on its own, in run_compiled
+        if shutil.which("jshell"):
+            self.start_cmd = ["jshell", "--feedback", "silent"]
+        else:
+            self.start_cmd = None  # We will handle the start command in the run method
+
+    def start_process(self):
+        super().start_process()
+        # Like the "silent" feedback mode (errors and exceptions only), without the prompts
+        self.process.stdin.write(
+            '/set mode oi silent -quiet\n/set prompt oi "" ""\n/set feedback oi\n'
+        )
+        self.process.stdin.flush()
 
     def preprocess_code(self, code):
+        if self.start_cmd:
+            return preprocess_jshell(code)
         return preprocess_java(code)
 
     def line_postprocessor(self, line):
+        if self.start_cmd:
+            # (In case the prompts come back, e.g. after JShell restarts its JVM)
+            return re.sub(r"^(?:-> |>> )+", "", line)
         # Clean up output from javac and java
         return line.strip()
 
@@ -31,6 +51,12 @@ class Java(SubprocessLanguage):
         return "##end_of_execution##" in line
 
     def run(self, code):
+        if self.start_cmd:
+            yield from super().run(code)
+        else:
+            yield from self.run_compiled(code)
+
+    def run_compiled(self, code):
         try:
             # Extract the class name from the code
             match = re.search(r'class\s+(\w+)', code)
@@ -125,6 +151,85 @@ class Java(SubprocessLanguage):
             if os.path.exists(class_file):
                 os.remove(class_file)
 
+def preprocess_jshell(code):
+    """
+    Turns a code block into JShell input: an active line marker before each top-level
+    statement (JShell runs each one as it gets it, so a marker can't go inside a class or
+    a statement that isn't finished), a call to main() if the code defines one but doesn't
+    call it, and the end of execution marker.
+    """
+    processed_lines = []
+    depth = 0
+    in_comment = False
+    statement_done = True
+    top_level_class = main_class = None
+    for i, line in enumerate(code.split("\n"), 1):
+        # Top-level "package" and "public" aren't allowed in JShell (and only mean warnings)
+        if depth == 0 and re.match(r"\s*package\s+[\w.]+\s*;\s*$", line):
+            continue
+        if depth == 0:
+            line = re.sub(
+                r"^(\s*)public\s+(?=(?:(?:final|abstract|static)\s+)*(?:class|interface|enum|record)\b)",
+                r"\1",
+                line,
+            )
+
+        # What's left of the line without strings and comments, to count braces
+        bare, in_comment = _strip_java_line(line, in_comment)
+        if (
+            depth == 0
+            and statement_done
+            and bare.strip()
+            and not re.match(r"\s*(else|catch|finally)\b", bare)
+        ):
+            processed_lines.append(f'System.out.println("##active_line{i}##");')
+        processed_lines.append(line)
+
+        if depth == 0:
+            match = re.search(r"\b(?:class|enum|record)\s+(\w+)", bare)
+            if match:
+                top_level_class = match.group(1)
+        if re.search(r"\bstatic\s+void\s+main\s*\(", bare):
+            main_class = top_level_class
+        depth = max(depth + bare.count("{") - bare.count("}"), 0)
+        if bare.strip():
+            statement_done = depth == 0 and bare.rstrip().endswith((";", "}"))
+
+    if main_class and not re.search(rf"\b{main_class}\s*\.\s*main\s*\(", code):
+        processed_lines.append(f"{main_class}.main(new String[0]);")
+
+    processed_lines.append('System.out.println("##end_of_execution##");')
+    return "\n".join(processed_lines)
+
+
+def _strip_java_line(line, in_comment):
+    """
+    Returns `line` without string and char literals and comments, and whether a /* comment
+    is still open at the end of it.
+    """
+    bare = ""
+    i = 0
+    while i < len(line):
+        if in_comment:
+            end = line.find("*/", i)
+            if end == -1:
+                return bare, True
+            in_comment = False
+            i = end + 2
+        elif line.startswith("//", i):
+            break
+        elif line.startswith("/*", i):
+            in_comment = True
+            i += 2
+        elif line[i] in "\"'":
+            match = re.match(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')", line[i:])
+            i += len(match.group(0)) if match else 1
+        else:
+            bare += line[i]
+            i += 1
+    return bare, in_comment
+
+
 def preprocess_java(code):
     """
     Add active line markers
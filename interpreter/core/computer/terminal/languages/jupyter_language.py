@@ -4,6 +4,8 @@ Gotta split this out, generalize it, and move all the python additions to python
 """
 
 import ast
+import functools
+import json
 import logging
 import os
 import queue
@@ -18,9 +20,78 @@ import litellm
 from jupyter_client import KernelManager
 
 from ..base_language import BaseLanguage
+from ..limits import looks_like_input_prompt
+from . import jupyter_rich_output, jupyter_snapshot
+from .jupyter_rich_output import DATA_MIMETYPE
 
 DEBUG_MODE = False
 
+# How much of the conversation goes to the LLM when we ask it whether code wants input
+INPUT_CONTEXT_LENGTH = 4000
+
+# With INTERPRETER_ACTIVE_LINE_DETECTION=sampled, we don't print a marker before every
+# statement (a loop that runs a million times prints a million markers). A thread in the
+# kernel looks at what line the cell is on a few times a second, and sends it to us as
+# display data of this type, next to (not in) the output.
+ACTIVE_LINE_MIMETYPE = "application/x-open-interpreter-active-line"
+ACTIVE_LINE_SAMPLE_INTERVAL = 0.1
+
+LINE_SAMPLER_CODE = f"""
+def _oi_line_sampler():
+    import sys, threading, time
+    from IPython import get_ipython
+    from IPython.display import publish_display_data
+    shell = get_ipython()
+    main = threading.main_thread().ident
+    last = None
+    while True:
+        time.sleep({ACTIVE_LINE_SAMPLE_INTERVAL})
+        frame = sys._current_frames().get(main)
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        # The cell is the outermost module-level frame running in the user's namespace.
+        # Below it, we want the innermost frame that's still code from the cell.
+        cell_file = line = None
+        for frame in reversed(stack):
+            if cell_file is None:
+                if frame.f_code.co_name == "<module>" and frame.f_globals is shell.user_ns:
+                    cell_file, line = frame.f_code.co_filename, frame.f_lineno
+            elif frame.f_code.co_filename == cell_file:
+                line = frame.f_lineno
+        if line is not None and line != last:
+            publish_display_data({{"{ACTIVE_LINE_MIMETYPE}": line}})
+        last = line
+
+import threading as _oi_threading
+_oi_threading.Thread(target=_oi_line_sampler, daemon=True).start()
+del _oi_threading
+""".strip()
+
+# Names in the kernel that snapshots leave out (the computer API, if it was imported)
+SNAPSHOT_EXCLUDE = ["computer", "interpreter"]
+
+
+def kernel_module_code(module, name):
+    """
+    Code that loads one of our modules into the kernel as `name`, from its file (so the
+    kernel doesn't import the rest of the package).
+    """
+    return f"""
+import importlib.util as _oi_importlib_util
+_oi_spec = _oi_importlib_util.spec_from_file_location({name!r}, {module.__file__!r})
+{name} = _oi_importlib_util.module_from_spec(_oi_spec)
+_oi_spec.loader.exec_module({name})
+del _oi_importlib_util, _oi_spec
+""".strip()
+
+
+RICH_OUTPUT_CODE = (
+    kernel_module_code(jupyter_rich_output, "_oi_rich_output")
+    + "\n_oi_rich_output.install(get_ipython())"
+)
+
 # When running from an executable, ipykernel calls itself infinitely
 # This is a workaround to detect it and launch it manually
 if "ipykernel_launcher" in sys.argv:
@@ -51,6 +122,11 @@ class JupyterLanguage(BaseLanguage):
 
         self.listener_thread = None
         self.finish_flag = False
+        # Code blocks run so far, and how many had run at the last snapshot/restore
+        self.run_count = 0
+        self.snapshot_run_count = None
+        self.input_thread = None
+        self.line_sampler_started = False
 
         # DISABLED because sometimes this bypasses sending it up to us for some reason!
         # Give it our same matplotlib backend
@@ -74,6 +150,12 @@ import matplotlib.pyplot as plt
         for _ in self.run(code):
             pass
 
+        # Big DataFrames and arrays come out as a summary, plus the data in a file
+        for _ in self.run(RICH_OUTPUT_CODE):
+            pass
+
+        self.snapshot_run_count = self.run_count
+
         # DISABLED because it doesn't work??
         # Disable color outputs in the terminal, which don't look good in OI and aren't useful
         # code = """
@@ -82,6 +164,12 @@ import matplotlib.pyplot as plt
         # """
         # self.run(code)
 
+    @property
+    def pid(self):
+        # The kernel's process, for the terminal's resource limits
+        provisioner = getattr(self.km, "provisioner", None)
+        return getattr(provisioner, "pid", None)
+
     def terminate(self):
         self.kc.stop_channels()
         self.km.shutdown_kernel()
@@ -92,6 +180,13 @@ import matplotlib.pyplot as plt
 
         self.last_output_time = time.time()
         self.last_output_message_time = time.time()
+        self.last_output = ""
+        self.run_count += 1
+
+        if active_line_detection() == "sampled" and not self.line_sampler_started:
+            self.line_sampler_started = True
+            for _ in self.run(LINE_SAMPLER_CODE):
+                pass
 
         ################################################################
         ### OFFICIAL OPEN INTERPRETER GOVERNMENT ISSUE SKILL LIBRARY ###
@@ -149,52 +244,27 @@ import matplotlib.pyplot as plt
                     self.finish_flag = True
                     return
                 try:
+                    # input() in the code. The kernel asks us for the line on its stdin channel
+                    if self.kc.stdin_channel.msg_ready():
+                        request = self.kc.stdin_channel.get_msg(timeout=0)
+                        if request["msg_type"] == "input_request":
+                            self._handle_input_request(
+                                request["content"], message_queue
+                            )
+                        continue
+
+                    # Something else (a command run with "!", a subprocess) might be waiting
+                    # on a prompt. Only ask the LLM if what it printed last looks like one
                     input_patience = int(
                         os.environ.get("INTERPRETER_TERMINAL_INPUT_PATIENCE", 15)
                     )
                     if (
                         time.time() - self.last_output_time > input_patience
                         and time.time() - self.last_output_message_time > input_patience
+                        and looks_like_input_prompt(self.last_output)
                     ):
                         self.last_output_message_time = time.time()
-
-                        text = f"{self.computer.interpreter.messages}\n\nThe program above has been running for over 15 seconds. It might require user input. Are there keystrokes that the user should type in, to proceed after the last command?"
-                        if time.time() - self.last_output_time > 500:
-                            text += f" If you think the process is frozen, or that the user wasn't expect it to run for this long (it has been {time.time() - self.last_output_time} seconds since last output) then say <input>CTRL-C</input>."
-
-                        messages = [
-                            {
-                                "role": "system",
-                                "type": "message",
-                                "content": "You are an expert programming assistant. You will help the user determine if they should enter input into the terminal, per the user's requests. If you think the user would want you to type something into stdin, enclose it in <input></input> XML tags, like <input>y</input> to type 'y'.",
-                            },
-                            {"role": "user", "type": "message", "content": text},
-                        ]
-                        params = {
-                            "messages": messages,
-                            "model": self.computer.interpreter.llm.model,
-                            "stream": True,
-                            "temperature": 0,
-                        }
-                        if self.computer.interpreter.llm.api_key:
-                            params["api_key"] = self.computer.interpreter.llm.api_key
-
-                        response = ""
-                        for chunk in litellm.completion(**params):
-                            content = chunk.choices[0].delta.content
-                            if type(content) == str:
-                                response += content
-
-                        # Parse the response for input tags
-                        input_match = re.search(r"<input>(.*?)</input>", response)
-                        if input_match:
-                            user_input = input_match.group(1)
-                            # Check if the user input is CTRL-C
-                            self.finish_flag = True
-                            if user_input.upper() == "CTRL-C":
-                                self.finish_flag = True
-                            else:
-                                self.kc.input(user_input)
+                        self._ask_llm_for_input(self.last_output)
 
                     msg = self.kc.iopub_channel.get_msg(timeout=0.05)
                     self.last_output_time = time.time()
@@ -225,6 +295,7 @@ import matplotlib.pyplot as plt
                 content = msg["content"]
 
                 if msg["msg_type"] == "stream":
+                    self.last_output = content["text"]
                     line, active_line = self.detect_active_line(content["text"])
                     if active_line:
                         message_queue.put(
@@ -251,7 +322,36 @@ import matplotlib.pyplot as plt
                     )
                 elif msg["msg_type"] in ["display_data", "execute_result"]:
                     data = content["data"]
-                    if "image/png" in data:
+                    if ACTIVE_LINE_MIMETYPE in data:
+                        message_queue.put(
+                            {
+                                "type": "console",
+                                "format": "active_line",
+                                "content": data[ACTIVE_LINE_MIMETYPE],
+                            }
+                        )
+                    elif DATA_MIMETYPE in data:
+                        described = data[DATA_MIMETYPE]
+                        message_queue.put(
+                            {
+                                "type": "console",
+                                "format": "output",
+                                "content": described["summary"],
+                            }
+                        )
+                        if described["path"]:
+                            # The data itself, for the UI to load if it's wanted (see load_data)
+                            message_queue.put(
+                                {
+                                    "type": "data",
+                                    "format": described["format"],
+                                    "content": described["path"],
+                                    "kind": described["kind"],
+                                    "shape": described["shape"],
+                                    "recipient": "user",
+                                }
+                            )
+                    elif "image/png" in data:
                         message_queue.put(
                             {
                                 "type": "image",
@@ -301,7 +401,51 @@ import matplotlib.pyplot as plt
                 "thread is on:", self.listener_thread.is_alive(), self.listener_thread
             )
 
-        self.kc.execute(code)
+        self.kc.execute(code, allow_stdin=True)
+
+    def _handle_input_request(self, request, message_queue):
+        # Show the prompt (the kernel doesn't print it), like a terminal would
+        if request["prompt"]:
+            message_queue.put(
+                {"type": "console", "format": "output", "content": request["prompt"]}
+            )
+        self.last_output = request["prompt"]
+        if request.get("password"):
+            # Not something the LLM should make up
+            message_queue.put(
+                {
+                    "type": "console",
+                    "format": "output",
+                    "content": "\nThe code asked for a password, so it was stopped.\n",
+                }
+            )
+            self.finish_flag = True
+            return
+        self._ask_llm_for_input(request["prompt"], input_requested=True)
+
+    def _ask_llm_for_input(self, prompt, input_requested=False):
+        """
+        Asks the LLM what to type, in a thread of its own, so output keeps flowing while
+        it thinks. If the code asked for input (`input_requested`) and the LLM doesn't say
+        what to type, the code is interrupted, so input() raises instead of waiting forever.
+        """
+        if self.input_thread and self.input_thread.is_alive():
+            return
+
+        def ask():
+            try:
+                user_input = ask_llm_for_input(self.computer.interpreter, prompt)
+            except Exception:
+                if DEBUG_MODE:
+                    traceback.print_exc()
+                user_input = None
+            if user_input is not None and user_input.upper() != "CTRL-C":
+                self.kc.input(user_input)
+            elif input_requested or user_input is not None:
+                self.finish_flag = True
+
+        self.input_thread = threading.Thread(target=ask, daemon=True)
+        self.input_thread.start()
 
     def detect_active_line(self, line):
         if "##active_line" in line:
@@ -353,24 +497,128 @@ import matplotlib.pyplot as plt
     def stop(self):
         self.finish_flag = True
 
+    def snapshot(self, path, exclude=SNAPSHOT_EXCLUDE):
+        """
+        Saves the kernel's variables to `path` (see jupyter_snapshot.py). Returns
+        {"saved": [...], "skipped": [...]}, or None if nothing has run since the last
+        snapshot (or restore) and `path` already has it.
+        """
+        if self.run_count == self.snapshot_run_count and os.path.exists(path):
+            return None
+        result = self._call_kernel_module(
+            jupyter_snapshot,
+            f"snapshot(get_ipython(), {path!r}, {list(exclude)!r})",
+        )
+        self.snapshot_run_count = self.run_count
+        return result
+
+    def restore(self, path):
+        """
+        Loads variables saved by `snapshot` into the kernel. Returns
+        {"restored": [...], "failed": [...]}.
+        """
+        result = self._call_kernel_module(
+            jupyter_snapshot, f"restore(get_ipython(), {path!r})"
+        )
+        self.snapshot_run_count = self.run_count
+        return result
+
+    def _call_kernel_module(self, module, call):
+        # Runs `module.call` in the kernel, and returns what it returned (as JSON)
+        code = kernel_module_code(module, "_oi_module")
+        code += f'\nprint(__import__("json").dumps(_oi_module.{call}))\ndel _oi_module'
+        output = "".join(
+            chunk["content"]
+            for chunk in self.run(code)
+            if chunk["type"] == "console" and chunk["format"] == "output"
+        )
+        try:
+            return json.loads(output.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            raise RuntimeError(output)
+
     def preprocess_code(self, code):
         return preprocess_python(code)
 
 
+def ask_llm_for_input(interpreter, prompt):
+    """
+    Asks the LLM whether the running code is waiting for someone to type something, and
+    what. Returns the keystrokes, "CTRL-C", or None if it doesn't think input is needed.
+
+    Only the end of the conversation goes along (that's where the code and its output
+    are), cut down to INPUT_CONTEXT_LENGTH characters.
+    """
+    context = []
+    length = 0
+    for message in reversed(interpreter._messages):
+        if (
+            not isinstance(message.get("content"), str)
+            or message.get("type") == "image"
+        ):
+            continue
+        content = message["content"][-INPUT_CONTEXT_LENGTH // 4 :]
+        context.insert(0, f"{message.get('role')} ({message.get('type')}): {content}")
+        length += len(content)
+        if length > INPUT_CONTEXT_LENGTH:
+            break
+
+    text = "\n\n".join(context)
+    text += f"\n\nThe code above is still running, and the last thing it printed was:\n\n{prompt}\n\nIt might require user input. Are there keystrokes that the user should type in, to proceed after the last command? If you think the process is frozen, say <input>CTRL-C</input>."
+
+    messages = [
+        {
+            "role": "system",
+            "type": "message",
+            "content": "You are an expert programming assistant. You will help the user determine if they should enter input into the terminal, per the user's requests. If you think the user would want you to type something into stdin, enclose it in <input></input> XML tags, like <input>y</input> to type 'y'.",
+        },
+        {"role": "user", "type": "message", "content": text},
+    ]
+    params = {
+        "messages": messages,
+        "model": interpreter.llm.model,
+        "stream": True,
+        "temperature": 0,
+    }
+    if interpreter.llm.api_key:
+        params["api_key"] = interpreter.llm.api_key
+
+    response = ""
+    for chunk in litellm.completion(**params):
+        content = chunk.choices[0].delta.content
+        if type(content) == str:
+            response += content
+
+    # Parse the response for input tags
+    input_match = re.search(r"<input>(.*?)</input>", response)
+    if input_match:
+        return input_match.group(1)
+    return None
+
+
 def preprocess_python(code):
     """
     Add active line markers
     Wrap in a try except
     """
+    # The same code comes through again and again (skills, {{ }} blocks in the system
+    # message, retries), so this only parses, transforms and unparses it once
+    return _preprocess_python(code, active_line_detection())
 
+
+@functools.lru_cache(maxsize=256)
+def _preprocess_python(code, detection):
     code = code.strip()
 
+    if detection == "sampled":
+        # The kernel's line sampler takes care of it. Leave the lines where they are
+        return code
+
     # Add print commands that tell us what the active line is
     # but don't do this if any line starts with ! or %
     if (
         not any(line.strip().startswith(("!", "%")) for line in code.split("\n"))
-        and os.environ.get("INTERPRETER_ACTIVE_LINE_DETECTION", "True").lower()
-        == "true"
+        and detection == "true"
     ):
         code = add_active_line_prints(code)
 
@@ -386,6 +634,13 @@ def preprocess_python(code):
     return code
 
 
+def active_line_detection():
+    """
+    "true" (print a marker before every line), "false", or "sampled" (see LINE_SAMPLER_CODE)
+    """
+    return os.environ.get("INTERPRETER_ACTIVE_LINE_DETECTION", "True").lower()
+
+
 def add_active_line_prints(code):
     """
     Add print statements indicating line numbers to a python string.
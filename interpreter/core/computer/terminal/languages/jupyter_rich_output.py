@@ -0,0 +1,223 @@
+"""
+Structured output for DataFrames and arrays.
+
+Most of this runs inside the Jupyter kernel: JupyterLanguage loads this file there (by its
+path, so nothing else from the package gets imported) and calls `install()`. From then on,
+a big DataFrame, Series or numpy array displayed in a cell also comes out as DATA_MIMETYPE:
+
+- a short summary (shape, columns and their types, missing values, stats, the first rows),
+  which is what the LLM sees instead of the full repr, and
+- the full data, written once to a file (Arrow IPC for DataFrames, .npy for arrays) in
+  shared memory (/dev/shm) where there is some. The UI gets a "data" message pointing to
+  it, and only reads it if someone wants to see it: `load_data(message)` memory-maps it,
+  so nothing is copied until it's used. Only the last MAX_FILES are kept (that's memory),
+  and if there's no room for one, it's summary only.
+
+Small ones are displayed as usual.
+"""
+
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+
+DATA_MIMETYPE = "application/x-open-interpreter-data"
+
+# Smaller than this (rows for DataFrames, elements for arrays), the usual repr is fine
+MIN_SIZE = 100
+
+# Data files kept at once. Older ones are deleted as new ones are written
+MAX_FILES = 10
+
+# How much goes in the summary
+SUMMARY_ROWS = 5
+SUMMARY_COLUMNS = 20
+
+_counter = itertools.count()
+
+
+def install(shell):
+    """
+    Adds a formatter for DATA_MIMETYPE to an IPython shell, and returns it.
+    """
+    from IPython.core.formatters import JSONFormatter
+    from traitlets import ObjectName, Unicode
+
+    class DataFormatter(JSONFormatter):
+        format_type = Unicode(DATA_MIMETYPE)
+        # (Nothing has this. The types below are added by name, so pandas and numpy are
+        # only imported if the code imports them)
+        print_method = ObjectName("_repr_open_interpreter_data_")
+
+    formatter = DataFormatter(parent=shell.display_formatter)
+    shell.display_formatter.formatters[DATA_MIMETYPE] = formatter
+    if DATA_MIMETYPE not in shell.display_formatter.active_types:
+        shell.display_formatter.active_types.append(DATA_MIMETYPE)
+
+    directory = _data_directory()
+    formatter.for_type_by_name(
+        "pandas.core.frame",
+        "DataFrame",
+        lambda df: describe_dataframe(df, directory),
+    )
+    formatter.for_type_by_name(
+        "pandas.core.series",
+        "Series",
+        lambda series: describe_dataframe(series.to_frame(), directory, "series"),
+    )
+    formatter.for_type_by_name(
+        "numpy", "ndarray", lambda array: describe_array(array, directory)
+    )
+    return formatter
+
+
+def _data_directory():
+    # /dev/shm is memory, so a file there is as good as a shared memory segment
+    shared_memory = "/dev/shm"
+    if not (os.path.isdir(shared_memory) and os.access(shared_memory, os.W_OK)):
+        shared_memory = None
+    directory = tempfile.mkdtemp(prefix="open-interpreter-data-", dir=shared_memory)
+    atexit.register(shutil.rmtree, directory, True)
+    return directory
+
+
+def describe_dataframe(df, directory, kind="dataframe"):
+    if len(df) < MIN_SIZE:
+        return None
+
+    rows, columns = df.shape
+    title = "Series" if kind == "series" else "DataFrame"
+    lines = [f"{title}: {rows} rows x {columns} columns"]
+    for i, name in enumerate(df.columns[:SUMMARY_COLUMNS]):
+        lines.append(f"  {name}: {_describe_column(df.iloc[:, i])}")
+    if columns > SUMMARY_COLUMNS:
+        lines.append(f"  ... and {columns - SUMMARY_COLUMNS} more columns")
+    lines.append(f"First {SUMMARY_ROWS} rows:")
+    lines.append(df.head(SUMMARY_ROWS).to_string(max_cols=SUMMARY_COLUMNS))
+
+    path, format = _write_dataframe(df, directory)
+    return {
+        "kind": kind,
+        "format": format,
+        "path": path,
+        "shape": [rows, columns],
+        "summary": "\n".join(lines),
+    }
+
+
+def _describe_column(column):
+    import pandas as pd
+
+    description = str(column.dtype)
+    missing = int(column.isna().sum())
+    if missing:
+        description += f", {missing} missing"
+    numeric = pd.api.types.is_numeric_dtype(column)
+    try:
+        if numeric and not pd.api.types.is_bool_dtype(column):
+            description += f", min {column.min():.6g}, mean {column.mean():.6g}, max {column.max():.6g}"
+        else:
+            description += f", {column.nunique()} unique"
+    except Exception:
+        pass  # (Unhashable values, mixed types... the type will do)
+    return description
+
+
+def _new_file_name(directory):
+    """
+    A name for the next data file (without its extension). Deletes the oldest ones, so
+    there are never more than MAX_FILES.
+    """
+    files = sorted(
+        (file for file in os.listdir(directory) if file.split(".")[0].isdigit()),
+        key=lambda file: int(file.split(".")[0]),
+    )
+    for file in files[: max(0, len(files) - MAX_FILES + 1)]:
+        try:
+            os.remove(os.path.join(directory, file))
+        except OSError:
+            pass
+    return os.path.join(directory, str(next(_counter)))
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _write_dataframe(df, directory):
+    name = _new_file_name(directory)
+    try:
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(name + ".arrow", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return name + ".arrow", "arrow"
+    except Exception:
+        # No pyarrow, or columns it can't convert (or no room)
+        _remove(name + ".arrow")
+    try:
+        df.to_pickle(name + ".pkl")
+        return name + ".pkl", "pickle"
+    except OSError:
+        # No room (/dev/shm is small in containers). Summary only
+        _remove(name + ".pkl")
+        return None, None
+
+
+def describe_array(array, directory):
+    import numpy as np
+
+    if array.size < MIN_SIZE:
+        return None
+
+    summary = f"Array: shape {array.shape}, dtype {array.dtype}"
+    try:
+        if array.dtype.kind in "iuf":  # Integers and floats
+            summary += f", min {np.nanmin(array):.6g}, mean {np.nanmean(array):.6g}, max {np.nanmax(array):.6g}"
+            missing = int(np.isnan(array).sum()) if array.dtype.kind == "f" else 0
+            if missing:
+                summary += f", {missing} NaN"
+    except Exception:
+        pass
+    summary += "\n" + np.array2string(array, threshold=SUMMARY_ROWS * 4, edgeitems=3)
+
+    path = _new_file_name(directory) + ".npy"
+    try:
+        np.save(path, array, allow_pickle=False)
+    except (ValueError, OSError):
+        # Arrays of Python objects can't be saved without pickle, or there's no room.
+        # Summary only
+        _remove(path)
+        path = None
+    return {
+        "kind": "ndarray",
+        "format": "npy",
+        "path": path,
+        "shape": list(array.shape),
+        "summary": summary,
+    }
+
+
+def load_data(message):
+    """
+    Opens the full data behind a "data" message. Memory-mapped (not read) where the
+    format allows.
+    """
+    path = message["content"]
+    if message["format"] == "npy":
+        import numpy as np
+
+        return np.load(path, mmap_mode="r")
+    if message["format"] == "arrow":
+        import pyarrow as pa
+
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    if message["format"] == "pickle":
+        import pandas as pd
+
+        return pd.read_pickle(path)
+    raise ValueError(f"Unknown data format: {message['format']}")
@@ -0,0 +1,100 @@
+"""
+Saves the variables in a Jupyter kernel to a file, and loads them back, so a conversation
+can be resumed (with its DataFrames, models, functions...) without running it all again.
+
+This runs inside the kernel: JupyterLanguage loads this file there (by its path, like
+jupyter_rich_output.py) when it's asked to `snapshot()` or `restore()`.
+
+Variables are pickled one by one, with cloudpickle (or dill) if it's installed, so
+functions and classes defined in the session come along too. Whatever can't be pickled
+(open files, connections, locks...) is skipped and reported. Modules are saved by name
+and imported again. (Since each variable is pickled on its own, two names for the same
+object come back as two copies.)
+
+Snapshots are pickles, so only restore your own.
+"""
+
+import importlib
+import os
+import pickle
+import types
+
+try:
+    import cloudpickle as serializer
+except ImportError:
+    try:
+        import dill as serializer
+    except ImportError:
+        serializer = pickle
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot(shell, path, exclude=()):
+    """
+    Saves the variables in `shell.user_ns` to `path`. Leaves out names that start with an
+    underscore, what IPython put there itself, and `exclude`.
+    """
+    modules = {}
+    variables = {}
+    skipped = []
+    for name, value in list(shell.user_ns.items()):
+        if (
+            name.startswith("_")
+            or name in exclude
+            or (name in shell.user_ns_hidden and shell.user_ns_hidden[name] is value)
+        ):
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+            continue
+        try:
+            variables[name] = serializer.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            skipped.append(name)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "serializer": serializer.__name__,
+                "modules": modules,
+                "variables": variables,
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    # (So a snapshot that's cut short never replaces a good one)
+    os.replace(path + ".tmp", path)
+
+    return {
+        "saved": sorted(modules) + sorted(variables),
+        "skipped": sorted(skipped),
+    }
+
+
+def restore(shell, path):
+    """
+    Loads the variables saved in `path` into `shell.user_ns`.
+    """
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    loads = importlib.import_module(state["serializer"]).loads
+
+    restored = []
+    failed = []
+    for name, module in state["modules"].items():
+        try:
+            shell.user_ns[name] = importlib.import_module(module)
+            restored.append(name)
+        except Exception:
+            failed.append(name)
+    for name, data in state["variables"].items():
+        try:
+            shell.user_ns[name] = loads(data)
+            restored.append(name)
+        except Exception:
+            failed.append(name)
+
+    return {"restored": sorted(restored), "failed": sorted(failed)}
@@ -1,14 +1,25 @@
 import os
 import platform
 import re
+import selectors
+import shutil
+import tempfile
+import threading
+import time
 
 from .subprocess_language import SubprocessLanguage
 
+# With INTERPRETER_ACTIVE_LINE_DETECTION=sampled, line numbers are written to a FIFO on
+# fd 9 instead of stdout, so they never mix with the output, and we pass them on at most
+# this often. (A DEBUG trap would also cover loops, but makes them ~8x slower in bash.)
+ACTIVE_LINE_SAMPLE_INTERVAL = 0.1
+
 
 class Shell(SubprocessLanguage):
     file_extension = "sh"
     name = "Shell"
     aliases = ["bash", "sh", "zsh", "batch", "bat"]
+    use_pty = True  # (Where there are PTYs. Not on Windows)
 
     def __init__(
         self,
@@ -21,9 +32,87 @@ class Shell(SubprocessLanguage):
         else:
             self.start_cmd = [os.environ.get("SHELL", "bash")]
 
+        self.line_channel = None  # The FIFO's folder, in sampled mode
+
+    def samples_active_line(self):
+        return (
+            os.environ.get("INTERPRETER_ACTIVE_LINE_DETECTION", "True").lower()
+            == "sampled"
+            and platform.system() != "Windows"
+        )
+
     def preprocess_code(self, code):
+        # (If the shell was started in another mode, it has no fd 9 to write to)
+        if self.samples_active_line() and (self.line_channel or not self.process):
+            if not has_multiline_commands(code):
+                code = add_active_line_prints(code, ">&9")
+            return code + '\necho "##end_of_execution##"'
         return preprocess_shell(code)
 
+    def start_process(self):
+        super().start_process()
+        if self.samples_active_line():
+            self.start_line_channel()
+
+    def start_line_channel(self):
+        self.line_channel = tempfile.mkdtemp(prefix="open-interpreter-lines-")
+        fifo = os.path.join(self.line_channel, "lines")
+        os.mkfifo(fifo)
+        # Opened read-write, so neither end blocks waiting for the other, and we never see EOF
+        fd = os.open(fifo, os.O_RDWR)
+        threading.Thread(
+            target=self.handle_line_channel, args=(fd,), daemon=True
+        ).start()
+        self.process.stdin.write(f'exec 9<>"{fifo}"\n')
+        self.process.stdin.flush()
+
+    def handle_line_channel(self, fd):
+        """
+        Passes the line numbers from the FIFO on as active_line chunks, the latest one at
+        most every ACTIVE_LINE_SAMPLE_INTERVAL.
+        """
+        latest = sent = None
+        last_sent_time = 0
+        buffer = b""
+        with selectors.DefaultSelector() as selector, os.fdopen(fd, "rb", 0) as fifo:
+            selector.register(fifo, selectors.EVENT_READ)
+            while True:
+                wait = ACTIVE_LINE_SAMPLE_INTERVAL - (time.time() - last_sent_time)
+                if selector.select(timeout=max(wait, 0) if latest != sent else None):
+                    buffer += fifo.read(65536)
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        if line == b"stop":
+                            return
+                        if line.startswith(b"##active_line"):
+                            latest = int(line.split(b"##")[1][len(b"active_line") :])
+                if latest == sent:
+                    continue
+                if self.done.is_set():
+                    sent = latest  # Too late, it's finished
+                elif time.time() - last_sent_time >= ACTIVE_LINE_SAMPLE_INTERVAL:
+                    self.output_queue.put(
+                        {"type": "console", "format": "active_line", "content": latest}
+                    )
+                    sent = latest
+                    last_sent_time = time.time()
+
+    def terminate(self):
+        super().terminate()
+        if self.line_channel:
+            # Tell handle_line_channel to stop
+            try:
+                fd = os.open(
+                    os.path.join(self.line_channel, "lines"),
+                    os.O_WRONLY | os.O_NONBLOCK,
+                )
+                os.write(fd, b"\nstop\n")
+                os.close(fd)
+            except OSError:
+                pass
+            shutil.rmtree(self.line_channel, ignore_errors=True)
+            self.line_channel = None
+
     def line_postprocessor(self, line):
         return line
 
@@ -58,14 +147,16 @@ def preprocess_shell(code):
     return code
 
 
-def add_active_line_prints(code):
+def add_active_line_prints(code, redirect=""):
     """
     Add echo statements indicating line numbers to a shell string.
     """
+    if redirect:
+        redirect = " " + redirect
     lines = code.split("\n")
     for index, line in enumerate(lines):
         # Insert the echo command before the actual line
-        lines[index] = f'echo "##active_line{index + 1}##"\n{line}'
+        lines[index] = f'echo "##active_line{index + 1}##"{redirect}\n{line}'
     return "\n".join(lines)
 
 
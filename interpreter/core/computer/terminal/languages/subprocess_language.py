@@ -1,21 +1,75 @@
+import codecs
 import os
 import queue
 import re
+import selectors
 import subprocess
 import threading
 import time
 import traceback
 
+import psutil
+
 from ..base_language import BaseLanguage
+from ..limits import looks_like_input_prompt, memory_rlimit, waiting_for_input
+
+try:
+    import pty
+    import termios
+except ImportError:
+    # Windows
+    pty = None
+
+# How long a partial line (a prompt, a progress bar) waits for the rest before it's sent on its own
+PARTIAL_LINE_DELAY = 0.05
+# ...or, if it ends with what could be the start of a marker, how long it waits
+PARTIAL_MARKER_DELAY = 0.5
+
+MARKERS = ["##active_line", "##end_of_execution##"]
+ACTIVE_LINE_MARKER_RE = re.compile(r"##active_line\d*#?")
+
+
+def ends_with_partial_marker(text):
+    """
+    Whether `text` ends with something that could be the first part of a marker ("#",
+    "##act", "##active_line12#", "##end_of_exec"...), which shouldn't be sent on its own.
+    """
+    tail = text[-len(MARKERS[1]) - 10 :]
+    start = tail.find("#")
+    while start != -1:
+        rest = tail[start:]
+        if any(marker.startswith(rest) for marker in MARKERS):
+            return True
+        if ACTIVE_LINE_MARKER_RE.fullmatch(rest):
+            return True
+        start = tail.find("#", start + 1)
+    return False
 
 
 class SubprocessLanguage(BaseLanguage):
+    # Run with stdout and stderr on a pseudo-terminal, read as raw bytes (see start_pty_process)
+    use_pty = False
+
     def __init__(self):
         self.start_cmd = []
         self.process = None
         self.verbose = False
         self.output_queue = queue.Queue()
         self.done = threading.Event()
+        self.pty_fd = None
+        self.running = False
+        self.blocked_reads = 0
+
+        # Set by the terminal. Applies to the process from when it's (re)started
+        self.memory_limit = None
+
+        # The last thing it printed, and when, to tell if it's waiting for input
+        self.last_output = ""
+        self.last_output_time = time.time()
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
 
     def detect_active_line(self, line):
         return None
@@ -35,11 +89,70 @@ class SubprocessLanguage(BaseLanguage):
         """
         return code
 
+    def stop(self):
+        """
+        Stops the code that's running. First whatever it started (a command in the shell),
+        which leaves the process and its state alone. If that's not enough (the process
+        itself is busy), the process, which is started again on the next run.
+        """
+        if not self.running or not self.process:
+            return
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            try:
+                child.terminate()
+            except psutil.Error:
+                pass
+        psutil.wait_procs(children, timeout=1)
+        if self.done.wait(1):
+            return
+        self._restart()
+
+    def abort(self):
+        """
+        Stops the whole block. The rest of it is already written to the process's stdin,
+        so it would run once what's running now is stopped. The process is restarted
+        instead (and everything it started is stopped).
+        """
+        if not self.running or not self.process:
+            return
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            try:
+                child.kill()
+            except psutil.Error:
+                pass
+        self._restart()
+
+    def _restart(self):
+        # The notice goes in first, and `done` is set before the process goes, so
+        # _read_output doesn't take this for the process dying on its own
+        self.output_queue.put(
+            {
+                "type": "console",
+                "format": "output",
+                "content": "\nThe process was restarted, so anything defined in it is gone.\n",
+            }
+        )
+        self.done.set()
+        self.terminate()
+        self.process = None
+
     def terminate(self):
         if self.process:
             self.process.terminate()
             self.process.stdin.close()
-            self.process.stdout.close()
+            if self.process.stdout:
+                self.process.stdout.close()
+        if self.pty_fd is not None:
+            os.close(self.pty_fd)
+            self.pty_fd = None
 
     def start_process(self):
         if self.process:
@@ -47,6 +160,11 @@ class SubprocessLanguage(BaseLanguage):
 
         my_env = os.environ.copy()
         my_env["PYTHONIOENCODING"] = "utf-8"
+
+        if self.use_pty and pty:
+            self.start_pty_process(my_env)
+            return
+
         self.process = subprocess.Popen(
             self.start_cmd,
             stdin=subprocess.PIPE,
@@ -58,6 +176,7 @@ class SubprocessLanguage(BaseLanguage):
             env=my_env,
             encoding="utf-8",
             errors="replace",
+            preexec_fn=memory_rlimit(self.memory_limit),
         )
         threading.Thread(
             target=self.handle_stream_output,
@@ -70,65 +189,160 @@ class SubprocessLanguage(BaseLanguage):
             daemon=True,
         ).start()
 
-    def run(self, code):
-        retry_count = 0
-        max_retries = 3
+    def start_pty_process(self, env):
+        """
+        Starts the process with stdout and stderr both on one pseudo-terminal.
+
+        Programs then see a terminal, so they don't block-buffer their output, and stdout and
+        stderr arrive in the order they were written (they're one stream, read by one thread).
+        The output is read as bytes, as it comes, so prompts and progress bars without a
+        newline show up too. stdin stays a pipe, so shells don't turn interactive (prompts,
+        job control) on us.
+        """
+        master_fd, slave_fd = pty.openpty()
+
+        # Leave "\n" alone (terminals turn it into "\r\n")
+        attributes = termios.tcgetattr(slave_fd)
+        attributes[1] &= ~termios.OPOST
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
+
+        # No colors and cursor tricks, please. This is read by an LLM
+        env["TERM"] = "dumb"
 
-        # Setup
         try:
-            code = self.preprocess_code(code)
-            if not self.process:
-                self.start_process()
-        except:
-            yield {
-                "type": "console",
-                "format": "output",
-                "content": traceback.format_exc(),
-            }
-            return
+            self.process = subprocess.Popen(
+                self.start_cmd,
+                stdin=subprocess.PIPE,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                text=True,
+                bufsize=0,
+                env=env,
+                encoding="utf-8",
+                errors="replace",
+                preexec_fn=memory_rlimit(self.memory_limit),
+            )
+        finally:
+            # The child has it now. (Once it exits, reading the master gives EOF/EIO)
+            os.close(slave_fd)
+        self.pty_fd = master_fd
+
+        threading.Thread(
+            target=self.handle_pty_output,
+            args=(master_fd,),
+            daemon=True,
+        ).start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, code):
+        for attempt in range(2):
+            if self.process and not self.is_alive():
+                # It exited since the last run (it crashed, or the code ended it)
+                yield {
+                    "type": "console",
+                    "format": "output",
+                    "content": f"({self.name} had exited with code {self.process.returncode}, so it was restarted. Anything defined before is gone.)\n",
+                }
+                self.terminate()
+                self.process = None
+
+            # Setup
+            try:
+                processed_code = self.preprocess_code(code)
+                if not self.process:
+                    self.start_process()
+            except:
+                yield {
+                    "type": "console",
+                    "format": "output",
+                    "content": traceback.format_exc(),
+                }
+                return
 
-        while retry_count <= max_retries:
             if self.verbose:
-                print(f"(after processing) Running processed code:\n{code}\n---")
+                print(
+                    f"(after processing) Running processed code:\n{processed_code}\n---"
+                )
 
             self.done.clear()
 
             try:
-                self.process.stdin.write(code + "\n")
+                self.process.stdin.write(processed_code + "\n")
                 self.process.stdin.flush()
                 break
-            except:
-                if retry_count != 0:
-                    # For UX, I like to hide this if it happens once. Obviously feels better to not see errors
-                    # Most of the time it doesn't matter, but we should figure out why it happens frequently with:
-                    # applescript
-                    yield {
-                        "type": "console",
-                        "format": "output",
-                        "content": f"{traceback.format_exc()}\nRetrying... ({retry_count}/{max_retries})\nRestarting process.",
-                    }
-
-                self.start_process()
-
-                retry_count += 1
-                if retry_count > max_retries:
+            except (OSError, ValueError):
+                # It exited as we wrote. Go around again, which restarts it, once
+                if attempt:
                     yield {
                         "type": "console",
                         "format": "output",
-                        "content": "Maximum retries reached. Could not execute code.",
+                        "content": f"{traceback.format_exc()}\nCould not execute code.",
                     }
                     return
+                try:
+                    self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self.terminate()
+                    self.process = None
+
+        self.running = True
+        self.last_output = ""
+        self.blocked_reads = 0
+        self.last_output_time = time.time()
+        try:
+            yield from self._read_output()
+        finally:
+            self.running = False
 
+    def _read_output(self):
+        input_patience = int(os.environ.get("INTERPRETER_TERMINAL_INPUT_PATIENCE", 15))
         while True:
-            if not self.output_queue.empty():
-                yield self.output_queue.get()
-            else:
-                time.sleep(0.1)
             try:
                 output = self.output_queue.get(timeout=0.3)  # Waits for 0.3 seconds
                 yield output
+                if (
+                    self.pty_fd is not None
+                    and self.done.is_set()
+                    and self.output_queue.empty()
+                ):
+                    # One reader, so everything before the end marker is already in the queue
+                    break
             except queue.Empty:
+                if not self.done.is_set() and not self.is_alive():
+                    # It exited (the code ended it, or it crashed), so no end marker is coming
+                    yield {
+                        "type": "console",
+                        "format": "output",
+                        "content": f"\n({self.name} exited with code {self.process.returncode}. It will be restarted for the next code block, so anything defined before is gone.)\n",
+                    }
+                    self.terminate()
+                    self.process = None
+                    break
+                if (
+                    not self.done.is_set()
+                    and self.is_waiting_for_input(input_patience)
+                    # The process also waits on stdin once it's read the whole block, with
+                    # the end marker maybe not read from its output yet. Give that a moment
+                    and not self.done.wait(1)
+                ):
+                    # Nobody is going to type anything. Don't wait forever
+                    prompt = ""
+                    if looks_like_input_prompt(self.last_output):
+                        prompt = self.last_output.strip()[-100:]
+                    yield {
+                        "type": "console",
+                        "format": "output",
+                        "content": f"\n\nThe program is waiting for input{f' ({prompt!r})' if prompt else ''}, so it was stopped. Run it with its input piped in, or with options that make it non-interactive.\n",
+                    }
+                    self.stop()
+                    self.last_output = ""
+                    self.blocked_reads = 0
+                    continue
                 if self.done.is_set():
+                    if self.pty_fd is not None:
+                        break
                     # Try to yank 3 more times from it... maybe there's something in there...
                     # (I don't know if this actually helps. Maybe we just need to yank 1 more time)
                     for _ in range(3):
@@ -137,57 +351,118 @@ class SubprocessLanguage(BaseLanguage):
                         time.sleep(0.2)
                     break
 
+    def is_waiting_for_input(self, patience):
+        """
+        Whether the running code is waiting for someone to type something: it's blocked
+        reading from a terminal or from our stdin (twice in a row, so not just between two
+        lines of code), or it's been quiet for `patience` seconds after printing something
+        that looks like a prompt.
+        """
+        silence = time.time() - self.last_output_time
+        if silence > 0.5 and waiting_for_input(self.pid):
+            self.blocked_reads += 1
+        else:
+            self.blocked_reads = 0
+        if self.blocked_reads >= 2:
+            return True
+        return silence > patience and looks_like_input_prompt(self.last_output)
+
     def handle_stream_output(self, stream, is_error_stream):
         try:
             for line in iter(stream.readline, ""):
-                if self.verbose:
-                    print(f"Received output line:\n{line}\n---")
-
-                line = self.line_postprocessor(line)
-
-                if line is None:
-                    continue  # `line = None` is the postprocessor's signal to discard completely
-
-                if self.detect_active_line(line):
-                    active_line = self.detect_active_line(line)
-                    self.output_queue.put(
-                        {
-                            "type": "console",
-                            "format": "active_line",
-                            "content": active_line,
-                        }
-                    )
-                    # Sometimes there's a little extra on the same line, so be sure to send that out
-                    line = re.sub(r"##active_line\d+##", "", line)
-                    if line:
-                        self.output_queue.put(
-                            {"type": "console", "format": "output", "content": line}
-                        )
-                elif self.detect_end_of_execution(line):
-                    # Sometimes there's a little extra on the same line, so be sure to send that out
-                    line = line.replace("##end_of_execution##", "").strip()
-                    if line:
-                        self.output_queue.put(
-                            {"type": "console", "format": "output", "content": line}
-                        )
-                    self.done.set()
-                elif is_error_stream and "KeyboardInterrupt" in line:
-                    self.output_queue.put(
-                        {
-                            "type": "console",
-                            "format": "output",
-                            "content": "KeyboardInterrupt",
-                        }
-                    )
-                    time.sleep(0.1)
-                    self.done.set()
-                else:
-                    self.output_queue.put(
-                        {"type": "console", "format": "output", "content": line}
-                    )
+                self.handle_output_line(line, is_error_stream)
         except ValueError as e:
             if "operation on closed file" in str(e):
                 if self.verbose:
                     print("Stream closed while reading.")
             else:
                 raise e
+
+    def handle_pty_output(self, fd):
+        """
+        Reads the pseudo-terminal's output as it comes. Whole lines go through
+        `handle_output_line` like any other output; a partial line is sent on its own if
+        nothing more arrives for a moment (unless it could be the start of a marker).
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                # (A partial line that could be the start of a marker waits longer for the rest)
+                if not pending:
+                    timeout = None
+                elif ends_with_partial_marker(pending):
+                    timeout = PARTIAL_MARKER_DELAY
+                else:
+                    timeout = PARTIAL_LINE_DELAY
+                try:
+                    if not selector.select(timeout=timeout):
+                        # Nothing more for now. Send what we have
+                        self.handle_output_line(pending, False)
+                        pending = ""
+                        continue
+                    data = os.read(fd, 65536)
+                except (OSError, ValueError):
+                    # EIO: the process (and everything it started) is gone. Or we closed it
+                    data = b""
+                if not data:
+                    break
+                pending += decoder.decode(data)
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    self.handle_output_line(line + "\n", False)
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            self.handle_output_line(pending, False)
+
+    def handle_output_line(self, line, is_error_stream):
+        if self.verbose:
+            print(f"Received output line:\n{line}\n---")
+
+        line = self.line_postprocessor(line)
+
+        if line is None:
+            return  # `line = None` is the postprocessor's signal to discard completely
+
+        self.last_output_time = time.time()
+        if not self.detect_active_line(line) and not self.detect_end_of_execution(line):
+            self.last_output = line
+
+        if self.detect_active_line(line):
+            active_line = self.detect_active_line(line)
+            self.output_queue.put(
+                {
+                    "type": "console",
+                    "format": "active_line",
+                    "content": active_line,
+                }
+            )
+            # Sometimes there's a little extra on the same line, so be sure to send that out
+            line = re.sub(r"##active_line\d+##", "", line)
+            if line:
+                self.output_queue.put(
+                    {"type": "console", "format": "output", "content": line}
+                )
+        elif self.detect_end_of_execution(line):
+            # Sometimes there's a little extra on the same line, so be sure to send that out
+            line = line.replace("##end_of_execution##", "").strip()
+            if line:
+                self.output_queue.put(
+                    {"type": "console", "format": "output", "content": line}
+                )
+            self.done.set()
+        elif is_error_stream and "KeyboardInterrupt" in line:
+            self.output_queue.put(
+                {
+                    "type": "console",
+                    "format": "output",
+                    "content": "KeyboardInterrupt",
+                }
+            )
+            time.sleep(0.1)
+            self.done.set()
+        else:
+            self.output_queue.put(
+                {"type": "console", "format": "output", "content": line}
+            )
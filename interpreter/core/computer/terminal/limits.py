@@ -0,0 +1,199 @@
+"""
+Per-block limits for code execution: wall-clock time, CPU time and memory, plus ways
+to tell whether a program has stopped to wait for input (a guess from what it printed,
+and on Linux, what it's blocked on).
+
+Limits are set on the terminal (`computer.terminal.timeout = 60`, `.cpu_limit`,
+`.memory_limit` in bytes) and apply to every code block. The terminal watches the
+process running the block (and everything it started) with a `ResourceMonitor`, and
+stops the block if it goes over. What each block used ends up in
+`computer.terminal.last_usage`.
+"""
+
+import os
+import platform
+import re
+import time
+
+import psutil
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Ends of output that usually mean a program is waiting for someone to type something
+INPUT_PROMPT_PATTERNS = [
+    r"\[[yY](es)?/[nN]o?\]\s*$",  # [y/N], [Y/n], [yes/no]
+    r"\([yY](es)?/[nN]o?\)\s*$",  # (y/n)
+    r"(password|passphrase|token|username|login)[^\n]*:\s*$",
+    r"press (enter|return|any key)[^\n]*$",
+    r"(continue|proceed|overwrite|replace)\?\s*$",
+    r"[:?>]\s$",  # "Name: ", "Your choice? ", "> "
+]
+INPUT_PROMPT_RE = re.compile("|".join(INPUT_PROMPT_PATTERNS), re.IGNORECASE)
+
+# read, pread64 and readv, by architecture (from the kernel's syscall tables)
+READ_SYSCALLS = {
+    "x86_64": {0, 17, 19},
+    "aarch64": {63, 65, 67},
+}
+
+
+def looks_like_input_prompt(output):
+    """
+    Guesses, from the last thing a program printed, whether it's waiting for input.
+
+    Only the last line counts, and only if it doesn't end with a newline: prompts are
+    printed without one, so the cursor stays after them.
+    """
+    if not output or output.endswith("\n"):
+        return False
+    last_line = output.rsplit("\n", 1)[-1]
+    return bool(INPUT_PROMPT_RE.search(last_line[-200:]))
+
+
+def waiting_for_input(pid):
+    """
+    Whether `pid` or something it started is blocked reading from a terminal, or from
+    the same stdin as `pid` (the pipe we write code into). While a block is running,
+    that means it's waiting for someone to type something.
+
+    Uses /proc/<pid>/syscall, so it's Linux only. Returns None if we can't tell.
+    """
+    read_syscalls = READ_SYSCALLS.get(platform.machine())
+    if pid is None or read_syscalls is None or not os.path.isdir("/proc"):
+        return None
+    try:
+        stdin = os.readlink(f"/proc/{pid}/fd/0")
+        processes = [pid] + [
+            child.pid for child in psutil.Process(pid).children(recursive=True)
+        ]
+    except (OSError, psutil.Error):
+        return None
+
+    for process in processes:
+        try:
+            with open(f"/proc/{process}/syscall") as f:
+                # "<syscall number> <first argument (the fd)> ...", or "running"
+                fields = f.read().split()
+            if not fields[0].isdigit() or int(fields[0]) not in read_syscalls:
+                continue
+            source = os.readlink(f"/proc/{process}/fd/{int(fields[1], 16)}")
+        except (OSError, ValueError, IndexError):
+            continue
+        if source == stdin or source == "/dev/tty" or source.startswith("/dev/pts/"):
+            return True
+    return False
+
+
+def memory_rlimit(memory_limit):
+    """
+    Returns a `preexec_fn` for subprocess.Popen that caps the memory the process (and
+    everything it starts) can allocate, or None if there's no limit (or no `resource`).
+
+    (RLIMIT_DATA rather than RLIMIT_AS where we can: Node and the JVM reserve far more
+    address space than they ever use, and RLIMIT_AS would stop them from starting.)
+    """
+    if not memory_limit or resource is None:
+        return None
+    limit = getattr(resource, "RLIMIT_DATA", resource.RLIMIT_AS)
+
+    def set_limit():
+        resource.setrlimit(limit, (memory_limit, memory_limit))
+
+    return set_limit
+
+
+class ResourceMonitor:
+    """
+    Measures what a process and its children use while a block runs.
+
+        monitor = ResourceMonitor(pid)
+        ...
+        monitor.sample()  # Every so often
+        monitor.exceeded(timeout=60)  # "it ran for more than 60 seconds", or None
+        monitor.usage()  # {"wall_time": ..., "cpu_time": ..., "max_rss": ...}
+    """
+
+    def __init__(self, pid=None):
+        self.start_time = time.time()
+        self.rss = 0
+        self.max_rss = 0
+        self._process = None
+        self._cpu_times = {}  # pid -> CPU seconds so far
+        self._start_cpu_times = {}  # pid -> CPU seconds when we started
+        self.attach(pid)
+
+    def attach(self, pid):
+        """
+        Starts watching `pid` (for processes that are started after the block is).
+        """
+        if pid is None or self._process is not None:
+            return
+        try:
+            self._process = psutil.Process(pid)
+        except psutil.Error:
+            return
+        self.sample()
+        self._start_cpu_times = dict(self._cpu_times)
+
+    def sample(self):
+        if self._process is None:
+            return
+        try:
+            processes = [self._process] + self._process.children(recursive=True)
+        except psutil.Error:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    cpu_times = process.cpu_times()
+                    rss += process.memory_info().rss
+            except psutil.Error:
+                continue  # It exited (its CPU time so far stays counted)
+            self._cpu_times[process.pid] = cpu_times.user + cpu_times.system
+        self.max_rss = max(self.max_rss, rss)
+        self.rss = rss
+
+    @property
+    def wall_time(self):
+        return time.time() - self.start_time
+
+    @property
+    def cpu_time(self):
+        return sum(
+            cpu_time - self._start_cpu_times.get(pid, 0)
+            for pid, cpu_time in self._cpu_times.items()
+        )
+
+    def usage(self):
+        return {
+            "wall_time": round(self.wall_time, 3),
+            "cpu_time": round(self.cpu_time, 3),
+            "max_rss": self.max_rss,
+        }
+
+    def exceeded(self, timeout=None, cpu_limit=None, memory_limit=None):
+        """
+        Which limit (if any) has been gone over, as a sentence for the LLM.
+        """
+        if timeout and self.wall_time > timeout:
+            return f"it ran for more than {timeout:g} seconds"
+        if cpu_limit and self.cpu_time > cpu_limit:
+            return f"it used more than {cpu_limit:g} seconds of CPU time"
+        if memory_limit and self.rss > memory_limit:
+            return f"it used more than {format_bytes(memory_limit)} of memory"
+        return None
+
+
+def format_bytes(size):
+    if size < 1024:
+        return f"{size} bytes"
+    for unit in ["KB", "MB"]:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
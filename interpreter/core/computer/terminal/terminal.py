@@ -1,6 +1,9 @@
 import json
 import os
+import queue
+import threading
 import time
+import traceback
 import subprocess
 import getpass
 
@@ -15,6 +18,7 @@ from .languages.r import R
 from .languages.react import React
 from .languages.ruby import Ruby
 from .languages.shell import Shell
+from .limits import ResourceMonitor
 
 # Should this be renamed to OS or System?
 
@@ -47,6 +51,21 @@ class Terminal:
         ]
         self._active_languages = {}
 
+        # For run_parallel: extra instances of each language (so two shell blocks can run at
+        # once, each in its own shell), and which instances are running something
+        self.max_parallel = 4
+        self._language_pool = {}
+        self._busy_languages = set()
+        self._pool_lock = threading.Lock()
+
+        # Limits for each code block (see limits.py). None means no limit
+        self.timeout = None  # Seconds
+        self.cpu_limit = None  # Seconds of CPU time
+        self.memory_limit = None  # Bytes
+
+        # What the last block used: {"wall_time", "cpu_time", "max_rss"}
+        self.last_usage = {}
+
     def sudo_install(self, package):
         try:
             # First, try to install without sudo
@@ -104,7 +123,8 @@ class Terminal:
                     display=self.computer.verbose,
                 )
 
-            if self.computer.import_skills and not self.computer._has_imported_skills:
+            if self.computer.import_skills:
+                # (Only runs the skills that are new or changed since last time)
                 self.computer._has_imported_skills = True
                 self.computer.skills.import_skills()
 
@@ -117,7 +137,7 @@ class Terminal:
                 else:
                     code_outputs = [
                         m
-                        for m in self.computer.interpreter.messages
+                        for m in self.computer.interpreter._messages
                         if m["role"] == "computer"
                         and "content" in m
                         and m["content"] != ""
@@ -139,8 +159,10 @@ class Terminal:
             for chunk in self._streaming_run(language, code, display=display):
                 if chunk.get("format") != "active_line":
                     # Should we append this to the last message, or make a new one?
+                    # (Data messages are each a file, so never merged)
                     if (
                         output_messages != []
+                        and chunk["type"] != "data"
                         and output_messages[-1].get("type") == chunk["type"]
                         and output_messages[-1].get("format") == chunk["format"]
                     ):
@@ -153,49 +175,260 @@ class Terminal:
             # If stream == True, replace this with _streaming_run.
             return self._streaming_run(language, code, display=display)
 
+    def _new_language(self, language):
+        # Get the language. Pass in self.computer *if it takes a single argument*
+        # but pass in nothing if not. This makes custom languages easier to add / understand.
+        lang_class = self.get_language(language)
+        if lang_class.__init__.__code__.co_argcount > 1:
+            return lang_class(self.computer)
+        else:
+            return lang_class()
+
     def _streaming_run(self, language, code, display=False):
         if language not in self._active_languages:
-            # Get the language. Pass in self.computer *if it takes a single argument*
-            # but pass in nothing if not. This makes custom languages easier to add / understand.
-            lang_class = self.get_language(language)
-            if lang_class.__init__.__code__.co_argcount > 1:
-                self._active_languages[language] = lang_class(self.computer)
-            else:
-                self._active_languages[language] = lang_class()
+            self._active_languages[language] = self._new_language(language)
+        self.last_usage = {}
         try:
-            for chunk in self._active_languages[language].run(code):
-                # self.format_to_recipient can format some messages as having a certain recipient.
-                # Here we add that to the LMC messages:
-                if chunk["type"] == "console" and chunk.get("format") == "output":
-                    recipient, content = parse_for_recipient(chunk["content"])
-                    if recipient:
-                        chunk["recipient"] = recipient
-                        chunk["content"] = content
-
-                    # Sometimes, we want to hide the traceback to preserve tokens.
-                    # (is this a good idea?)
-                    if "@@@HIDE_TRACEBACK@@@" in content:
-                        chunk["content"] = (
-                            "Stopping execution.\n\n"
-                            + content.split("@@@HIDE_TRACEBACK@@@")[-1].strip()
-                        )
+            yield from self._run_on(
+                self._active_languages[language],
+                code,
+                display=display,
+                usage=self.last_usage,
+            )
+        except GeneratorExit:
+            self.stop()
+
+    def _run_on(self, instance, code, display=False, usage=None):
+        if hasattr(instance, "memory_limit"):
+            instance.memory_limit = self.memory_limit
+
+        # Watch what it uses, and stop it if it goes over a limit
+        monitor = ResourceMonitor(getattr(instance, "pid", None))
+        finished = threading.Event()
+        over_limit = []
 
+        def watch():
+            while not finished.wait(0.25):
+                monitor.attach(getattr(instance, "pid", None))
+                monitor.sample()
+                reason = monitor.exceeded(
+                    self.timeout, self.cpu_limit, self.memory_limit
+                )
+                if reason:
+                    over_limit.append(reason)
+                    # The whole block, not just the line it's on
+                    instance.abort()
+                    return
+
+        threading.Thread(target=watch, daemon=True).start()
+        try:
+            yield from self._run_chunks(instance, code, display)
+            if over_limit:
+                chunk = {
+                    "type": "console",
+                    "format": "output",
+                    "content": f"\n\nExecution was stopped because {over_limit[0]}.\n",
+                }
                 yield chunk
+                if display:
+                    print(chunk["content"], end="")
+        finally:
+            finished.set()
+            monitor.sample()
+            if usage is not None:
+                usage.update(monitor.usage())
+
+    def _run_chunks(self, instance, code, display):
+        for chunk in instance.run(code):
+            # self.format_to_recipient can format some messages as having a certain recipient.
+            # Here we add that to the LMC messages:
+            if chunk["type"] == "console" and chunk.get("format") == "output":
+                recipient, content = parse_for_recipient(chunk["content"])
+                if recipient:
+                    chunk["recipient"] = recipient
+                    chunk["content"] = content
+
+                # Sometimes, we want to hide the traceback to preserve tokens.
+                # (is this a good idea?)
+                if "@@@HIDE_TRACEBACK@@@" in content:
+                    chunk["content"] = (
+                        "Stopping execution.\n\n"
+                        + content.split("@@@HIDE_TRACEBACK@@@")[-1].strip()
+                    )
+
+            yield chunk
+
+            # Print it also if display = True
+            if (
+                display
+                and chunk.get("format") != "active_line"
+                and chunk.get("content")
+            ):
+                print(chunk["content"], end="")
+
+    def run_parallel(self, blocks, max_parallel=None, stream=False, display=False):
+        """
+        Runs independent code blocks at the same time, each in its own instance of its
+        language (a second shell, a second Python kernel...), at most `max_parallel`
+        (default: self.max_parallel) at once.
 
-                # Print it also if display = True
-                if (
+        `blocks` is a list of {"language", "code"} dicts, optionally with an "id" (defaults
+        to its position) and "after": a list of ids that must finish before it starts.
+
+        With stream=True, yields the blocks' output chunks as they come, each with its
+        block's id as "block", and a {"block": id, "type": "block", "end": True, "usage": ...}
+        chunk when a block is done (with what it used, like `last_usage`). Otherwise returns {id: output messages}, like run() for each block.
+        """
+        if stream:
+            return self._streaming_run_parallel(blocks, max_parallel, display)
+
+        outputs = {}
+        for chunk in self._streaming_run_parallel(blocks, max_parallel, display):
+            if chunk["type"] == "block" or chunk.get("format") == "active_line":
+                continue
+            messages = outputs.setdefault(chunk.pop("block"), [])
+            if (
+                messages
+                and messages[-1].get("type") == chunk["type"]
+                and messages[-1].get("format") == chunk["format"]
+            ):
+                messages[-1]["content"] += chunk["content"]
+            else:
+                messages.append(chunk)
+        return {
+            block.get("id", i): outputs.get(block.get("id", i), [])
+            for i, block in enumerate(blocks)
+        }
+
+    def _streaming_run_parallel(self, blocks, max_parallel, display):
+        blocks = {block.get("id", i): block for i, block in enumerate(blocks)}
+        waiting_on = {id: set(block.get("after", [])) for id, block in blocks.items()}
+        for id, after in waiting_on.items():
+            if after - blocks.keys():
+                raise ValueError(
+                    f"Block {id} comes after blocks that don't exist: {after - blocks.keys()}"
+                )
+            if id in after:
+                raise ValueError(f"Block {id} can't come after itself.")
+
+        max_parallel = max_parallel or self.max_parallel
+        output_queue = queue.Queue()
+        running = {}  # id -> (language instance, thread)
+        stopping = threading.Event()
+
+        def run_block(id, instance, code):
+            usage = {}
+            try:
+                for chunk in self._run_on(instance, code, usage=usage):
+                    if stopping.is_set():
+                        break
+                    output_queue.put({**chunk, "block": id})
+            except Exception:
+                output_queue.put(
+                    {
+                        "block": id,
+                        "type": "console",
+                        "format": "output",
+                        "content": traceback.format_exc(),
+                    }
+                )
+            finally:
+                output_queue.put(
+                    {"block": id, "type": "block", "end": True, "usage": usage}
+                )
+
+        try:
+            while waiting_on or running:
+                # Start whatever can start
+                for id in [id for id, after in waiting_on.items() if not after]:
+                    if len(running) >= max_parallel:
+                        break
+                    del waiting_on[id]
+                    block = blocks[id]
+                    instance = self._acquire_language(block["language"])
+                    thread = threading.Thread(
+                        target=run_block,
+                        args=(id, instance, block["code"]),
+                        daemon=True,
+                    )
+                    running[id] = (instance, thread)
+                    thread.start()
+
+                if not running:
+                    raise ValueError(f"Blocks {list(waiting_on)} wait on each other.")
+
+                chunk = output_queue.get()
+                if chunk["type"] == "block" and chunk.get("end"):
+                    instance, _ = running.pop(chunk["block"])
+                    self._release_language(instance)
+                    for after in waiting_on.values():
+                        after.discard(chunk["block"])
+                elif (
                     display
                     and chunk.get("format") != "active_line"
                     and chunk.get("content")
                 ):
                     print(chunk["content"], end="")
+                yield chunk
+        finally:
+            if running:
+                # We were stopped (or something went wrong). Stop what's still running
+                stopping.set()
+                for instance, _ in running.values():
+                    instance.stop()
+                    self._release_language(instance)
 
-        except GeneratorExit:
-            self.stop()
+    def _acquire_language(self, language):
+        """
+        An instance of `language` that isn't running anything: the usual one if it's free,
+        otherwise one from the pool (which grows as needed).
+        """
+        with self._pool_lock:
+            main = self._active_languages.get(language)
+            pool = self._language_pool.setdefault(language, [])
+            for instance in [main] + pool:
+                if instance is not None and id(instance) not in self._busy_languages:
+                    self._busy_languages.add(id(instance))
+                    return instance
+
+        # (Outside the lock, starting some languages takes a while)
+        instance = self._new_language(language)
+        with self._pool_lock:
+            if self._active_languages.get(language) is None:
+                self._active_languages[language] = instance
+            else:
+                self._language_pool[language].append(instance)
+            self._busy_languages.add(id(instance))
+        return instance
+
+    def _release_language(self, instance):
+        with self._pool_lock:
+            self._busy_languages.discard(id(instance))
+
+    def snapshot(self, path):
+        """
+        Saves the Python kernel's variables to `path`, if Python has been started (see
+        JupyterLanguage.snapshot). Returns what was saved, or None.
+        """
+        python = self._active_languages.get("python")
+        if python is None:
+            return None
+        return python.snapshot(path)
+
+    def restore(self, path):
+        """
+        Starts Python (if it isn't running) and loads the variables saved in `path`.
+        """
+        if "python" not in self._active_languages:
+            self._active_languages["python"] = self._new_language("python")
+        return self._active_languages["python"].restore(path)
 
     def stop(self):
         for language in self._active_languages.values():
             language.stop()
+        for pool in self._language_pool.values():
+            for language in pool:
+                language.stop()
 
     def terminate(self):
         for language_name in list(self._active_languages.keys()):
@@ -205,3 +438,8 @@ class Terminal:
             ):  # Not sure why this is None sometimes. We should look into this
                 language.terminate()
             del self._active_languages[language_name]
+        for pool in self._language_pool.values():
+            for language in pool:
+                language.terminate()
+        self._language_pool = {}
+        self._busy_languages = set()
@@ -0,0 +1,150 @@
+"""
+A persistent cache of image descriptions (and OCR text), for non-vision models.
+
+Keyed by a hash of the image's bytes, so the same screenshot shown twice, or an old
+conversation loaded back up, doesn't go through the vision models again. Each entry is
+a small JSON file, sharded by the first two characters of its hash. Hits bump the file's
+mtime, and once there are more than `max_disk_entries` files the least recently used are
+deleted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from ...utils.blob_store import image_bytes
+
+
+class DescriptionCache:
+    def __init__(self, path, max_memory_entries=256, max_disk_entries=10000):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = {}
+        self._disk_entries = None  # Counted on the first write
+        self._lock = threading.Lock()
+
+    def key(self, lmc, renderer=""):
+        """
+        Returns the cache key for an image LMC message, or None if we can't read the image.
+        `renderer` should identify what produced the description, so changing it misses.
+        """
+        try:
+            if "base64" in lmc["format"]:
+                data = image_bytes(lmc["content"])
+            elif lmc["format"] == "path":
+                with open(lmc["content"], "rb") as f:
+                    data = f.read()
+            else:
+                return None
+        except (OSError, ValueError, TypeError):
+            return None
+
+        digest = hashlib.sha256(data)
+        digest.update(renderer.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns {"description": ..., "ocr": ...}, or None.
+        """
+        if key is None:
+            return None
+        entry_path = self._entry_path(key)
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                # Move it to the end, so it's the last to be dropped
+                self._memory[key] = entry
+        if entry is None:
+            try:
+                with open(entry_path, "r") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._remember(key, entry)
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, description, ocr):
+        if key is None:
+            return
+        entry = {"description": description, "ocr": ocr}
+        self._remember(key, entry)
+
+        entry_path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            existed = os.path.exists(entry_path)
+            temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            # Not being able to cache shouldn't stop us from describing the image
+            return
+
+        if not existed:
+            with self._lock:
+                if self._disk_entries is None:
+                    self._disk_entries = len(self._disk_entry_paths())
+                else:
+                    self._disk_entries += 1
+                if self._disk_entries > self.max_disk_entries:
+                    self._prune()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory.pop(key, None)
+            if len(self._memory) >= self.max_memory_entries:
+                # Drop the least recently used (dicts keep insertion order)
+                self._memory.pop(next(iter(self._memory)))
+            self._memory[key] = entry
+
+    def _disk_entry_paths(self):
+        paths = []
+        try:
+            shards = list(os.scandir(self.path))
+        except OSError:
+            return paths
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            try:
+                paths.extend(
+                    entry.path
+                    for entry in os.scandir(shard.path)
+                    if entry.name.endswith(".json")
+                )
+            except OSError:
+                continue
+        return paths
+
+    def _prune(self):
+        """
+        Deletes the least recently used entries on disk, leaving room for a few more
+        so we don't rescan on every write. Called with the lock held.
+        """
+
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        paths = sorted(self._disk_entry_paths(), key=mtime)
+        keep = self.max_disk_entries * 9 // 10
+        for path in paths[: max(len(paths) - keep, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        # Other processes may share the directory, so this is only an estimate
+        self._disk_entries = min(len(paths), keep)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + ".json")
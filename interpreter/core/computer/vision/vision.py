@@ -3,9 +3,11 @@ import contextlib
 import io
 import os
 import tempfile
+import threading
 
 from PIL import Image
 
+from ...utils.blob_store import image_bytes
 from ...utils.lazy_import import lazy_import
 from ..utils.computer_vision import pytesseract_get_text
 
@@ -19,42 +21,82 @@ class Vision:
         self.tokenizer = None  # Will load upon first use
         self.easyocr = None
 
+        # Run the models in a separate worker process (see vision_service.py), which keeps them
+        # loaded and can work on several images at once. Off by default.
+        self.use_service = os.getenv("INTERPRETER_VISION_SERVICE", "False") == "True"
+        self.service = None
+
+        # The in-process models aren't safe to call from several threads at once. One lock
+        # per model, so OCR can run while Moondream is busy
+        self._moondream_lock = threading.RLock()
+        self._ocr_lock = threading.RLock()
+
+    def _get_service(self):
+        if self.service is None:
+            from .vision_service import VisionService
+
+            self.service = VisionService()
+        return self.service
+
+    def metrics(self):
+        """
+        Queue depth and latency of the vision worker, if it's being used.
+        """
+        if self.service is None:
+            return None
+        return self.service.metrics()
+
     def load(self, load_moondream=True, load_easyocr=True):
         # print("Loading vision models (Moondream, EasyOCR)...\n")
 
+        if self.use_service:
+            return self._get_service().load(load_moondream, load_easyocr)
+
+        return self._load(load_moondream, load_easyocr)
+
+    def _load(self, load_moondream=True, load_easyocr=True):
         with contextlib.redirect_stdout(
             open(os.devnull, "w")
         ), contextlib.redirect_stderr(open(os.devnull, "w")):
-            if self.easyocr == None and load_easyocr:
-                import easyocr
+            if load_easyocr:
+                with self._ocr_lock:
+                    if self.easyocr == None:
+                        import easyocr
 
-                self.easyocr = easyocr.Reader(
-                    ["en"]
-                )  # this needs to run only once to load the model into memory
+                        self.easyocr = easyocr.Reader(
+                            ["en"]
+                        )  # this needs to run only once to load the model into memory
 
-            if self.model == None and load_moondream:
-                import transformers  # Wait until we use it. Transformers can't be lazy loaded for some reason!
+            if load_moondream:
+                with self._moondream_lock:
+                    if self.model == None:
+                        self._load_moondream()
 
-                os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        # (Also when another thread loaded it while we waited for the lock)
+        return not load_moondream or self.model is not None
 
-                if self.computer.debug:
-                    print(
-                        "Open Interpreter will use Moondream (tiny vision model) to describe images to the language model. Set `interpreter.llm.vision_renderer = None` to disable this behavior."
-                    )
-                    print(
-                        "Alternatively, you can use a vision-supporting LLM and set `interpreter.llm.supports_vision = True`."
-                    )
-                model_id = "vikhyatk/moondream2"
-                revision = "2024-04-02"
-                print("loading model")
+    def _load_moondream(self):
+        import transformers  # Wait until we use it. Transformers can't be lazy loaded for some reason!
 
-                self.model = transformers.AutoModelForCausalLM.from_pretrained(
-                    model_id, trust_remote_code=True, revision=revision
-                )
-                self.tokenizer = transformers.AutoTokenizer.from_pretrained(
-                    model_id, revision=revision
-                )
-                return True
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+        if self.computer and self.computer.debug:
+            print(
+                "Open Interpreter will use Moondream (tiny vision model) to describe images to the language model. Set `interpreter.llm.vision_renderer = None` to disable this behavior."
+            )
+            print(
+                "Alternatively, you can use a vision-supporting LLM and set `interpreter.llm.supports_vision = True`."
+            )
+        model_id = "vikhyatk/moondream2"
+        revision = "2024-04-02"
+        print("loading model")
+
+        self.model = transformers.AutoModelForCausalLM.from_pretrained(
+            model_id, trust_remote_code=True, revision=revision
+        )
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(
+            model_id, revision=revision
+        )
 
     def ocr(
         self,
@@ -75,7 +117,7 @@ class Vision:
                 # else:
                 #     extension = "png"
                 # Save the base64 content as a temporary file
-                img_data = base64.b64decode(lmc["content"])
+                img_data = image_bytes(lmc["content"])
                 with tempfile.NamedTemporaryFile(
                     delete=False, suffix=".png"
                 ) as temp_file:
@@ -108,9 +150,13 @@ class Vision:
             path = temp_file_path
 
         try:
-            if not self.easyocr:
-                self.load(load_moondream=False)
-            result = self.easyocr.readtext(path)
+            if self.use_service:
+                with open(path, "rb") as f:
+                    return self._get_service().ocr(f.read())
+            with self._ocr_lock:
+                if not self.easyocr:
+                    self.load(load_moondream=False)
+                result = self.easyocr.readtext(path)
             text = " ".join([item[1] for item in result])
             return text.strip()
         except ImportError:
@@ -131,6 +177,11 @@ class Vision:
         Uses Moondream to ask query of the image (which can be a base64, path, or lmc message)
         """
 
+        if self.use_service:
+            return self._get_service().query(
+                self._to_pil(base_64, path, lmc, pil_image), query
+            )
+
         if self.model == None and self.tokenizer == None:
             try:
                 success = self.load(load_easyocr=False)
@@ -142,20 +193,42 @@ class Vision:
             if not success:
                 return ""
 
+        img = self._to_pil(base_64, path, lmc, pil_image)
+
+        return self.query_batch([img], [query])[0]
+
+    def query_batch(self, images, queries):
+        """
+        Asks Moondream one query per image, batching them through the model when it can.
+        """
+        if self.model == None and self.tokenizer == None:
+            if not self.load(load_easyocr=False):
+                return [""] * len(images)
+
+        with self._moondream_lock, contextlib.redirect_stdout(open(os.devnull, "w")):
+            if len(images) > 1 and hasattr(self.model, "batch_answer"):
+                return self.model.batch_answer(
+                    images=images, prompts=queries, tokenizer=self.tokenizer
+                )
+            answers = []
+            for img, query in zip(images, queries):
+                enc_image = self.model.encode_image(img)
+                answers.append(
+                    self.model.answer_question(
+                        enc_image, query, self.tokenizer, max_length=400
+                    )
+                )
+            return answers
+
+    def _to_pil(self, base_64=None, path=None, lmc=None, pil_image=None):
+        img = None
         if lmc:
             if "base64" in lmc["format"]:
-                # # Extract the extension from the format, default to 'png' if not specified
-                # if "." in lmc["format"]:
-                #     extension = lmc["format"].split(".")[-1]
-                # else:
-                #     extension = "png"
-
                 # Decode the base64 image
-                img_data = base64.b64decode(lmc["content"])
+                img_data = image_bytes(lmc["content"])
                 img = Image.open(io.BytesIO(img_data))
 
             elif lmc["format"] == "path":
-                # Convert to base64
                 image_path = lmc["content"]
                 img = Image.open(image_path)
         elif base_64:
@@ -165,11 +238,4 @@ class Vision:
             img = Image.open(path)
         elif pil_image:
             img = pil_image
-
-        with contextlib.redirect_stdout(open(os.devnull, "w")):
-            enc_image = self.model.encode_image(img)
-            answer = self.model.answer_question(
-                enc_image, query, self.tokenizer, max_length=400
-            )
-
-        return answer
+        return img
@@ -0,0 +1,346 @@
+"""
+Runs the local vision models (Moondream and EasyOCR) in a separate worker process.
+
+The worker keeps the models loaded between requests (optionally unloading them after a
+while without use), batches requests that arrive together, and runs them on a pool of
+threads. The interpreter talks to it over a local, authenticated connection
+(`multiprocessing.connection`), so several threads can have requests in flight at once.
+
+    service = VisionService()
+    service.query(image_bytes, "Describe this image.")
+    service.ocr(image_bytes)
+    service.metrics()  # {"queue_depth": 0, "latency_p50": 1.2, ...}
+"""
+
+import collections
+import io
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+from PIL import Image
+
+# How long the worker waits for more requests to join a batch, in seconds
+BATCH_WINDOW = 0.02
+MAX_BATCH_SIZE = 8
+
+
+class VisionServiceError(Exception):
+    pass
+
+
+class VisionService:
+    """
+    Client for the vision worker. Starts the worker process on first use.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        unload_after=None,
+        batch_window=BATCH_WINDOW,
+        max_batch_size=MAX_BATCH_SIZE,
+    ):
+        self.options = {
+            "max_workers": max_workers or min(4, os.cpu_count() or 1),
+            # Seconds without a request before the models are unloaded (None = keep them loaded)
+            "unload_after": unload_after,
+            "batch_window": batch_window,
+            "max_batch_size": max_batch_size,
+        }
+        self.process = None
+        self.connection = None
+        self._send_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._futures = {}
+        self._ids = itertools.count()
+
+    # Public API
+
+    def query(self, image, query, timeout=None):
+        return self.request("query", _to_bytes(image), query, timeout=timeout)
+
+    def ocr(self, image, timeout=None):
+        return self.request("ocr", _to_bytes(image), timeout=timeout)
+
+    def load(self, load_moondream=True, load_easyocr=True, timeout=None):
+        """
+        Loads the models in the worker now, rather than on the first request.
+        """
+        return self.request("load", load_moondream, load_easyocr, timeout=timeout)
+
+    def metrics(self, timeout=None):
+        """
+        Returns queue depth, requests in flight, and latency percentiles (in seconds).
+        """
+        return self.request("metrics", timeout=timeout)
+
+    def request(self, kind, *args, timeout=None):
+        return self.submit(kind, *args).result(timeout=timeout)
+
+    def submit(self, kind, *args):
+        """
+        Sends a request without waiting for it. Returns a Future.
+        """
+        self.start()
+        future = Future()
+        request_id = next(self._ids)
+        self._futures[request_id] = future
+        try:
+            with self._send_lock:
+                self.connection.send((request_id, kind, args))
+        except (OSError, EOFError) as e:
+            self._futures.pop(request_id, None)
+            self._fail_all(VisionServiceError(f"Vision worker is not running: {e}"))
+            raise VisionServiceError(f"Vision worker is not running: {e}")
+        return future
+
+    # Process management
+
+    def start(self):
+        with self._start_lock:
+            if self.process is not None and self.process.is_alive():
+                return
+
+            authkey = os.urandom(32)
+            # Spawn, not fork: the parent may have threads (and torch) running
+            context = multiprocessing.get_context("spawn")
+            parent_end, child_end = context.Pipe()
+            self.process = context.Process(
+                target=serve,
+                args=(child_end, authkey, self.options),
+                daemon=True,
+                name="interpreter-vision",
+            )
+            self.process.start()
+            child_end.close()
+
+            if not parent_end.poll(60):
+                self.process.terminate()
+                raise VisionServiceError("Vision worker didn't start.")
+            address = parent_end.recv()
+            parent_end.close()
+
+            self.connection = Client(address, authkey=authkey)
+            threading.Thread(target=self._receive, daemon=True).start()
+
+    def stop(self):
+        if self.connection is not None:
+            try:
+                with self._send_lock:
+                    self.connection.send((None, "stop", ()))
+            except (OSError, EOFError):
+                pass
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+    def _receive(self):
+        connection = self.connection
+        while True:
+            try:
+                request_id, ok, result = connection.recv()
+            except (OSError, EOFError):
+                self._fail_all(VisionServiceError("Vision worker exited."))
+                return
+            future = self._futures.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(VisionServiceError(result))
+
+    def _fail_all(self, error):
+        for request_id in list(self._futures):
+            future = self._futures.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+
+def _to_bytes(image):
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# Worker process
+
+
+class _Metrics:
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=window)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.latencies.append(latency)
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self, queue_depth):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                "queue_depth": queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "latency_p50": _percentile(latencies, 50),
+                "latency_p95": _percentile(latencies, 95),
+            }
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class _Worker:
+    def __init__(self, options):
+        from .vision import Vision
+
+        self.options = options
+        self.vision = Vision(None)
+        self.vision.use_service = False
+        self.requests = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=options["max_workers"])
+        self.metrics = _Metrics()
+        self.last_used = time.time()
+
+    def handle(self, connection, send_lock):
+        def reply(request_id, ok, result):
+            try:
+                with send_lock:
+                    connection.send((request_id, ok, result))
+            except (OSError, EOFError):
+                pass
+
+        while True:
+            try:
+                request_id, kind, args = connection.recv()
+            except (OSError, EOFError):
+                return
+            if kind == "stop":
+                os._exit(0)
+            if kind == "metrics":
+                reply(request_id, True, self.metrics.snapshot(self.requests.qsize()))
+                continue
+            with self.metrics.lock:
+                self.metrics.in_flight += 1
+            self.requests.put((time.time(), request_id, kind, args, reply))
+
+    def batch_loop(self):
+        while True:
+            try:
+                first = self.requests.get(timeout=1)
+            except queue.Empty:
+                self.maybe_unload()
+                continue
+
+            # Give concurrent requests a moment to arrive, then take them together
+            batch = [first]
+            deadline = time.time() + self.options["batch_window"]
+            while len(batch) < self.options["max_batch_size"]:
+                try:
+                    batch.append(
+                        self.requests.get(timeout=max(0, deadline - time.time()))
+                    )
+                except queue.Empty:
+                    break
+
+            self.last_used = time.time()
+            with self.metrics.lock:
+                self.metrics.batches += 1
+
+            queries = [item for item in batch if item[2] == "query"]
+            if queries:
+                self.pool.submit(self.run_queries, queries)
+            for item in batch:
+                if item[2] != "query":
+                    self.pool.submit(self.run_one, item)
+
+    def run_queries(self, items):
+        try:
+            images = [Image.open(io.BytesIO(item[3][0])) for item in items]
+            prompts = [item[3][1] for item in items]
+            # Moondream generates one batch at a time (query_batch locks). OCR has its own lock,
+            # so it runs alongside
+            answers = self.vision.query_batch(images, prompts)
+            results = [(True, answer) for answer in answers]
+        except Exception as e:
+            results = [(False, f"{type(e).__name__}: {e}")] * len(items)
+        for item, (ok, result) in zip(items, results):
+            self.finish(item, ok, result)
+
+    def run_one(self, item):
+        _, _, kind, args, _ = item
+        try:
+            if kind == "ocr":
+                result = self.vision.ocr(pil_image=Image.open(io.BytesIO(args[0])))
+            elif kind == "load":
+                self.vision.load(load_moondream=args[0], load_easyocr=args[1])
+                result = True
+            else:
+                raise ValueError(f"Unknown request: {kind}")
+            self.finish(item, True, result)
+        except Exception as e:
+            self.finish(item, False, f"{type(e).__name__}: {e}")
+
+    def finish(self, item, ok, result):
+        received, request_id, _, _, reply = item
+        self.metrics.record(time.time() - received, ok)
+        reply(request_id, ok, result)
+
+    def maybe_unload(self):
+        unload_after = self.options["unload_after"]
+        if unload_after is None or time.time() - self.last_used < unload_after:
+            return
+        with self.vision._moondream_lock, self.vision._ocr_lock:
+            if self.vision.model is not None or self.vision.easyocr is not None:
+                self.vision.model = None
+                self.vision.tokenizer = None
+                self.vision.easyocr = None
+                import gc
+
+                gc.collect()
+
+
+def serve(parent_connection, authkey, options):
+    """
+    Entry point of the worker process.
+    """
+    family = "AF_UNIX" if hasattr(os, "fork") else "AF_INET"
+    address = None if family == "AF_UNIX" else ("127.0.0.1", 0)
+    listener = Listener(address, family=family, authkey=authkey)
+    parent_connection.send(listener.address)
+    parent_connection.close()
+
+    worker = _Worker(options)
+    threading.Thread(target=worker.batch_loop, daemon=True).start()
+
+    # There's one client (the interpreter that started us). When it goes away, so do we.
+    connection = listener.accept()
+    worker.handle(connection, threading.Lock())
+    os._exit(0)
@@ -2,6 +2,7 @@
 This file defines the Interpreter class.
 It's the main file. `from interpreter import interpreter` will import an instance of this class.
 """
+import asyncio
 import json
 import os
 import threading
@@ -16,7 +17,10 @@ from ..terminal_interface.utils.oi_dir import oi_dir
 from .computer.computer import Computer
 from .default_system_message import default_system_message
 from .llm.llm import Llm
-from .respond import respond
+from .respond import arespond, respond
+from .utils.blob_store import materialize
+from .utils.conversation_index import ConversationIndex
+from .utils.conversation_store import ConversationStore
 from .utils.telemetry import send_telemetry
 from .utils.truncate_output import truncate_output
 
@@ -82,7 +86,7 @@ class OpenInterpreter:
         plain_text_display=False,
     ):
         # State
-        self.messages = [] if messages is None else messages
+        self._messages = [] if messages is None else messages
         self.responding = False
         self.last_messages_count = 0
 
@@ -110,6 +114,12 @@ class OpenInterpreter:
         self.conversation_history = conversation_history
         self.conversation_filename = conversation_filename
         self.conversation_history_path = conversation_history_path
+        self._conversation_store = None
+        self._conversation_index = None
+        # Save the Python kernel's variables with the conversation, so it can be resumed.
+        # Off by default: it pickles the whole namespace (DataFrames, models...) after
+        # every turn that ran code, and restoring means unpickling, so only for your own
+        self.kernel_snapshots = False
 
         # OS control mode related attributes
         self.os = os
@@ -148,7 +158,18 @@ class OpenInterpreter:
         while self.responding:
             time.sleep(0.2)
         # Return new messages
-        return self.messages[self.last_messages_count :]
+        return materialize(self._messages[self.last_messages_count :])
+
+    @property
+    def messages(self):
+        # Images from code output are kept as BlobRefs while we work (see blob_store.py).
+        # Anyone reading `messages` gets a copy with plain base64 strings, as before. (To
+        # change the conversation, assign to it. Inside the package, use `_messages`)
+        return materialize(self._messages)
+
+    @messages.setter
+    def messages(self, messages):
+        self._messages = messages
 
     @property
     def anonymous_telemetry(self) -> bool:
@@ -193,7 +214,7 @@ class OpenInterpreter:
 
             # Return new messages
             self.responding = False
-            return self.messages[self.last_messages_count :]
+            return materialize(self._messages[self.last_messages_count :])
 
         except GeneratorExit:
             self.responding = False
@@ -214,6 +235,39 @@ class OpenInterpreter:
 
             raise
 
+    def achat(self, message=None, stream=False):
+        """
+        Async version of `chat`, without a display. Streams from the LLM natively
+        (no thread per request), so many conversations can share one event loop.
+
+            messages = await interpreter.achat("Hi")
+            async for chunk in interpreter.achat("Hi", stream=True): ...
+        """
+        if stream:
+            return self._astreaming_chat(message)
+        return self._achat(message)
+
+    async def _achat(self, message):
+        self.responding = True
+        try:
+            async for _ in self._astreaming_chat(message):
+                pass
+            return materialize(self._messages[self.last_messages_count :])
+        finally:
+            self.responding = False
+
+    async def _astreaming_chat(self, message=None):
+        if not (message or message == ""):
+            raise Exception("`interpreter.achat()` requires a message.")
+
+        self._add_message(message)
+
+        async for chunk in self._arespond_and_store():
+            yield materialize(chunk)
+
+        if self.conversation_history:
+            await asyncio.to_thread(self._save_conversation)
+
     def _streaming_chat(self, message=None, display=True):
         # Sometimes a little more code -> a much better experience!
         # Display mode actually runs interpreter.chat(display=False, stream=True) from within the terminal_interface.
@@ -225,75 +279,114 @@ class OpenInterpreter:
 
         # One-off message
         if message or message == "":
-            ## We support multiple formats for the incoming message:
-            # Dict (these are passed directly in)
-            if isinstance(message, dict):
-                if "role" not in message:
-                    message["role"] = "user"
-                self.messages.append(message)
-            # String (we construct a user message dict)
-            elif isinstance(message, str):
-                self.messages.append(
-                    {"role": "user", "type": "message", "content": message}
-                )
-            # List (this is like the OpenAI API)
-            elif isinstance(message, list):
-                self.messages = message
-
-            # Now that the user's messages have been added, we set last_messages_count.
-            # This way we will only return the messages after what they added.
-            self.last_messages_count = len(self.messages)
-
-            # DISABLED because I think we should just not transmit images to non-multimodal models?
-            # REENABLE this when multimodal becomes more common:
-
-            # Make sure we're using a model that can handle this
-            # if not self.llm.supports_vision:
-            #     for message in self.messages:
-            #         if message["type"] == "image":
-            #             raise Exception(
-            #                 "Use a multimodal model and set `interpreter.llm.supports_vision` to True to handle image messages."
-            #             )
+            self._add_message(message)
 
             # This is where it all happens!
-            yield from self._respond_and_store()
+            for chunk in self._respond_and_store():
+                yield materialize(chunk)
 
             # Save conversation if we've turned conversation_history on
             if self.conversation_history:
-                # If it's the first message, set the conversation name
-                if not self.conversation_filename:
-                    first_few_words_list = self.messages[0]["content"][:25].split(" ")
-                    if (
-                        len(first_few_words_list) >= 2
-                    ):  # for languages like English with blank between words
-                        first_few_words = "_".join(first_few_words_list[:-1])
-                    else:  # for languages like Chinese without blank between words
-                        first_few_words = self.messages[0]["content"][:15]
-                    for char in '<>:"/\\|?*!\n':  # Invalid characters for filenames
-                        first_few_words = first_few_words.replace(char, "")
-
-                    date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S")
-                    self.conversation_filename = (
-                        "__".join([first_few_words, date]) + ".json"
-                    )
-
-                # Check if the directory exists, if not, create it
-                if not os.path.exists(self.conversation_history_path):
-                    os.makedirs(self.conversation_history_path)
-                # Write or overwrite the file
-                with open(
-                    os.path.join(
-                        self.conversation_history_path, self.conversation_filename
-                    ),
-                    "w",
-                ) as f:
-                    json.dump(self.messages, f)
+                self._save_conversation()
             return
 
         raise Exception(
             "`interpreter.chat()` requires a display. Set `display=True` or pass a message into `interpreter.chat(message)`."
         )
 
+    def _add_message(self, message):
+        ## We support multiple formats for the incoming message:
+        # Dict (these are passed directly in)
+        if isinstance(message, dict):
+            if "role" not in message:
+                message["role"] = "user"
+            self._messages.append(message)
+        # String (we construct a user message dict)
+        elif isinstance(message, str):
+            self._messages.append(
+                {"role": "user", "type": "message", "content": message}
+            )
+        # List (this is like the OpenAI API)
+        elif isinstance(message, list):
+            self._messages = message
+
+        # Now that the user's messages have been added, we set last_messages_count.
+        # This way we will only return the messages after what they added.
+        self.last_messages_count = len(self._messages)
+
+        # DISABLED because I think we should just not transmit images to non-multimodal models?
+        # REENABLE this when multimodal becomes more common:
+
+        # Make sure we're using a model that can handle this
+        # if not self.llm.supports_vision:
+        #     for message in self._messages:
+        #         if message["type"] == "image":
+        #             raise Exception(
+        #                 "Use a multimodal model and set `interpreter.llm.supports_vision` to True to handle image messages."
+        #             )
+
+    def _save_conversation(self):
+        # If it's the first message, set the conversation name
+        if not self.conversation_filename:
+            first_few_words_list = self._messages[0]["content"][:25].split(" ")
+            if (
+                len(first_few_words_list) >= 2
+            ):  # for languages like English with blank between words
+                first_few_words = "_".join(first_few_words_list[:-1])
+            else:  # for languages like Chinese without blank between words
+                first_few_words = self._messages[0]["content"][:15]
+            for char in '<>:"/\\|?*!\n':  # Invalid characters for filenames
+                first_few_words = first_few_words.replace(char, "")
+
+            date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S")
+            self.conversation_filename = "__".join([first_few_words, date]) + ".jsonl"
+
+        # Conversations used to be saved as one big .json file. Move this one over.
+        old_path = None
+        if self.conversation_filename.endswith(".json"):
+            old_path = os.path.join(
+                self.conversation_history_path, self.conversation_filename
+            )
+            self.conversation_filename += "l"
+
+        path = os.path.join(self.conversation_history_path, self.conversation_filename)
+        if self._conversation_store is None or self._conversation_store.path != path:
+            self._conversation_store = ConversationStore(path)
+
+        # Only appends what's new
+        self._conversation_store.save(self._messages)
+
+        if old_path and os.path.exists(old_path):
+            os.remove(old_path)
+
+        if self.kernel_snapshots:
+            try:
+                self.computer.terminal.snapshot(self._conversation_store.snapshot_path)
+            except Exception:
+                # The conversation is saved either way
+                if self.debug:
+                    raise
+
+        # Keep the index of conversations (for the navigator) up to date
+        try:
+            index = self._get_conversation_index()
+            index.update(self.conversation_filename, self._messages)
+            if old_path:
+                index.remove(os.path.basename(old_path))
+        except Exception:
+            # Only used for finding conversations, not worth failing over
+            if self.debug:
+                raise
+
+    def _get_conversation_index(self):
+        if (
+            self._conversation_index is None
+            or self._conversation_index.conversations_dir
+            != self.conversation_history_path
+        ):
+            self._conversation_index = ConversationIndex(self.conversation_history_path)
+        return self._conversation_index
+
     def _respond_and_store(self):
         """
         Pulls from the respond stream, adding delimiters. Some things, like active_line, console, confirmation... these act specially.
@@ -301,18 +394,7 @@ class OpenInterpreter:
         """
         self.verbose = False
 
-        # Utility function
-        def is_ephemeral(chunk):
-            """
-            Ephemeral = this chunk doesn't contribute to a message we want to save.
-            """
-            if "format" in chunk and chunk["format"] == "active_line":
-                return True
-            if chunk["type"] == "review":
-                return True
-            return False
-
-        last_flag_base = None
+        state = {"last_flag_base": None}
 
         try:
             for chunk in respond(self):
@@ -321,116 +403,137 @@ class OpenInterpreter:
                     print("Open Interpreter stopping.")
                     break
 
-                if chunk["content"] == "":
-                    continue
+                yield from self._store_chunk(chunk, state)
 
-                # If active_line is None, we finished running code.
-                if (
-                    chunk.get("format") == "active_line"
-                    and chunk.get("content", "") == None
-                ):
-                    # If output wasn't yet produced, add an empty output
-                    if self.messages[-1]["role"] != "computer":
-                        self.messages.append(
-                            {
-                                "role": "computer",
-                                "type": "console",
-                                "format": "output",
-                                "content": "",
-                            }
-                        )
-
-                # Handle the special "confirmation" chunk, which neither triggers a flag or creates a message
-                if chunk["type"] == "confirmation":
-                    # Emit a end flag for the last message type, and reset last_flag_base
-                    if last_flag_base:
-                        yield {**last_flag_base, "end": True}
-                        last_flag_base = None
-
-                    if self.auto_run == False:
-                        yield chunk
-
-                    # We want to append this now, so even if content is never filled, we know that the execution didn't produce output.
-                    # ... rethink this though.
-                    # self.messages.append(
-                    #     {
-                    #         "role": "computer",
-                    #         "type": "console",
-                    #         "format": "output",
-                    #         "content": "",
-                    #     }
-                    # )
-                    continue
-
-                # Check if the chunk's role, type, and format (if present) match the last_flag_base
-                if (
-                    last_flag_base
-                    and "role" in chunk
-                    and "type" in chunk
-                    and last_flag_base["role"] == chunk["role"]
-                    and last_flag_base["type"] == chunk["type"]
-                    and (
-                        "format" not in last_flag_base
-                        or (
-                            "format" in chunk
-                            and chunk["format"] == last_flag_base["format"]
-                        )
-                    )
-                ):
-                    # If they match, append the chunk's content to the current message's content
-                    # (Except active_line, which shouldn't be stored)
-                    if not is_ephemeral(chunk):
-                        if any(
-                            [
-                                (property in self.messages[-1])
-                                and (
-                                    self.messages[-1].get(property)
-                                    != chunk.get(property)
-                                )
-                                for property in ["role", "type", "format"]
-                            ]
-                        ):
-                            self.messages.append(chunk)
-                        else:
-                            self.messages[-1]["content"] += chunk["content"]
-                else:
-                    # If they don't match, yield a end message for the last message type and a start message for the new one
-                    if last_flag_base:
-                        yield {**last_flag_base, "end": True}
+            # Yield a final end flag
+            if state["last_flag_base"]:
+                yield {**state["last_flag_base"], "end": True}
+        except GeneratorExit:
+            raise  # gotta pass this up!
 
-                    last_flag_base = {"role": chunk["role"], "type": chunk["type"]}
+    async def _arespond_and_store(self):
+        """
+        Async version of `_respond_and_store`, pulling from `arespond`.
+        """
+        self.verbose = False
+
+        state = {"last_flag_base": None}
+
+        async for chunk in arespond(self):
+            if hasattr(self, "stop_event") and self.stop_event.is_set():
+                print("Open Interpreter stopping.")
+                break
 
-                    # Don't add format to type: "console" flags, to accommodate active_line AND output formats
-                    if "format" in chunk and chunk["type"] != "console":
-                        last_flag_base["format"] = chunk["format"]
+            for output in self._store_chunk(chunk, state):
+                yield output
+
+        if state["last_flag_base"]:
+            yield {**state["last_flag_base"], "end": True}
+
+    def _store_chunk(self, chunk, state):
+        """
+        Handles one chunk from `respond`: yields it (with start/end flags around each new
+        message) and adds it to `self.messages`. `state` carries the current flag between chunks.
+        """
+        if chunk["content"] == "":
+            return
 
-                    yield {**last_flag_base, "start": True}
+        # If active_line is None, we finished running code.
+        if chunk.get("format") == "active_line" and chunk.get("content", "") == None:
+            # If output wasn't yet produced, add an empty output
+            if self._messages[-1]["role"] != "computer":
+                self._messages.append(
+                    {
+                        "role": "computer",
+                        "type": "console",
+                        "format": "output",
+                        "content": "",
+                    }
+                )
 
-                    # Add the chunk as a new message
-                    if not is_ephemeral(chunk):
-                        self.messages.append(chunk)
+        # Handle the special "confirmation" chunk, which neither triggers a flag or creates a message
+        if chunk["type"] == "confirmation":
+            # Emit a end flag for the last message type, and reset last_flag_base
+            if state["last_flag_base"]:
+                yield {**state["last_flag_base"], "end": True}
+                state["last_flag_base"] = None
 
-                # Yield the chunk itself
+            if self.auto_run == False:
                 yield chunk
 
-                # Truncate output if it's console output
-                if chunk["type"] == "console" and chunk["format"] == "output":
-                    self.messages[-1]["content"] = truncate_output(
-                        self.messages[-1]["content"],
-                        self.max_output,
-                        add_scrollbars=self.computer.import_computer_api,  # I consider scrollbars to be a computer API thing
-                    )
+            # We want to append this now, so even if content is never filled, we know that the execution didn't produce output.
+            # ... rethink this though.
+            # self._messages.append(
+            #     {
+            #         "role": "computer",
+            #         "type": "console",
+            #         "format": "output",
+            #         "content": "",
+            #     }
+            # )
+            return
 
-            # Yield a final end flag
-            if last_flag_base:
-                yield {**last_flag_base, "end": True}
-        except GeneratorExit:
-            raise  # gotta pass this up!
+        # Check if the chunk's role, type, and format (if present) match the last_flag_base
+        if (
+            state["last_flag_base"]
+            and "role" in chunk
+            and "type" in chunk
+            and state["last_flag_base"]["role"] == chunk["role"]
+            and state["last_flag_base"]["type"] == chunk["type"]
+            and (
+                "format" not in state["last_flag_base"]
+                or (
+                    "format" in chunk
+                    and chunk["format"] == state["last_flag_base"]["format"]
+                )
+            )
+        ):
+            # If they match, append the chunk's content to the current message's content
+            # (Except active_line, which shouldn't be stored)
+            if not is_ephemeral(chunk):
+                if chunk["type"] in ["image", "data"] or any(
+                    [
+                        (property in self._messages[-1])
+                        and (self._messages[-1].get(property) != chunk.get(property))
+                        for property in ["role", "type", "format"]
+                    ]
+                ):
+                    # (Images and data always arrive whole, so another one is another message)
+                    self._messages.append(chunk)
+                else:
+                    self._messages[-1]["content"] += chunk["content"]
+        else:
+            # If they don't match, yield a end message for the last message type and a start message for the new one
+            if state["last_flag_base"]:
+                yield {**state["last_flag_base"], "end": True}
+
+            state["last_flag_base"] = {"role": chunk["role"], "type": chunk["type"]}
+
+            # Don't add format to type: "console" flags, to accommodate active_line AND output formats
+            if "format" in chunk and chunk["type"] != "console":
+                state["last_flag_base"]["format"] = chunk["format"]
+
+            yield {**state["last_flag_base"], "start": True}
+
+            # Add the chunk as a new message
+            if not is_ephemeral(chunk):
+                self._messages.append(chunk)
+
+        # Yield the chunk itself
+        yield chunk
+
+        # Truncate output if it's console output
+        if chunk["type"] == "console" and chunk["format"] == "output":
+            self._messages[-1]["content"] = truncate_output(
+                self._messages[-1]["content"],
+                self.max_output,
+                add_scrollbars=self.computer.import_computer_api,  # I consider scrollbars to be a computer API thing
+            )
 
     def reset(self):
         self.computer.terminate()  # Terminates all languages
         self.computer._has_imported_computer_api = False  # Flag reset
-        self.messages = []
+        self._messages = []
         self.last_messages_count = 0
 
     def display_message(self, markdown):
@@ -443,3 +546,14 @@ class OpenInterpreter:
     def get_oi_dir(self):
         # Again, just handy for start_script in profiles.
         return oi_dir
+
+
+def is_ephemeral(chunk):
+    """
+    Ephemeral = this chunk doesn't contribute to a message we want to save.
+    """
+    if "format" in chunk and chunk["format"] == "active_line":
+        return True
+    if chunk["type"] == "review":
+        return True
+    return False
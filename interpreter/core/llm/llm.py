@@ -8,6 +8,8 @@ import litellm
 litellm.suppress_debug_info = True
 litellm.REPEATED_STREAMING_CHUNK_LIMIT = 99999999
 
+import asyncio
+import concurrent.futures
 import json
 import logging
 import subprocess
@@ -17,11 +19,16 @@ import uuid
 import requests
 import tokentrim as tt
 
-from .run_text_llm import run_text_llm
+from ...terminal_interface.utils.count_tokens import messages_tokens
+from ...terminal_interface.utils.oi_dir import oi_dir
+from ..computer.vision.description_cache import DescriptionCache
+from .run_text_llm import arun_text_llm, run_text_llm
 
 # from .run_function_calling_llm import run_function_calling_llm
-from .run_tool_calling_llm import run_tool_calling_llm
+from .run_tool_calling_llm import arun_tool_calling_llm, run_tool_calling_llm
 from .utils.convert_to_openai_messages import convert_to_openai_messages
+from .utils.image_retention import retain_images
+from .utils.image_sizing import image_budget
 
 # Create or get the logger
 logger = logging.getLogger("LiteLLM")
@@ -49,6 +56,7 @@ class Llm:
 
         # OpenAI-compatible chat completions "endpoint"
         self.completions = fixed_litellm_completions
+        self.acompletions = fixed_litellm_acompletions
 
         # Settings
         self.model = "gpt-4o"
@@ -58,6 +66,18 @@ class Llm:
         self.vision_renderer = (
             self.interpreter.computer.vision.query
         )  # Will only use if supports_vision is False
+        # Reuse descriptions of images we've seen before (stored in oi_dir)
+        self.cache_image_descriptions = True
+        self._description_cache = None
+
+        # Per-model image size limits, checked before the defaults in utils/image_sizing.py.
+        # e.g. {"my-model*": {"max_side": 1024, "max_pixels": 1_000_000, "max_bytes": 4 * 1024 * 1024}}
+        self.image_budgets = {}
+
+        # How many tokens of images to send. Newest images are sent in full, older ones
+        # are degraded (low detail -> thumbnail -> description) to stay under this.
+        self.image_token_budget = 2000
+        self.image_retention_policy = retain_images
 
         self.supports_functions = None  # Will try to auto-detect
         self.execution_instructions = "To execute code on the user's machine, write a markdown code block. Specify the language after the ```. You will receive the output. Use any programming language."  # If supports_functions is False, this will be added to the system message
@@ -81,6 +101,33 @@ class Llm:
 
         And then processing its output, whether it's a function or non function calling model, into LMC format.
         """
+        params = self._prepare_request(messages)
+
+        if self.supports_functions:
+            # yield from run_function_calling_llm(self, params)
+            yield from run_tool_calling_llm(self, params)
+        else:
+            yield from run_text_llm(self, params)
+
+    async def arun(self, messages):
+        """
+        Async version of `run`. Streams from `llm.acompletions` (litellm.acompletion), so one event loop
+        can drive many conversations at once.
+        """
+        # Preparing the request can block (loading the model, describing images), so do it off the loop
+        params = await asyncio.to_thread(self._prepare_request, messages)
+
+        if self.supports_functions:
+            stream = arun_tool_calling_llm(self, params)
+        else:
+            stream = arun_text_llm(self, params)
+        async for chunk in stream:
+            yield chunk
+
+    def _prepare_request(self, messages):
+        """
+        Turns LMC messages into the params for a completions call.
+        """
 
         if not self._is_loaded:
             self.load()
@@ -146,58 +193,27 @@ class Llm:
         # Trim image messages if they're there
         image_messages = [msg for msg in messages if msg["type"] == "image"]
         if self.supports_vision:
-            if self.interpreter.os:
-                # Keep only the last two images if the interpreter is running in OS mode
-                if len(image_messages) > 1:
-                    for img_msg in image_messages[:-2]:
-                        messages.remove(img_msg)
-                        if self.interpreter.verbose:
-                            print("Removing image message!")
-            else:
-                # Delete all the middle ones (leave only the first and last 2 images) from messages_for_llm
-                if len(image_messages) > 3:
-                    for img_msg in image_messages[1:-2]:
-                        messages.remove(img_msg)
-                        if self.interpreter.verbose:
-                            print("Removing image message!")
-                # Idea: we could set detail: low for the middle messages, instead of deleting them
+            # Fit images into the image token budget, degrading older ones
+            if self.image_retention_policy:
+                messages = self.image_retention_policy(messages, self)
         elif self.supports_vision == False and self.vision_renderer:
-            for img_msg in image_messages:
-                if img_msg["format"] != "description":
-                    self.interpreter.display_message("\n  *Viewing image...*\n")
-
-                    if img_msg["format"] == "path":
-                        precursor = f"The image I'm referring to ({img_msg['content']}) contains the following: "
-                        if self.interpreter.computer.import_computer_api:
-                            postcursor = f"\nIf you want to ask questions about the image, run `computer.vision.query(path='{img_msg['content']}', query='(ask any question here)')` and a vision AI will answer it."
-                        else:
-                            postcursor = ""
-                    else:
-                        precursor = "Imagine I have just shown you an image with this description: "
-                        postcursor = ""
-
-                    try:
-                        image_description = self.vision_renderer(lmc=img_msg)
-                        ocr = self.interpreter.computer.vision.ocr(lmc=img_msg)
-
-                        # It would be nice to format this as a message to the user and display it like: "I see: image_description"
-
-                        img_msg["content"] = (
-                            precursor
-                            + image_description
-                            + "\n---\nI've OCR'd the image, this is the result (this may or may not be relevant. If it's not relevant, ignore this): '''\n"
-                            + ocr
-                            + "\n'''"
-                            + postcursor
-                        )
-                        img_msg["format"] = "description"
-
-                    except ImportError:
-                        print(
-                            "\nTo use local vision, run `pip install 'open-interpreter[local]'`.\n"
-                        )
-                        img_msg["format"] = "description"
-                        img_msg["content"] = ""
+            to_render = [
+                img_msg
+                for img_msg in image_messages
+                if img_msg["format"] != "description"
+            ]
+            for img_msg in to_render:
+                self.interpreter.display_message("\n  *Viewing image...*\n")
+
+            # Render the images concurrently (the vision service batches these together)
+            if len(to_render) > 1:
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(len(to_render), 4)
+                ) as executor:
+                    list(executor.map(self._render_image, to_render))
+            else:
+                for img_msg in to_render:
+                    self._render_image(img_msg)
 
         # Convert to OpenAI messages format
         messages = convert_to_openai_messages(
@@ -206,14 +222,30 @@ class Llm:
             vision=self.supports_vision,
             shrink_images=self.interpreter.shrink_images,
             interpreter=self.interpreter,
+            image_budget=image_budget(model, self.image_budgets),
         )
 
         system_message = messages[0]["content"]
         messages = messages[1:]
 
         # Trim messages
+        if self.context_window and self.max_tokens:
+            token_limit = self.context_window - self.max_tokens - 25
+        else:
+            token_limit = self.context_window
+
         try:
-            if self.context_window and self.max_tokens:
+            if token_limit and (
+                messages_tokens(
+                    [{"role": "system", "content": system_message}] + messages,
+                    model=model,
+                    overhead=True,
+                )
+                <= token_limit
+            ):
+                # Already fits. Trimming would tokenize everything again for nothing.
+                messages = [{"role": "system", "content": system_message}] + messages
+            elif self.context_window and self.max_tokens:
                 trim_to_be_this_many_tokens = (
                     self.context_window - self.max_tokens - 25
                 )  # arbitrary buffer
@@ -317,11 +349,7 @@ Continuing...
                 print("\n")
             print("\n\n\n")
 
-        if self.supports_functions:
-            # yield from run_function_calling_llm(self, params)
-            yield from run_tool_calling_llm(self, params)
-        else:
-            yield from run_text_llm(self, params)
+        return params
 
     # If you change model, set _is_loaded to false
     @property
@@ -333,6 +361,68 @@ Continuing...
         self._model = value
         self._is_loaded = False
 
+    def _get_description_cache(self):
+        if not self.cache_image_descriptions:
+            return None
+        if self._description_cache is None:
+            self._description_cache = DescriptionCache(
+                os.path.join(oi_dir, "image_descriptions")
+            )
+        return self._description_cache
+
+    def _render_image(self, img_msg):
+        """
+        Replaces an image message with a text description of it, for non-vision models.
+        """
+        if img_msg["format"] == "path":
+            precursor = f"The image I'm referring to ({img_msg['content']}) contains the following: "
+            if self.interpreter.computer.import_computer_api:
+                postcursor = f"\nIf you want to ask questions about the image, run `computer.vision.query(path='{img_msg['content']}', query='(ask any question here)')` and a vision AI will answer it."
+            else:
+                postcursor = ""
+        else:
+            precursor = "Imagine I have just shown you an image with this description: "
+            postcursor = ""
+
+        try:
+            cache = self._get_description_cache()
+            key = None
+            cached = None
+            if cache:
+                renderer = getattr(
+                    self.vision_renderer, "__qualname__", repr(self.vision_renderer)
+                )
+                key = cache.key(img_msg, renderer)
+                cached = cache.get(key)
+
+            if cached:
+                image_description = cached["description"]
+                ocr = cached["ocr"]
+            else:
+                image_description = self.vision_renderer(lmc=img_msg)
+                ocr = self.interpreter.computer.vision.ocr(lmc=img_msg)
+                if cache and image_description:
+                    cache.set(key, image_description, ocr)
+
+            # It would be nice to format this as a message to the user and display it like: "I see: image_description"
+
+            img_msg["content"] = (
+                precursor
+                + image_description
+                + "\n---\nI've OCR'd the image, this is the result (this may or may not be relevant. If it's not relevant, ignore this): '''\n"
+                + ocr
+                + "\n'''"
+                + postcursor
+            )
+            img_msg["format"] = "description"
+
+        except ImportError:
+            print(
+                "\nTo use local vision, run `pip install 'open-interpreter[local]'`.\n"
+            )
+            img_msg["format"] = "description"
+            img_msg["content"] = ""
+
     def load(self):
         if self._is_loaded:
             return
@@ -413,12 +503,7 @@ Continuing...
                 pass
 
 
-def fixed_litellm_completions(**params):
-    """
-    Just uses a dummy API key, since we use litellm without an API key sometimes.
-    Hopefully they will fix this!
-    """
-
+def _prepare_completion_params(params):
     if "local" in params.get("model"):
         # Kinda hacky, but this helps sometimes
         params["stop"] = ["<|assistant|>", "<|end|>", "<|eot_id|>"]
@@ -432,12 +517,39 @@ def fixed_litellm_completions(**params):
 
     params["model"] = params["model"].replace(":latest", "")
 
+    params["num_retries"] = 0
+
+
+def _adjust_after_error(e, attempt, params):
+    """
+    Tweaks `params` before we try a failed completion again.
+    """
+    if (
+        isinstance(e, litellm.exceptions.AuthenticationError)
+        and "api_key" not in params
+    ):
+        print(
+            "LiteLLM requires an API key. Trying again with a dummy API key. In the future, if this fixes it, please set a dummy API key to prevent this message. (e.g `interpreter --api_key x` or `self.api_key = 'x'`)"
+        )
+        # So, let's try one more time with a dummy API key:
+        params["api_key"] = "x"
+    if attempt == 1:
+        # Try turning up the temperature?
+        params["temperature"] = params.get("temperature", 0.0) + 0.1
+
+
+def fixed_litellm_completions(**params):
+    """
+    Just uses a dummy API key, since we use litellm without an API key sometimes.
+    Hopefully they will fix this!
+    """
+
+    _prepare_completion_params(params)
+
     # Run completion
     attempts = 4
     first_error = None
 
-    params["num_retries"] = 0
-
     for attempt in range(attempts):
         try:
             yield from litellm.completion(**params)
@@ -449,18 +561,32 @@ def fixed_litellm_completions(**params):
             if attempt == 0:
                 # Store the first error
                 first_error = e
-            if (
-                isinstance(e, litellm.exceptions.AuthenticationError)
-                and "api_key" not in params
-            ):
-                print(
-                    "LiteLLM requires an API key. Trying again with a dummy API key. In the future, if this fixes it, please set a dummy API key to prevent this message. (e.g `interpreter --api_key x` or `self.api_key = 'x'`)"
-                )
-                # So, let's try one more time with a dummy API key:
-                params["api_key"] = "x"
-            if attempt == 1:
-                # Try turning up the temperature?
-                params["temperature"] = params.get("temperature", 0.0) + 0.1
+            _adjust_after_error(e, attempt, params)
 
     if first_error is not None:
         raise first_error  # If all attempts fail, raise the first error
+
+
+async def fixed_litellm_acompletions(**params):
+    """
+    Async version of `fixed_litellm_completions`, using litellm.acompletion.
+    """
+
+    _prepare_completion_params(params)
+
+    attempts = 4
+    first_error = None
+
+    for attempt in range(attempts):
+        try:
+            response = await litellm.acompletion(**params)
+            async for chunk in response:
+                yield chunk
+            return
+        except Exception as e:
+            if attempt == 0:
+                first_error = e
+            _adjust_after_error(e, attempt, params)
+
+    if first_error is not None:
+        raise first_error
@@ -1,55 +1,65 @@
-def run_text_llm(llm, params):
-    ## Setup
-
+def setup_text_llm(llm, params):
     if llm.execution_instructions:
         try:
             # Add the system message
-            params["messages"][0][
-                "content"
-            ] += "\n" + llm.execution_instructions
+            params["messages"][0]["content"] += "\n" + llm.execution_instructions
         except:
             print('params["messages"][0]', params["messages"][0])
             raise
 
-    ## Convert output to LMC format
 
-    inside_code_block = False
-    accumulated_block = ""
-    language = None
+class TextLlmParser:
+    """
+    Converts a text-only model's completion chunks into LMC chunks, pulling code out of markdown blocks.
+    Feed it one completion chunk at a time. `done` is set once the first code block is closed.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.inside_code_block = False
+        self.accumulated_block = ""
+        self.language = None
+        self.done = False
+
+    def feed(self, chunk):
+        return list(self._feed(chunk))
+
+    def _feed(self, chunk):
+        llm = self.llm
 
-    for chunk in llm.completions(**params):
         if llm.interpreter.verbose:
             print("Chunk in coding_llm", chunk)
 
         if "choices" not in chunk or len(chunk["choices"]) == 0:
             # This happens sometimes
-            continue
+            return
 
         content = chunk["choices"][0]["delta"].get("content", "")
 
         if content == None:
-            continue
+            return
 
-        accumulated_block += content
+        self.accumulated_block += content
 
-        if accumulated_block.endswith("`"):
+        if self.accumulated_block.endswith("`"):
             # We might be writing "```" one token at a time.
-            continue
+            return
 
         # Did we just enter a code block?
-        if "```" in accumulated_block and not inside_code_block:
-            inside_code_block = True
-            accumulated_block = accumulated_block.split("```")[1]
+        if "```" in self.accumulated_block and not self.inside_code_block:
+            self.inside_code_block = True
+            self.accumulated_block = self.accumulated_block.split("```")[1]
 
         # Did we just exit a code block?
-        if inside_code_block and "```" in accumulated_block:
+        if self.inside_code_block and "```" in self.accumulated_block:
+            self.done = True
             return
 
         # If we're in a code block,
-        if inside_code_block:
+        if self.inside_code_block:
             # If we don't have a `language`, find it
-            if language is None and "\n" in accumulated_block:
-                language = accumulated_block.split("\n")[0]
+            if self.language is None and "\n" in self.accumulated_block:
+                language = self.accumulated_block.split("\n")[0]
 
                 # Default to python if not specified
                 if language == "":
@@ -62,14 +72,46 @@ def run_text_llm(llm, params):
                     # Removes hallucinations containing spaces or non letters.
                     language = "".join(char for char in language if char.isalpha())
 
+                self.language = language
+
             # If we do have a `language`, send it out
-            if language:
+            if self.language:
                 yield {
                     "type": "code",
-                    "format": language,
-                    "content": content.replace(language, ""),
+                    "format": self.language,
+                    "content": content.replace(self.language, ""),
                 }
 
         # If we're not in a code block, send the output as a message
-        if not inside_code_block:
+        if not self.inside_code_block:
             yield {"type": "message", "content": content}
+
+
+def run_text_llm(llm, params):
+    ## Setup
+
+    setup_text_llm(llm, params)
+
+    ## Convert output to LMC format
+
+    parser = TextLlmParser(llm)
+
+    for chunk in llm.completions(**params):
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+
+
+async def arun_text_llm(llm, params):
+    """
+    Async version of `run_text_llm`, streaming from `llm.acompletions`.
+    """
+    setup_text_llm(llm, params)
+
+    parser = TextLlmParser(llm)
+
+    async for chunk in llm.acompletions(**params):
+        for lmc_chunk in parser.feed(chunk):
+            yield lmc_chunk
+        if parser.done:
+            return
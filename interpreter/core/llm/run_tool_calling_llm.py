@@ -98,9 +98,7 @@ def process_messages(messages):
     return processed_messages
 
 
-def run_tool_calling_llm(llm, request_params):
-    ## Setup
-
+def setup_tool_calling_llm(llm, request_params):
     # Add languages OI has access to
     tool_schema["function"]["parameters"]["properties"]["language"]["enum"] = [
         i.name.lower() for i in llm.interpreter.computer.terminal.languages
@@ -165,26 +163,38 @@ def run_tool_calling_llm(llm, request_params):
     #     "content"
     # ] += "\nUse ONLY the function you have been provided with — 'execute(language, code)'."
 
-    ## Convert output to LMC format
 
-    accumulated_deltas = {}
-    language = None
-    code = ""
-    function_call_detected = False
-    accumulated_review = ""
-    review_category = None
-    buffer = ""
+class ToolCallingLlmParser:
+    """
+    Converts a tool-calling model's completion chunks into LMC chunks.
+    Feed it one completion chunk at a time, then call `finish()`.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.accumulated_deltas = {}
+        self.language = None
+        self.code = ""
+        self.function_call_detected = False
+        self.accumulated_review = ""
+        self.review_category = None
+        self.buffer = ""
+
+    def feed(self, chunk):
+        return list(self._feed(chunk))
+
+    def _feed(self, chunk):
+        llm = self.llm
 
-    for chunk in llm.completions(**request_params):
         if "choices" not in chunk or len(chunk["choices"]) == 0:
             # This happens sometimes
-            continue
+            return
 
         delta = chunk["choices"][0]["delta"]
 
         # Convert tool call into function call, which we have great parsing logic for below
         if "tool_calls" in delta and delta["tool_calls"]:
-            function_call_detected = True
+            self.function_call_detected = True
 
             # import pdb; pdb.set_trace()
             if len(delta["tool_calls"]) > 0 and delta["tool_calls"][0].function:
@@ -197,25 +207,26 @@ def run_tool_calling_llm(llm, request_params):
                 }
 
         # Accumulate deltas
-        accumulated_deltas = merge_deltas(accumulated_deltas, delta)
+        self.accumulated_deltas = merge_deltas(self.accumulated_deltas, delta)
+        accumulated_deltas = self.accumulated_deltas
 
         if "content" in delta and delta["content"]:
-            if function_call_detected:
+            if self.function_call_detected:
                 # More content after a code block? This is a code review by a judge layer.
 
                 # print("Code safety review:", delta["content"])
 
-                if review_category == None:
-                    accumulated_review += delta["content"]
+                if self.review_category == None:
+                    self.accumulated_review += delta["content"]
 
-                    if "<unsafe>" in accumulated_review:
-                        review_category = "unsafe"
-                    if "<warning>" in accumulated_review:
-                        review_category = "warning"
-                    if "<safe>" in accumulated_review:
-                        review_category = "safe"
+                    if "<unsafe>" in self.accumulated_review:
+                        self.review_category = "unsafe"
+                    if "<warning>" in self.accumulated_review:
+                        self.review_category = "warning"
+                    if "<safe>" in self.accumulated_review:
+                        self.review_category = "safe"
 
-                if review_category != None:
+                if self.review_category != None:
                     for tag in [
                         "<safe>",
                         "</safe>",
@@ -226,23 +237,23 @@ def run_tool_calling_llm(llm, request_params):
                     ]:
                         delta["content"] = delta["content"].replace(tag, "")
 
-                    if re.search("</.*>$", accumulated_review):
-                        buffer += delta["content"]
-                        continue
-                    elif buffer:
+                    if re.search("</.*>$", self.accumulated_review):
+                        self.buffer += delta["content"]
+                        return
+                    elif self.buffer:
                         yield {
                             "type": "review",
-                            "format": review_category,
-                            "content": buffer + delta["content"],
+                            "format": self.review_category,
+                            "content": self.buffer + delta["content"],
                         }
-                        buffer = ""
+                        self.buffer = ""
                     else:
                         yield {
                             "type": "review",
-                            "format": review_category,
+                            "format": self.review_category,
                             "content": delta["content"],
                         }
-                        buffer = ""
+                        self.buffer = ""
 
             else:
                 yield {"type": "message", "content": delta["content"]}
@@ -255,18 +266,20 @@ def run_tool_calling_llm(llm, request_params):
                 or accumulated_deltas["function_call"]["name"] == "functions"
             )
         ):
-            if language is None:
-                language = "python"
+            if self.language is None:
+                self.language = "python"
 
             # Pull the code string straight out of the "arguments" string
-            code_delta = accumulated_deltas["function_call"]["arguments"][len(code) :]
+            code_delta = accumulated_deltas["function_call"]["arguments"][
+                len(self.code) :
+            ]
             # Update the code
-            code = accumulated_deltas["function_call"]["arguments"]
+            self.code = accumulated_deltas["function_call"]["arguments"]
             # Yield the delta
             if code_delta:
                 yield {
                     "type": "code",
-                    "format": language,
+                    "format": self.language,
                     "content": code_delta,
                 }
 
@@ -281,35 +294,66 @@ def run_tool_calling_llm(llm, request_params):
 
                 if arguments:
                     if (
-                        language is None
+                        self.language is None
                         and "language" in arguments
                         and "code"
                         in arguments  # <- This ensures we're *finished* typing language, as opposed to partially done
                         and arguments["language"]
                     ):
-                        language = arguments["language"]
+                        self.language = arguments["language"]
 
-                    if language is not None and "code" in arguments:
+                    if self.language is not None and "code" in arguments:
                         # Calculate the delta (new characters only)
-                        code_delta = arguments["code"][len(code) :]
+                        code_delta = arguments["code"][len(self.code) :]
                         # Update the code
-                        code = arguments["code"]
+                        self.code = arguments["code"]
                         # Yield the delta
                         if code_delta:
                             yield {
                                 "type": "code",
-                                "format": language,
+                                "format": self.language,
                                 "content": code_delta,
                             }
                 else:
                     if llm.interpreter.verbose:
                         print("Arguments not a dict.")
 
-    if os.getenv("INTERPRETER_REQUIRE_AUTHENTICATION", "False").lower() == "true":
-        print("function_call_detected", function_call_detected)
-        print("accumulated_review", accumulated_review)
-        if function_call_detected and not accumulated_review:
-            print("WTF!!!!!!!!!")
-            # import pdb
-            # pdb.set_trace()
-            raise Exception("Judge layer required but did not run.")
+    def finish(self):
+        if os.getenv("INTERPRETER_REQUIRE_AUTHENTICATION", "False").lower() == "true":
+            print("function_call_detected", self.function_call_detected)
+            print("accumulated_review", self.accumulated_review)
+            if self.function_call_detected and not self.accumulated_review:
+                print("WTF!!!!!!!!!")
+                # import pdb
+                # pdb.set_trace()
+                raise Exception("Judge layer required but did not run.")
+
+
+def run_tool_calling_llm(llm, request_params):
+    ## Setup
+
+    setup_tool_calling_llm(llm, request_params)
+
+    ## Convert output to LMC format
+
+    parser = ToolCallingLlmParser(llm)
+
+    for chunk in llm.completions(**request_params):
+        yield from parser.feed(chunk)
+
+    parser.finish()
+
+
+async def arun_tool_calling_llm(llm, request_params):
+    """
+    Async version of `run_tool_calling_llm`, streaming from `llm.acompletions`.
+    """
+    setup_tool_calling_llm(llm, request_params)
+
+    parser = ToolCallingLlmParser(llm)
+
+    async for chunk in llm.acompletions(**request_params):
+        for lmc_chunk in parser.feed(chunk):
+            yield lmc_chunk
+
+    parser.finish()
@@ -1,9 +1,7 @@
 import base64
-import io
 import json
-import sys
 
-from PIL import Image
+from .image_sizing import DEFAULT_IMAGE_BUDGETS, fit_image
 
 
 def convert_to_openai_messages(
@@ -12,11 +10,15 @@ def convert_to_openai_messages(
     vision=False,
     shrink_images=True,
     interpreter=None,
+    image_budget=None,
 ):
     """
     Converts LMC messages into OpenAI messages
+
+    `image_budget` says how big images can be for this model (see image_sizing.py).
     """
     new_messages = []
+    budget = image_budget or DEFAULT_IMAGE_BUDGETS["*"]
 
     # if function_calling == False:
     #     prev_message = None
@@ -128,6 +130,7 @@ def convert_to_openai_messages(
                     else:
                         extension = "png"
 
+                    # (Usually a BlobRef. It's turned into base64 at the end, for the data URL)
                     encoded_string = message["content"]
 
                 elif message["format"] == "path":
@@ -150,64 +153,32 @@ def convert_to_openai_messages(
                             f"Unrecognized image format: {message['format']}"
                         )
 
-                content = f"data:image/{extension};base64,{encoded_string}"
-
                 if shrink_images:
-                    # Shrink to less than 5mb
-
-                    # Calculate size
-                    content_size_bytes = sys.getsizeof(str(content))
-
-                    # Convert the size to MB
-                    content_size_mb = content_size_bytes / (1024 * 1024)
-
-                    # If the content size is greater than 5 MB, resize the image
-                    if content_size_mb > 5:
-                        # Decode the base64 image
-                        img_data = base64.b64decode(encoded_string)
-                        img = Image.open(io.BytesIO(img_data))
-
-                        # Run in a loop to make SURE it's less than 5mb
-                        for _ in range(10):
-                            # Calculate the scale factor needed to reduce the image size to 4.9 MB
-                            scale_factor = (4.9 / content_size_mb) ** 0.5
-
-                            # Calculate the new dimensions
-                            new_width = int(img.width * scale_factor)
-                            new_height = int(img.height * scale_factor)
-
-                            # Resize the image
-                            img = img.resize((new_width, new_height))
-
-                            # Convert the image back to base64
-                            buffered = io.BytesIO()
-                            img.save(buffered, format=extension)
-                            encoded_string = base64.b64encode(
-                                buffered.getvalue()
-                            ).decode("utf-8")
-
-                            # Set the content
-                            content = f"data:image/{extension};base64,{encoded_string}"
-
-                            # Recalculate the size of the content in bytes
-                            content_size_bytes = sys.getsizeof(str(content))
-
-                            # Convert the size to MB
-                            content_size_mb = content_size_bytes / (1024 * 1024)
+                    # Scale it to what the model will actually use (and under its size limit)
+                    try:
+                        encoded_string, extension = fit_image(
+                            encoded_string, extension, budget
+                        )
+                    except Exception as e:
+                        print(
+                            "Attempted to shrink the image but failed. Sending to the LLM anyway."
+                        )
+                        if interpreter and interpreter.debug:
+                            print(e)
 
-                            if content_size_mb < 5:
-                                break
-                        else:
-                            print(
-                                "Attempted to shrink the image but failed. Sending to the LLM anyway."
-                            )
+                content = f"data:image/{extension};base64,{str(encoded_string)}"
 
                 new_message = {
                     "role": "user",
                     "content": [
                         {
                             "type": "image_url",
-                            "image_url": {"url": content, "detail": "low"},
+                            "image_url": {
+                                "url": content,
+                                "detail": message.get(
+                                    "detail", budget.get("detail", "low")
+                                ),
+                            },
                         }
                     ],
                 }
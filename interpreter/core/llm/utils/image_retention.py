@@ -0,0 +1,259 @@
+"""
+Decides how much of each image in the conversation to send to a vision model.
+
+Instead of dropping all but the last few images, we give images a token budget and spend
+it newest first. Once an image can't fit at full quality it's degraded, one step at a
+time: full -> low detail (a 512px version, for models that have no such setting) ->
+thumbnail -> a text description. Older images never end up better off than newer ones.
+
+Set `interpreter.llm.image_retention_policy` to your own function (same signature as
+`retain_images`) to change this.
+"""
+
+import base64
+import collections
+import hashlib
+import io
+import math
+import threading
+
+from PIL import Image
+
+from ...utils.blob_store import BlobRef, image_bytes
+from .image_sizing import image_budget, image_size, target_scale
+
+LEVELS = ["full", "low", "thumbnail", "description"]
+
+THUMBNAIL_SIDE = 256
+
+# Longest side of a "low" image, for models without a low detail setting
+LOW_DETAIL_SIDE = 512
+
+# OpenAI's price for a "low" detail image, or one 512px tile of a "high" detail one
+OPENAI_BASE_TOKENS = 85
+OPENAI_TILE_TOKENS = 170
+
+
+def estimate_image_tokens(width, height, detail=None, model=None):
+    """
+    Rough number of tokens an image of this size costs.
+
+    OpenAI charges per 512px tile (or a flat 85 at low detail). Anthropic, and as a decent
+    guess everyone else, charges about one token per 750 pixels.
+    """
+    if not width or not height:
+        return OPENAI_BASE_TOKENS
+    if honors_detail(model):
+        if detail == "low":
+            return OPENAI_BASE_TOKENS
+        # Fit in 2048x2048, then shortest side to 768
+        scale = min(1, 2048 / max(width, height))
+        scale = min(scale, 768 / (min(width, height) * scale)) * scale
+        tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+        return OPENAI_BASE_TOKENS + OPENAI_TILE_TOKENS * tiles
+    if detail == "low":
+        # No such thing elsewhere, so we send a small version (see degrade_image)
+        scale = min(1, LOW_DETAIL_SIDE / max(width, height))
+        return math.ceil(width * height * scale**2 / 750)
+    return math.ceil(width * height / 750)
+
+
+def honors_detail(model):
+    """
+    Whether the model's API has a "detail" setting for images (OpenAI's).
+    """
+    model = (model or "").lower()
+    return "gpt" in model or model.startswith(("openai/", "azure/", "o1"))
+
+
+def retain_images(messages, llm):
+    """
+    Returns `messages` with older images degraded to fit `llm.image_token_budget`.
+    The messages passed in aren't modified; changed image messages are copies.
+    """
+    token_budget = llm.image_token_budget
+    if token_budget is None:
+        return messages
+
+    model = llm.model
+    budget = image_budget(model, llm.image_budgets)
+    verbose = llm.interpreter.verbose
+
+    image_positions = [
+        i
+        for i, message in enumerate(messages)
+        if message["type"] == "image" and message.get("format") != "description"
+    ]
+    if not image_positions:
+        return messages
+
+    messages = list(messages)
+    remaining = token_budget
+    level = 0  # Quality only ever drops as we move to older images
+
+    for position in reversed(image_positions):
+        message = messages[position]
+        width, height = _message_size(message)
+        if width:
+            scale = target_scale(width, height, budget)
+            width, height = int(width * scale), int(height * scale)
+
+        costs = {
+            "full": estimate_image_tokens(
+                width, height, message.get("detail", budget.get("detail")), model
+            ),
+            "low": estimate_image_tokens(width, height, "low", model),
+            "thumbnail": estimate_image_tokens(
+                *_thumbnail_size(width, height), "low", model
+            ),
+            "description": 0,
+        }
+        if position != image_positions[-1]:
+            # (The newest image is always sent as is)
+            while costs[LEVELS[level]] > remaining:
+                level += 1
+        remaining -= costs[LEVELS[level]]
+
+        if LEVELS[level] != "full":
+            if verbose:
+                print(f"Reducing an image message to: {LEVELS[level]}")
+            messages[position] = degrade_image(message, LEVELS[level], llm)
+
+    return messages
+
+
+def degrade_image(message, level, llm=None):
+    """
+    Returns a copy of an image message at a lower `level` (see LEVELS).
+    """
+    if level == "full":
+        return message
+    if level == "low" and (llm is None or honors_detail(llm.model)):
+        return {**message, "detail": "low"}
+    if level in ("low", "thumbnail"):
+        side = LOW_DETAIL_SIDE if level == "low" else THUMBNAIL_SIDE
+        try:
+            return {
+                **message,
+                "format": "base64.png",
+                "content": _thumbnail(message["format"], message["content"], side),
+                "detail": "low",
+            }
+        except Exception:
+            # Can't read it, so describe it instead
+            pass
+
+    description = None
+    if llm is not None:
+        cache = llm._get_description_cache()
+        if cache:
+            renderer = getattr(
+                llm.vision_renderer, "__qualname__", repr(llm.vision_renderer)
+            )
+            cached = cache.get(cache.key(message, renderer))
+            if cached:
+                description = cached["description"]
+
+    if message["format"] == "path":
+        where = f" ({message['content']})"
+    else:
+        where = ""
+    if description:
+        content = f"An earlier image{where}, which has been removed to save space, showed: {description}"
+    else:
+        content = (
+            f"[An earlier image{where} was here. It's been removed to save space.]"
+        )
+    return {
+        "role": message["role"],
+        "type": "image",
+        "format": "description",
+        "content": content,
+    }
+
+
+def image_dimensions(format, content):
+    """
+    (width, height) of an image given as an LMC format ("path", "base64.png", ...) and
+    content, or (None, None) if we can't read it.
+    """
+    try:
+        if format == "path":
+            # Not cached, the file might change
+            return image_size(_image_bytes("path", content))
+        return _image_size(content)
+    except Exception:
+        return None, None
+
+
+def _message_size(message):
+    return image_dimensions(message["format"], message["content"])
+
+
+class _Cache:
+    """
+    A small LRU cache keyed on a hash of the image, not the image itself, so it doesn't
+    keep hundreds of multi-MB base64 strings alive.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, make):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = make()
+        with self._lock:
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+
+_sizes = _Cache(256)
+_thumbnails = _Cache(64)
+
+
+def _content_key(content):
+    if isinstance(content, BlobRef):
+        return content.hash
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _image_size(content):
+    return _sizes.get(_content_key(content), lambda: image_size(image_bytes(content)))
+
+
+def _thumbnail(format, content, side=THUMBNAIL_SIDE):
+    if format == "path":
+        return _make_thumbnail(_image_bytes("path", content), side)
+    return _thumbnails.get(
+        (_content_key(content), side),
+        lambda: _make_thumbnail(image_bytes(content), side),
+    )
+
+
+def _make_thumbnail(data, side=THUMBNAIL_SIDE):
+    img = Image.open(io.BytesIO(data))
+    img.thumbnail((side, side))
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def _thumbnail_size(width, height):
+    if not width:
+        return THUMBNAIL_SIDE, THUMBNAIL_SIDE
+    scale = min(1, THUMBNAIL_SIDE / max(width, height))
+    return int(width * scale), int(height * scale)
+
+
+def _image_bytes(format, content):
+    if format == "path":
+        with open(content, "rb") as f:
+            return f.read()
+    return image_bytes(content)
@@ -0,0 +1,141 @@
+"""
+Sizes images to fit what a provider will actually use, encoding each one at most twice.
+
+Each model has an image budget: the longest side and pixel count the provider keeps (it
+downscales anything bigger itself, so sending more only costs upload time), and the
+largest payload it accepts. We read the image's dimensions from its header, work out the
+target resolution and encoder settings up front, and only re-encode if the image
+doesn't already fit.
+"""
+
+import base64
+import fnmatch
+import io
+import math
+
+from PIL import Image
+
+from ...utils.blob_store import image_bytes
+
+MB = 1024 * 1024
+
+DEFAULT_IMAGE_BUDGETS = {
+    # Open Interpreter's hosted model
+    "openai/i": {"max_bytes": 5 * MB},
+    # OpenAI resizes "low" detail images to fit in 512x512, so that's all we send
+    "gpt-*": {"max_side": 512, "max_bytes": 20 * MB, "detail": "low"},
+    "chatgpt-*": {"max_side": 512, "max_bytes": 20 * MB, "detail": "low"},
+    "openai/*": {"max_side": 512, "max_bytes": 20 * MB, "detail": "low"},
+    "azure/*": {"max_side": 512, "max_bytes": 20 * MB, "detail": "low"},
+    # Anthropic downscales past 1568px on the long side or ~1.15 megapixels, and rejects > 5MB
+    "claude-*": {"max_side": 1568, "max_pixels": 1_150_000, "max_bytes": 5 * MB},
+    "anthropic/*": {"max_side": 1568, "max_pixels": 1_150_000, "max_bytes": 5 * MB},
+    "*claude*": {"max_side": 1568, "max_pixels": 1_150_000, "max_bytes": 5 * MB},
+    "gemini*": {"max_side": 3072, "max_bytes": 20 * MB},
+    # Anything else: just stay under 5MB, like we always have
+    "*": {"max_bytes": 5 * MB},
+}
+
+# Rough bytes per pixel of a JPEG screenshot at each quality (fitted on desktop screenshots).
+# Used to pick the best quality that'll fit without encoding several times.
+JPEG_BYTES_PER_PIXEL = [(95, 0.55), (85, 0.3), (75, 0.22), (60, 0.17), (40, 0.12)]
+
+# Leave a little room for estimation error
+SAFETY = 0.9
+
+
+def image_budget(model, overrides=None):
+    """
+    Returns the image budget for `model`. `overrides` (e.g. `llm.image_budgets`) is checked
+    before the defaults, with the same `{"pattern": {...}}` format.
+    """
+    model = (model or "").lower()
+    for budgets in (overrides or {}, DEFAULT_IMAGE_BUDGETS):
+        for pattern, budget in budgets.items():
+            if fnmatch.fnmatch(model, pattern.lower()):
+                return budget
+    return {}
+
+
+def image_size(data):
+    """
+    Returns (width, height) without decoding the pixels (PIL only reads the header here).
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+def target_scale(width, height, budget):
+    """
+    How much to scale an image down by (1 = not at all) to fit the budget's dimensions.
+    """
+    scale = 1.0
+    if budget.get("max_side"):
+        scale = min(scale, budget["max_side"] / max(width, height))
+    if budget.get("max_pixels"):
+        scale = min(scale, math.sqrt(budget["max_pixels"] / (width * height)))
+    return scale
+
+
+def data_url_size(num_bytes, extension):
+    # base64 is 4 characters for every 3 bytes, plus the "data:image/...;base64," prefix
+    return 4 * math.ceil(num_bytes / 3) + len(f"data:image/{extension};base64,")
+
+
+def fit_image(encoded_string, extension, budget):
+    """
+    Returns (encoded_string, extension) for an image that fits `budget`.
+    If it already fits, it's returned untouched (the pixels are never decoded).
+    """
+    max_bytes = budget.get("max_bytes")
+    data = image_bytes(encoded_string)
+    width, height = image_size(data)
+
+    scale = target_scale(width, height, budget)
+    fits = max_bytes is None or data_url_size(len(data), extension) <= max_bytes
+    if scale >= 1 and fits:
+        return encoded_string, extension
+
+    # Predict the encoded size at the new resolution from this image's own bytes per pixel
+    bytes_per_pixel = len(data) / (width * height)
+    options = {}
+    if max_bytes is not None:
+        allowed_pixels = SAFETY * max_bytes * 3 / 4 / bytes_per_pixel
+        if width * height * scale**2 > allowed_pixels:
+            if extension.lower() in ("jpg", "jpeg"):
+                # Try a lower quality before giving up resolution
+                options, bytes_per_pixel = _jpeg_quality(
+                    width * height * scale**2, max_bytes
+                )
+                allowed_pixels = SAFETY * max_bytes * 3 / 4 / bytes_per_pixel
+            scale = min(scale, math.sqrt(allowed_pixels / (width * height)))
+
+    img = Image.open(io.BytesIO(data))
+    encoded = _encode(img, width, height, scale, extension, options)
+
+    if max_bytes is not None and data_url_size(len(encoded), extension) > max_bytes:
+        # The model was off. Correct the scale by how far off it was and go once more.
+        scale *= math.sqrt(SAFETY * max_bytes / data_url_size(len(encoded), extension))
+        encoded = _encode(img, width, height, scale, extension, options)
+
+    return base64.b64encode(encoded).decode("utf-8"), extension
+
+
+def _jpeg_quality(pixels, max_bytes):
+    for quality, bytes_per_pixel in JPEG_BYTES_PER_PIXEL:
+        if pixels * bytes_per_pixel <= SAFETY * max_bytes * 3 / 4:
+            return {"quality": quality}, bytes_per_pixel
+    quality, bytes_per_pixel = JPEG_BYTES_PER_PIXEL[-1]
+    return {"quality": quality}, bytes_per_pixel
+
+
+def _encode(img, width, height, scale, extension, options):
+    if scale < 1:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        img = img.resize(size, Image.LANCZOS)
+    image_format = {"jpg": "JPEG"}.get(extension.lower(), extension.upper())
+    if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buffered = io.BytesIO()
+    img.save(buffered, format=image_format, **options)
+    return buffered.getvalue()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import re
@@ -9,6 +10,7 @@ import litellm
 import openai
 
 from .render_message import render_message
+from .utils.blob_store import to_blob_ref
 
 
 def respond(interpreter):
@@ -17,447 +19,540 @@ def respond(interpreter):
     Responds until it decides not to run any more code or say anything else.
     """
 
-    last_unsupported_code = ""
-    insert_loop_message = False
+    state = {"last_unsupported_code": "", "insert_loop_message": False}
 
     while True:
-        ## RENDER SYSTEM MESSAGE ##
+        messages_for_llm = render_messages_for_llm(interpreter)
 
-        system_message = interpreter.system_message
+        loop_chunk = insert_loop_message(messages_for_llm, state)
+        if loop_chunk:
+            # Yield two newlines to separate the LLMs reply from previous messages.
+            yield loop_chunk
 
-        # Add language-specific system messages
-        for language in interpreter.computer.terminal.languages:
-            if hasattr(language, "system_message"):
-                system_message += "\n\n" + language.system_message
+        ### RUN THE LLM ###
 
-        # Add custom instructions
-        if interpreter.custom_instructions:
-            system_message += "\n\n" + interpreter.custom_instructions
+        assert (
+            len(interpreter._messages) > 0
+        ), "User message was not passed in. You need to pass in at least one message."
 
-        # Add computer API system message
-        if interpreter.computer.import_computer_api:
-            if interpreter.computer.system_message not in system_message:
-                system_message = (
-                    system_message + "\n\n" + interpreter.computer.system_message
-                )
+        if (
+            interpreter._messages[-1]["type"] != "code"
+        ):  # If it is, we should run the code (we do below)
+            try:
+                for chunk in interpreter.llm.run(messages_for_llm):
+                    yield {"role": "assistant", **chunk}
+            except Exception as e:
+                if handle_llm_error(interpreter, e):
+                    break
 
-        # Storing the messages so they're accessible in the interpreter's computer
-        # no... this is a huge time sink.....
-        # if interpreter.sync_computer:
-        #     output = interpreter.computer.run(
-        #         "python", f"messages={interpreter.messages}"
-        #     )
+        ### RUN CODE (if it's there) ###
 
-        ## Rendering ↓
-        rendered_system_message = render_message(interpreter, system_message)
-        ## Rendering ↑
+        if interpreter._messages[-1]["type"] == "code":
+            if (yield from run_code(interpreter, state)) == "break":
+                break
+        else:
+            if loop_or_stop(interpreter, state) == "break":
+                break
 
-        rendered_system_message = {
-            "role": "system",
-            "type": "message",
-            "content": rendered_system_message,
-        }
+    return
 
-        # Create the version of messages that we'll send to the LLM
-        messages_for_llm = interpreter.messages.copy()
-        messages_for_llm = [rendered_system_message] + messages_for_llm
-
-        if insert_loop_message:
-            messages_for_llm.append(
-                {
-                    "role": "user",
-                    "type": "message",
-                    "content": loop_message,
-                }
-            )
-            # Yield two newlines to separate the LLMs reply from previous messages.
-            yield {"role": "assistant", "type": "message", "content": "\n\n"}
-            insert_loop_message = False
 
-        ### RUN THE LLM ###
+async def arespond(interpreter):
+    """
+    Async version of `respond`. The LLM is streamed natively (`llm.arun`),
+    while code runs on a worker thread, one chunk at a time.
+    """
+
+    state = {"last_unsupported_code": "", "insert_loop_message": False}
+
+    while True:
+        messages_for_llm = await asyncio.to_thread(render_messages_for_llm, interpreter)
+
+        loop_chunk = insert_loop_message(messages_for_llm, state)
+        if loop_chunk:
+            yield loop_chunk
 
         assert (
-            len(interpreter.messages) > 0
+            len(interpreter._messages) > 0
         ), "User message was not passed in. You need to pass in at least one message."
 
-        if (
-            interpreter.messages[-1]["type"] != "code"
-        ):  # If it is, we should run the code (we do below)
+        if interpreter._messages[-1]["type"] != "code":
             try:
-                for chunk in interpreter.llm.run(messages_for_llm):
+                async for chunk in interpreter.llm.arun(messages_for_llm):
                     yield {"role": "assistant", **chunk}
+            except Exception as e:
+                if handle_llm_error(interpreter, e):
+                    break
 
-            except litellm.exceptions.BudgetExceededError:
-                interpreter.display_message(
-                    f"""> Max budget exceeded
+        if interpreter._messages[-1]["type"] == "code":
+            code_run = run_code(interpreter, state)
+            done = False
+            try:
+                while True:
+                    done, value = await asyncio.to_thread(_step, code_run)
+                    if done:
+                        break
+                    yield value
+            finally:
+                if not done:
+                    await asyncio.to_thread(code_run.close)
+            if value == "break":
+                break
+        else:
+            if loop_or_stop(interpreter, state) == "break":
+                break
 
-                    **Session spend:** ${litellm._current_cost}
-                    **Max budget:** ${interpreter.max_budget}
 
-                    Press CTRL-C then run `interpreter --max_budget [higher USD amount]` to proceed.
-                """
-                )
-                break
+def _step(generator):
+    """
+    next(generator), but returns (done, value) instead of raising StopIteration,
+    which can't cross into an asyncio future.
+    """
+    try:
+        return False, next(generator)
+    except StopIteration as e:
+        return True, e.value
 
-                # Provide extra information on how to change API keys, if we encounter that error
-                # (Many people writing GitHub issues were struggling with this)
 
-            except Exception as e:
-                error_message = str(e).lower()
-                if (
-                    interpreter.offline == False
-                    and "auth" in error_message
-                    or "api key" in error_message
-                ):
-                    output = traceback.format_exc()
-                    raise Exception(
-                        f"{output}\n\nThere might be an issue with your API key(s).\n\nTo reset your API key (we'll use OPENAI_API_KEY for this example, but you may need to reset your ANTHROPIC_API_KEY, HUGGINGFACE_API_KEY, etc):\n        Mac/Linux: 'export OPENAI_API_KEY=your-key-here'. Update your ~/.zshrc on MacOS or ~/.bashrc on Linux with the new key if it has already been persisted there.,\n        Windows: 'setx OPENAI_API_KEY your-key-here' then restart terminal.\n\n"
-                    )
-                elif (
-                    type(e) == litellm.exceptions.RateLimitError
-                    and "exceeded" in str(e).lower()
-                    or "insufficient_quota" in str(e).lower()
-                ):
-                    display_markdown_message(
-                        f""" > You ran out of current quota for OpenAI's API, please check your plan and billing details. You can either wait for the quota to reset or upgrade your plan.
-
-                        To check your current usage and billing details, visit the [OpenAI billing page](https://platform.openai.com/settings/organization/billing/overview).
-
-                        You can also use `interpreter --max_budget [higher USD amount]` to set a budget for your sessions.
-                        """
-                    )
-
-                elif (
-                    interpreter.offline == False and "not have access" in str(e).lower()
-                ):
-                    """
-                    Check for invalid model in error message and then fallback.
-                    """
-                    if (
-                        "invalid model" in error_message
-                        or "model does not exist" in error_message
-                    ):
-                        provider_message = f"\n\nThe model '{interpreter.llm.model}' does not exist or is invalid. Please check the model name and try again.\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n  "
-                    elif "groq" in error_message:
-                        provider_message = f"\n\nYou do not have access to {interpreter.llm.model}. Please check with Groq for more details.\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n  "
-                    else:
-                        provider_message = f"\n\nYou do not have access to {interpreter.llm.model}. If you are using an OpenAI model, you may need to add a payment method and purchase credits for the OpenAI API billing page (this is different from ChatGPT Plus).\n\nhttps://platform.openai.com/account/billing/overview\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n"
-
-                    print(provider_message)
-
-                    response = input()
-                    print("")  # <- Aesthetic choice
-
-                    if response.strip().lower() == "y":
-                        interpreter.llm.model = "i"
-                        interpreter.display_message(f"> Model set to `i`")
-                        interpreter.display_message(
-                            "***Note:*** *Conversations with this model will be used to train our open-source model.*\n"
-                        )
-
-                    else:
-                        raise
-                elif interpreter.offline and not interpreter.os:
-                    raise
-                else:
-                    raise
+def render_messages_for_llm(interpreter):
+    """
+    Renders the system message and returns the messages we'll send to the LLM.
+    """
 
-        ### RUN CODE (if it's there) ###
+    ## RENDER SYSTEM MESSAGE ##
+
+    system_message = interpreter.system_message
+
+    # Add language-specific system messages
+    for language in interpreter.computer.terminal.languages:
+        if hasattr(language, "system_message"):
+            system_message += "\n\n" + language.system_message
+
+    # Add custom instructions
+    if interpreter.custom_instructions:
+        system_message += "\n\n" + interpreter.custom_instructions
+
+    # Add computer API system message
+    if interpreter.computer.import_computer_api:
+        if interpreter.computer.system_message not in system_message:
+            system_message = (
+                system_message + "\n\n" + interpreter.computer.system_message
+            )
+
+    # Storing the messages so they're accessible in the interpreter's computer
+    # no... this is a huge time sink.....
+    # if interpreter.sync_computer:
+    #     output = interpreter.computer.run(
+    #         "python", f"messages={interpreter._messages}"
+    #     )
+
+    ## Rendering ↓
+    rendered_system_message = render_message(interpreter, system_message)
+    ## Rendering ↑
+
+    rendered_system_message = {
+        "role": "system",
+        "type": "message",
+        "content": rendered_system_message,
+    }
+
+    # Create the version of messages that we'll send to the LLM
+    messages_for_llm = interpreter._messages.copy()
+    messages_for_llm = [rendered_system_message] + messages_for_llm
+
+    return messages_for_llm
 
-        if interpreter.messages[-1]["type"] == "code":
+
+def insert_loop_message(messages_for_llm, state):
+    """
+    Adds the loop message if the last turn asked for one. Returns a chunk to yield if so.
+    """
+    if not state["insert_loop_message"]:
+        return None
+    messages_for_llm.append(
+        {
+            "role": "user",
+            "type": "message",
+            "content": state["loop_message"],
+        }
+    )
+    state["insert_loop_message"] = False
+    return {"role": "assistant", "type": "message", "content": "\n\n"}
+
+
+def handle_llm_error(interpreter, e):
+    """
+    Deals with an exception raised while running the LLM (call it from the `except` block).
+    Returns True if we should stop responding, False to carry on. Re-raises what we can't handle.
+    """
+    if isinstance(e, litellm.exceptions.BudgetExceededError):
+        interpreter.display_message(
+            f"""> Max budget exceeded
+
+            **Session spend:** ${litellm._current_cost}
+            **Max budget:** ${interpreter.max_budget}
+
+            Press CTRL-C then run `interpreter --max_budget [higher USD amount]` to proceed.
+        """
+        )
+        return True
+
+    # Provide extra information on how to change API keys, if we encounter that error
+    # (Many people writing GitHub issues were struggling with this)
+
+    error_message = str(e).lower()
+    if (
+        interpreter.offline == False
+        and "auth" in error_message
+        or "api key" in error_message
+    ):
+        output = traceback.format_exc()
+        raise Exception(
+            f"{output}\n\nThere might be an issue with your API key(s).\n\nTo reset your API key (we'll use OPENAI_API_KEY for this example, but you may need to reset your ANTHROPIC_API_KEY, HUGGINGFACE_API_KEY, etc):\n        Mac/Linux: 'export OPENAI_API_KEY=your-key-here'. Update your ~/.zshrc on MacOS or ~/.bashrc on Linux with the new key if it has already been persisted there.,\n        Windows: 'setx OPENAI_API_KEY your-key-here' then restart terminal.\n\n"
+        )
+    elif (
+        type(e) == litellm.exceptions.RateLimitError
+        and "exceeded" in str(e).lower()
+        or "insufficient_quota" in str(e).lower()
+    ):
+        display_markdown_message(
+            f""" > You ran out of current quota for OpenAI's API, please check your plan and billing details. You can either wait for the quota to reset or upgrade your plan.
+
+            To check your current usage and billing details, visit the [OpenAI billing page](https://platform.openai.com/settings/organization/billing/overview).
+
+            You can also use `interpreter --max_budget [higher USD amount]` to set a budget for your sessions.
+            """
+        )
+
+    elif interpreter.offline == False and "not have access" in str(e).lower():
+        """
+        Check for invalid model in error message and then fallback.
+        """
+        if "invalid model" in error_message or "model does not exist" in error_message:
+            provider_message = f"\n\nThe model '{interpreter.llm.model}' does not exist or is invalid. Please check the model name and try again.\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n  "
+        elif "groq" in error_message:
+            provider_message = f"\n\nYou do not have access to {interpreter.llm.model}. Please check with Groq for more details.\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n  "
+        else:
+            provider_message = f"\n\nYou do not have access to {interpreter.llm.model}. If you are using an OpenAI model, you may need to add a payment method and purchase credits for the OpenAI API billing page (this is different from ChatGPT Plus).\n\nhttps://platform.openai.com/account/billing/overview\n\nWould you like to try Open Interpreter's hosted `i` model instead? (y/n)\n\n"
+
+        print(provider_message)
+
+        response = input()
+        print("")  # <- Aesthetic choice
+
+        if response.strip().lower() == "y":
+            interpreter.llm.model = "i"
+            interpreter.display_message(f"> Model set to `i`")
+            interpreter.display_message(
+                "***Note:*** *Conversations with this model will be used to train our open-source model.*\n"
+            )
+
+        else:
+            raise
+    elif interpreter.offline and not interpreter.os:
+        raise
+    else:
+        raise
+
+    return False
+
+
+def run_code(interpreter, state):
+    """
+    Runs the code block at the end of `interpreter._messages`, yielding its output.
+    Returns "continue" to keep responding or "break" to stop.
+    """
+    if interpreter.verbose:
+        print("Running code:", interpreter._messages[-1])
+
+    try:
+        # What language/code do you want to run?
+        language = interpreter._messages[-1]["format"].lower().strip()
+        code = interpreter._messages[-1]["content"]
+
+        if code.startswith("`\n"):
+            code = code[2:].strip()
             if interpreter.verbose:
-                print("Running code:", interpreter.messages[-1])
+                print("Removing `\n")
+            interpreter._messages[-1]["content"] = code  # So the LLM can see it.
 
+        # A common hallucination
+        if code.startswith("functions.execute("):
+            edited_code = code.replace("functions.execute(", "").rstrip(")")
             try:
-                # What language/code do you want to run?
-                language = interpreter.messages[-1]["format"].lower().strip()
-                code = interpreter.messages[-1]["content"]
-
-                if code.startswith("`\n"):
-                    code = code[2:].strip()
-                    if interpreter.verbose:
-                        print("Removing `\n")
-                    interpreter.messages[-1]["content"] = code  # So the LLM can see it.
-
-                # A common hallucination
-                if code.startswith("functions.execute("):
-                    edited_code = code.replace("functions.execute(", "").rstrip(")")
-                    try:
-                        code_dict = json.loads(edited_code)
-                        language = code_dict.get("language", language)
-                        code = code_dict.get("code", code)
-                        interpreter.messages[-1][
-                            "content"
-                        ] = code  # So the LLM can see it.
-                        interpreter.messages[-1][
-                            "format"
-                        ] = language  # So the LLM can see it.
-                    except:
-                        pass
-
-                # print(code)
-                # print("---")
-                # time.sleep(2)
-
-                if code.strip().endswith("executeexecute"):
-                    code = code.replace("executeexecute", "")
-                    try:
-                        interpreter.messages[-1][
-                            "content"
-                        ] = code  # So the LLM can see it.
-                    except:
-                        pass
-
-                if code.replace("\n", "").replace(" ", "").startswith('{"language":'):
-                    try:
-                        code_dict = json.loads(code)
-                        if set(code_dict.keys()) == {"language", "code"}:
-                            language = code_dict["language"]
-                            code = code_dict["code"]
-                            interpreter.messages[-1][
-                                "content"
-                            ] = code  # So the LLM can see it.
-                            interpreter.messages[-1][
-                                "format"
-                            ] = language  # So the LLM can see it.
-                    except:
-                        pass
-
-                if code.replace("\n", "").replace(" ", "").startswith("{language:"):
-                    try:
-                        code = code.replace("language: ", '"language": ').replace(
-                            "code: ", '"code": '
-                        )
-                        code_dict = json.loads(code)
-                        if set(code_dict.keys()) == {"language", "code"}:
-                            language = code_dict["language"]
-                            code = code_dict["code"]
-                            interpreter.messages[-1][
-                                "content"
-                            ] = code  # So the LLM can see it.
-                            interpreter.messages[-1][
-                                "format"
-                            ] = language  # So the LLM can see it.
-                    except:
-                        pass
-
-                if (
-                    language == "text"
-                    or language == "markdown"
-                    or language == "plaintext"
-                ):
-                    # It does this sometimes just to take notes. Let it, it's useful.
-                    # In the future we should probably not detect this behavior as code at all.
-                    real_content = interpreter.messages[-1]["content"]
-                    interpreter.messages[-1] = {
-                        "role": "assistant",
-                        "type": "message",
-                        "content": f"```\n{real_content}\n```",
-                    }
-                    continue
-
-                # Is this language enabled/supported?
-                if interpreter.computer.terminal.get_language(language) == None:
-                    output = f"`{language}` disabled or not supported."
-
-                    yield {
-                        "role": "computer",
-                        "type": "console",
-                        "format": "output",
-                        "content": output,
-                    }
-
-                    # Let the response continue so it can deal with the unsupported code in another way. Also prevent looping on the same piece of code.
-                    if code != last_unsupported_code:
-                        last_unsupported_code = code
-                        continue
-                    else:
-                        break
+                code_dict = json.loads(edited_code)
+                language = code_dict.get("language", language)
+                code = code_dict.get("code", code)
+                interpreter._messages[-1]["content"] = code  # So the LLM can see it.
+                interpreter._messages[-1]["format"] = language  # So the LLM can see it.
+            except:
+                pass
 
-                # Is there any code at all?
-                if code.strip() == "":
-                    yield {
-                        "role": "computer",
-                        "type": "console",
-                        "format": "output",
-                        "content": "Code block was empty. Please try again, be sure to write code before executing.",
-                    }
-                    continue
-
-                # Yield a message, such that the user can stop code execution if they want to
-                try:
-                    yield {
-                        "role": "computer",
-                        "type": "confirmation",
-                        "format": "execution",
-                        "content": {
-                            "type": "code",
-                            "format": language,
-                            "content": code,
-                        },
-                    }
-                except GeneratorExit:
-                    # The user might exit here.
-                    # We need to tell python what we (the generator) should do if they exit
-                    break
+        # print(code)
+        # print("---")
+        # time.sleep(2)
 
-                # They may have edited the code! Grab it again
-                code = [m for m in interpreter.messages if m["type"] == "code"][-1][
-                    "content"
-                ]
+        if code.strip().endswith("executeexecute"):
+            code = code.replace("executeexecute", "")
+            try:
+                interpreter._messages[-1]["content"] = code  # So the LLM can see it.
+            except:
+                pass
 
-                # don't let it import computer — we handle that!
-                if interpreter.computer.import_computer_api and language == "python":
-                    code = code.replace("import computer\n", "pass\n")
-                    code = re.sub(
-                        r"import computer\.(\w+) as (\w+)", r"\2 = computer.\1", code
-                    )
-                    code = re.sub(
-                        r"from computer import (.+)",
-                        lambda m: "\n".join(
-                            f"{x.strip()} = computer.{x.strip()}"
-                            for x in m.group(1).split(", ")
-                        ),
-                        code,
-                    )
-                    code = re.sub(r"import computer\.\w+\n", "pass\n", code)
-                    # If it does this it sees the screenshot twice (which is expected jupyter behavior)
-                    if any(
-                        [
-                            code.strip().split("\n")[-1].startswith(text)
-                            for text in [
-                                "computer.display.view",
-                                "computer.display.screenshot",
-                                "computer.view",
-                                "computer.screenshot",
-                            ]
-                        ]
-                    ):
-                        code = code + "\npass"
-
-                # sync up some things (is this how we want to do this?)
-                interpreter.computer.verbose = interpreter.verbose
-                interpreter.computer.debug = interpreter.debug
-                interpreter.computer.emit_images = interpreter.llm.supports_vision
-                interpreter.computer.max_output = interpreter.max_output
+        if code.replace("\n", "").replace(" ", "").startswith('{"language":'):
+            try:
+                code_dict = json.loads(code)
+                if set(code_dict.keys()) == {"language", "code"}:
+                    language = code_dict["language"]
+                    code = code_dict["code"]
+                    interpreter._messages[-1][
+                        "content"
+                    ] = code  # So the LLM can see it.
+                    interpreter._messages[-1][
+                        "format"
+                    ] = language  # So the LLM can see it.
+            except:
+                pass
 
-                # sync up the interpreter's computer with your computer
-                try:
-                    if interpreter.sync_computer and language == "python":
-                        computer_dict = interpreter.computer.to_dict()
-                        if "_hashes" in computer_dict:
-                            computer_dict.pop("_hashes")
-                        if "system_message" in computer_dict:
-                            computer_dict.pop("system_message")
-                        computer_json = json.dumps(computer_dict)
-                        sync_code = f"""import json\ncomputer.load_dict(json.loads('''{computer_json}'''))"""
-                        interpreter.computer.run("python", sync_code)
-                except Exception as e:
-                    if interpreter.debug:
-                        raise
-                    print(str(e))
-                    print("Failed to sync iComputer with your Computer. Continuing...")
-
-                ## ↓ CODE IS RUN HERE
-
-                for line in interpreter.computer.run(language, code, stream=True):
-                    yield {"role": "computer", **line}
-
-                ## ↑ CODE IS RUN HERE
-
-                # sync up your computer with the interpreter's computer
-                try:
-                    if interpreter.sync_computer and language == "python":
-                        # sync up the interpreter's computer with your computer
-                        result = interpreter.computer.run(
-                            "python",
-                            """
-                            import json
-                            computer_dict = computer.to_dict()
-                            if '_hashes' in computer_dict:
-                                computer_dict.pop('_hashes')
-                            if "system_message" in computer_dict:
-                                computer_dict.pop("system_message")
-                            print(json.dumps(computer_dict))
-                            """,
-                        )
-                        result = result[-1]["content"]
-                        interpreter.computer.load_dict(
-                            json.loads(result.strip('"').strip("'"))
-                        )
-                except Exception as e:
-                    if interpreter.debug:
-                        raise
-                    print(str(e))
-                    print("Failed to sync your Computer with iComputer. Continuing.")
-
-                # yield final "active_line" message, as if to say, no more code is running. unlightlight active lines
-                # (is this a good idea? is this our responsibility? i think so — we're saying what line of code is running! ...?)
-                yield {
-                    "role": "computer",
-                    "type": "console",
-                    "format": "active_line",
-                    "content": None,
-                }
-
-            except KeyboardInterrupt:
-                break  # It's fine.
+        if code.replace("\n", "").replace(" ", "").startswith("{language:"):
+            try:
+                code = code.replace("language: ", '"language": ').replace(
+                    "code: ", '"code": '
+                )
+                code_dict = json.loads(code)
+                if set(code_dict.keys()) == {"language", "code"}:
+                    language = code_dict["language"]
+                    code = code_dict["code"]
+                    interpreter._messages[-1][
+                        "content"
+                    ] = code  # So the LLM can see it.
+                    interpreter._messages[-1][
+                        "format"
+                    ] = language  # So the LLM can see it.
             except:
-                yield {
-                    "role": "computer",
-                    "type": "console",
-                    "format": "output",
-                    "content": traceback.format_exc(),
-                }
+                pass
+
+        if language == "text" or language == "markdown" or language == "plaintext":
+            # It does this sometimes just to take notes. Let it, it's useful.
+            # In the future we should probably not detect this behavior as code at all.
+            real_content = interpreter._messages[-1]["content"]
+            interpreter._messages[-1] = {
+                "role": "assistant",
+                "type": "message",
+                "content": f"```\n{real_content}\n```",
+            }
+            return "continue"
+
+        # Is this language enabled/supported?
+        if interpreter.computer.terminal.get_language(language) == None:
+            output = f"`{language}` disabled or not supported."
+
+            yield {
+                "role": "computer",
+                "type": "console",
+                "format": "output",
+                "content": output,
+            }
+
+            # Let the response continue so it can deal with the unsupported code in another way. Also prevent looping on the same piece of code.
+            if code != state["last_unsupported_code"]:
+                state["last_unsupported_code"] = code
+                return "continue"
+            else:
+                return "break"
+
+        # Is there any code at all?
+        if code.strip() == "":
+            yield {
+                "role": "computer",
+                "type": "console",
+                "format": "output",
+                "content": "Code block was empty. Please try again, be sure to write code before executing.",
+            }
+            return "continue"
+
+        # Yield a message, such that the user can stop code execution if they want to
+        try:
+            yield {
+                "role": "computer",
+                "type": "confirmation",
+                "format": "execution",
+                "content": {
+                    "type": "code",
+                    "format": language,
+                    "content": code,
+                },
+            }
+        except GeneratorExit:
+            # The user might exit here.
+            # We need to tell python what we (the generator) should do if they exit
+            return "break"
+
+        # They may have edited the code! Grab it again
+        code = [m for m in interpreter._messages if m["type"] == "code"][-1]["content"]
+
+        # don't let it import computer — we handle that!
+        if interpreter.computer.import_computer_api and language == "python":
+            code = code.replace("import computer\n", "pass\n")
+            code = re.sub(r"import computer\.(\w+) as (\w+)", r"\2 = computer.\1", code)
+            code = re.sub(
+                r"from computer import (.+)",
+                lambda m: "\n".join(
+                    f"{x.strip()} = computer.{x.strip()}"
+                    for x in m.group(1).split(", ")
+                ),
+                code,
+            )
+            code = re.sub(r"import computer\.\w+\n", "pass\n", code)
+            # If it does this it sees the screenshot twice (which is expected jupyter behavior)
+            if any(
+                [
+                    code.strip().split("\n")[-1].startswith(text)
+                    for text in [
+                        "computer.display.view",
+                        "computer.display.screenshot",
+                        "computer.view",
+                        "computer.screenshot",
+                    ]
+                ]
+            ):
+                code = code + "\npass"
+
+        # sync up some things (is this how we want to do this?)
+        interpreter.computer.verbose = interpreter.verbose
+        interpreter.computer.debug = interpreter.debug
+        interpreter.computer.emit_images = interpreter.llm.supports_vision
+        interpreter.computer.max_output = interpreter.max_output
+
+        # sync up the interpreter's computer with your computer
+        try:
+            if interpreter.sync_computer and language == "python":
+                computer_dict = interpreter.computer.to_dict()
+                if "_hashes" in computer_dict:
+                    computer_dict.pop("_hashes")
+                if "system_message" in computer_dict:
+                    computer_dict.pop("system_message")
+                computer_json = json.dumps(computer_dict)
+                sync_code = f"""import json\ncomputer.load_dict(json.loads('''{computer_json}'''))"""
+                interpreter.computer.run("python", sync_code)
+        except Exception as e:
+            if interpreter.debug:
+                raise
+            print(str(e))
+            print("Failed to sync iComputer with your Computer. Continuing...")
+
+        ## ↓ CODE IS RUN HERE
+
+        for line in interpreter.computer.run(language, code, stream=True):
+            if (
+                line.get("type") == "image"
+                and "base64" in line.get("format", "")
+                and isinstance(line.get("content"), str)
+            ):
+                # Keep the bytes in the blob store, not in every copy of the message
+                try:
+                    line = {**line, "content": to_blob_ref(line["content"])}
+                except ValueError:
+                    pass  # Not valid base64. Pass it on as it is
+            yield {"role": "computer", **line}
 
-        else:
-            ## LOOP MESSAGE
-            # This makes it utter specific phrases if it doesn't want to be told to "Proceed."
-
-            loop_message = interpreter.loop_message
-            if interpreter.os:
-                loop_message = loop_message.replace(
-                    "If the entire task I asked for is done,",
-                    "If the entire task I asked for is done, take a screenshot to verify it's complete, or if you've already taken a screenshot and verified it's complete,",
+        ## ↑ CODE IS RUN HERE
+
+        # sync up your computer with the interpreter's computer
+        try:
+            if interpreter.sync_computer and language == "python":
+                # sync up the interpreter's computer with your computer
+                result = interpreter.computer.run(
+                    "python",
+                    """
+                    import json
+                    computer_dict = computer.to_dict()
+                    if '_hashes' in computer_dict:
+                        computer_dict.pop('_hashes')
+                    if "system_message" in computer_dict:
+                        computer_dict.pop("system_message")
+                    print(json.dumps(computer_dict))
+                    """,
                 )
-            loop_breakers = interpreter.loop_breakers
+                result = result[-1]["content"]
+                interpreter.computer.load_dict(json.loads(result.strip('"').strip("'")))
+        except Exception as e:
+            if interpreter.debug:
+                raise
+            print(str(e))
+            print("Failed to sync your Computer with iComputer. Continuing.")
+
+        # yield final "active_line" message, as if to say, no more code is running. unlightlight active lines
+        # (is this a good idea? is this our responsibility? i think so — we're saying what line of code is running! ...?)
+        yield {
+            "role": "computer",
+            "type": "console",
+            "format": "active_line",
+            "content": None,
+        }
+
+    except KeyboardInterrupt:
+        return "break"  # It's fine.
+    except:
+        yield {
+            "role": "computer",
+            "type": "console",
+            "format": "output",
+            "content": traceback.format_exc(),
+        }
+
 
+def loop_or_stop(interpreter, state):
+    """
+    Called when the LLM is done and didn't write code. Returns "continue" if we should
+    send the loop message (in loop mode) and keep going, "break" if we're done.
+    """
+    ## LOOP MESSAGE
+    # This makes it utter specific phrases if it doesn't want to be told to "Proceed."
+
+    loop_message = interpreter.loop_message
+    if interpreter.os:
+        loop_message = loop_message.replace(
+            "If the entire task I asked for is done,",
+            "If the entire task I asked for is done, take a screenshot to verify it's complete, or if you've already taken a screenshot and verified it's complete,",
+        )
+    loop_breakers = interpreter.loop_breakers
+
+    if (
+        interpreter.loop
+        and interpreter._messages
+        and interpreter._messages[-1].get("role", "") == "assistant"
+        and not any(
+            task_status in interpreter._messages[-1].get("content", "")
+            for task_status in loop_breakers
+        )
+    ):
+        # Remove past loop_message messages
+        interpreter._messages = [
+            message
+            for message in interpreter._messages
+            if message.get("content", "") != loop_message
+        ]
+        # Combine adjacent assistant messages, so hopefully it learns to just keep going!
+        combined_messages = []
+        for message in interpreter._messages:
             if (
-                interpreter.loop
-                and interpreter.messages
-                and interpreter.messages[-1].get("role", "") == "assistant"
-                and not any(
-                    task_status in interpreter.messages[-1].get("content", "")
-                    for task_status in loop_breakers
-                )
+                combined_messages
+                and message["role"] == "assistant"
+                and combined_messages[-1]["role"] == "assistant"
+                and message["type"] == "message"
+                and combined_messages[-1]["type"] == "message"
             ):
-                # Remove past loop_message messages
-                interpreter.messages = [
-                    message
-                    for message in interpreter.messages
-                    if message.get("content", "") != loop_message
-                ]
-                # Combine adjacent assistant messages, so hopefully it learns to just keep going!
-                combined_messages = []
-                for message in interpreter.messages:
-                    if (
-                        combined_messages
-                        and message["role"] == "assistant"
-                        and combined_messages[-1]["role"] == "assistant"
-                        and message["type"] == "message"
-                        and combined_messages[-1]["type"] == "message"
-                    ):
-                        combined_messages[-1]["content"] += "\n" + message["content"]
-                    else:
-                        combined_messages.append(message)
-                interpreter.messages = combined_messages
-
-                # Send model the loop_message:
-                insert_loop_message = True
-
-                continue
-
-            # Doesn't want to run code. We're done!
-            break
+                combined_messages[-1]["content"] += "\n" + message["content"]
+            else:
+                combined_messages.append(message)
+        interpreter._messages = combined_messages
 
-    return
+        # Send model the loop_message:
+        state["loop_message"] = loop_message
+        state["insert_loop_message"] = True
+
+        return "continue"
+
+    # Doesn't want to run code. We're done!
+    return "break"
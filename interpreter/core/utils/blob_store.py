@@ -0,0 +1,208 @@
+"""
+Keeps image bytes out of `messages`.
+
+Images from code output (Jupyter, HTML, React, screenshots) used to travel through
+`interpreter.messages` as big base64 strings, copied into every chunk and message dict.
+Now their content is a `BlobRef`: the sha256 of the bytes plus a way to get them back.
+The bytes live once in a `BlobStore` (in memory, spilling to disk past a budget, or in
+a file that's already on disk, like a saved conversation's blobs) and are only turned
+back into base64 when something really needs it: converting messages for the LLM,
+sending them over the websocket, or displaying the image.
+
+BlobRefs only live inside the interpreter (`interpreter._messages`). What users see
+(`interpreter.messages`, what `chat()` returns and streams) has base64 strings, as
+before: copies, made by `materialize`.
+
+    message["content"] = to_blob_ref(message["content"])
+    image_bytes(message["content"])  # Works for BlobRefs and base64 strings
+    json.dumps(message, default=json_default)
+"""
+
+import atexit
+import base64
+import collections
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import threading
+
+# Bytes kept in memory before the least recently used blobs are written to disk
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+class BlobRef:
+    """
+    Stands in for the base64 content of an image message.
+
+    It can be used where that string was (`str(ref)`, `len(ref)`, `ref[:30]`, `"..." + ref`,
+    comparing with a string), but most of those build the base64 string, so use `.bytes()`
+    or `.hash` where you can.
+    """
+
+    __slots__ = ("hash", "size", "store")
+
+    def __init__(self, hash, size, store):
+        self.hash = hash
+        self.size = size
+        self.store = store
+
+    def bytes(self):
+        return self.store.get(self.hash)
+
+    def base64(self):
+        return base64.b64encode(self.bytes()).decode("utf-8")
+
+    def __str__(self):
+        return self.base64()
+
+    def __repr__(self):
+        return f"<BlobRef {self.hash[:12]} ({self.size} bytes)>"
+
+    def __len__(self):
+        # Length of the base64 string, without building it
+        return 4 * math.ceil(self.size / 3)
+
+    def __getitem__(self, key):
+        return self.base64()[key]
+
+    def __add__(self, other):
+        return self.base64() + other
+
+    def __radd__(self, other):
+        return other + self.base64()
+
+    def __eq__(self, other):
+        if isinstance(other, BlobRef):
+            return self.hash == other.hash
+        if isinstance(other, str):
+            return len(other) == len(self) and other == self.base64()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.hash)
+
+    def __reduce__(self):
+        # Pickled (e.g. sent to another process) as the base64 string it stands for
+        return (str, (self.base64(),))
+
+
+class BlobStore:
+    def __init__(self, memory_budget=MEMORY_BUDGET, spill_path=None):
+        self.memory_budget = memory_budget
+        self._spill_path = spill_path
+        self._memory = collections.OrderedDict()  # hash -> bytes, oldest first
+        self._memory_size = 0
+        self._files = {}  # hash -> path, for blobs on disk
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        """
+        Stores `data` (if it isn't already) and returns a BlobRef to it.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+            elif digest not in self._files:
+                self._memory[digest] = data
+                self._memory_size += len(data)
+                self._spill()
+        return BlobRef(digest, len(data), self)
+
+    def add_file(self, digest, path, size=None):
+        """
+        Returns a BlobRef for bytes that are already in a file (named by their sha256),
+        without reading them.
+        """
+        if size is None:
+            size = os.path.getsize(path)
+        with self._lock:
+            if digest not in self._memory:
+                known = self._files.get(digest)
+                # (Unless the file we knew about is gone, e.g. its conversation was deleted)
+                if known is None or not os.path.exists(known):
+                    self._files[digest] = path
+        return BlobRef(digest, size, self)
+
+    def get(self, digest):
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return self._memory[digest]
+            path = self._files.get(digest)
+        if path is None:
+            raise KeyError(f"No blob {digest}")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def path(self, digest):
+        """
+        The file a blob is in, if it's been written to disk.
+        """
+        with self._lock:
+            return self._files.get(digest)
+
+    def _spill(self):
+        # Called with the lock held
+        while self._memory_size > self.memory_budget and len(self._memory) > 1:
+            digest, data = self._memory.popitem(last=False)
+            self._memory_size -= len(data)
+            path = os.path.join(self._spill_dir(), digest)
+            with open(path, "wb") as f:
+                f.write(data)
+            self._files[digest] = path
+
+    def _spill_dir(self):
+        if self._spill_path is None:
+            self._spill_path = tempfile.mkdtemp(prefix="open-interpreter-blobs-")
+            atexit.register(shutil.rmtree, self._spill_path, True)
+        return self._spill_path
+
+
+# One store for the whole process, so the same image is only ever kept once
+blob_store = BlobStore()
+
+
+def to_blob_ref(content, store=None):
+    """
+    Turns base64 image content into a BlobRef (BlobRefs are returned as they are).
+    """
+    if isinstance(content, BlobRef):
+        return content
+    return (store or blob_store).put(base64.b64decode(content))
+
+
+def image_bytes(content):
+    """
+    The bytes of base64 image content, whether it's a BlobRef or a string.
+    """
+    if isinstance(content, BlobRef):
+        return content.bytes()
+    return base64.b64decode(content)
+
+
+def materialize(value):
+    """
+    Returns `value` (a message, list of messages, chunk...) with BlobRefs turned back into
+    base64 strings. Containers with BlobRefs in them are copied, not changed.
+    """
+    if isinstance(value, BlobRef):
+        return value.base64()
+    if isinstance(value, dict):
+        if any(isinstance(v, (BlobRef, dict, list)) for v in value.values()):
+            return {key: materialize(v) for key, v in value.items()}
+        return value
+    if isinstance(value, list):
+        return [materialize(v) for v in value]
+    return value
+
+
+def json_default(value):
+    """
+    For `json.dumps(..., default=json_default)`.
+    """
+    if isinstance(value, BlobRef):
+        return value.base64()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,356 @@
+"""
+A small SQLite index of saved conversations (title, mtime, size, message count, first
+user message), so listing and searching thousands of them doesn't mean opening each one.
+
+It also keeps a full-text index (FTS5) of what was said in each conversation, for
+`search()`. That one is updated incrementally too: when a conversation grows, only its
+new messages are added.
+
+It lives next to the conversations, in `index.sqlite3`. Conversations we save are added
+to it as we save them; anything else (conversations from before, other processes,
+deleted files) is picked up by `refresh()`, which only re-reads files that changed.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+from .conversation_store import fingerprint, is_conversation_file, load_conversation
+
+INDEX_FILENAME = "index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    filename TEXT PRIMARY KEY,
+    title TEXT,
+    mtime REAL,
+    size INTEGER,
+    message_count INTEGER,
+    first_user_message TEXT
+);
+CREATE INDEX IF NOT EXISTS conversations_by_mtime ON conversations (mtime);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content,
+    filename UNINDEXED,
+    position UNINDEXED,
+    role UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+);
+CREATE TABLE IF NOT EXISTS fts_state (
+    filename TEXT PRIMARY KEY,
+    message_count INTEGER,
+    last_fingerprint TEXT
+);
+"""
+
+# Message types whose content is worth searching
+SEARCHABLE_TYPES = ["message", "code", "console"]
+
+# Don't put more than this much of any one message in the full-text index
+MAX_INDEXED_LENGTH = 100_000
+
+# How much of the first user message to keep
+PREVIEW_LENGTH = 200
+
+
+class ConversationIndex:
+    def __init__(self, conversations_dir, path=None):
+        self.conversations_dir = conversations_dir
+        self.path = path or os.path.join(conversations_dir, INDEX_FILENAME)
+        self._connection = None
+        self._lock = threading.Lock()
+        self._has_full_text = False
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            try:
+                # Lets other processes read while we write
+                connection.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError:
+                pass
+            connection.executescript(SCHEMA)
+            try:
+                connection.executescript(FTS_SCHEMA)
+                self._has_full_text = True
+            except sqlite3.OperationalError:
+                # This SQLite was built without FTS5. Searching falls back to titles.
+                self._has_full_text = False
+            self._connection = connection
+        return self._connection
+
+    @property
+    def has_full_text(self):
+        self.connection  # (Opening it is how we find out)
+        return self._has_full_text
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def update(self, filename, messages=None):
+        """
+        (Re)indexes one conversation. Pass its `messages` if you have them, to skip reading it.
+        """
+        path = os.path.join(self.conversations_dir, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(filename)
+            return
+        if messages is None:
+            try:
+                messages = load_conversation(path, resolve_blobs=False)
+            except Exception:
+                messages = []
+        row = _row(filename, stat, messages)
+        connection = self.connection
+        with self._lock, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?, ?)", row
+            )
+            if self.has_full_text:
+                self._index_text(filename, messages)
+
+    def remove(self, filename):
+        connection = self.connection
+        with self._lock, connection:
+            connection.execute(
+                "DELETE FROM conversations WHERE filename = ?", (filename,)
+            )
+            if self.has_full_text:
+                connection.execute(
+                    "DELETE FROM messages_fts WHERE filename = ?", (filename,)
+                )
+                connection.execute(
+                    "DELETE FROM fts_state WHERE filename = ?", (filename,)
+                )
+
+    def _index_text(self, filename, messages):
+        # Called inside update()'s transaction
+        state = self.connection.execute(
+            "SELECT message_count, last_fingerprint FROM fts_state WHERE filename = ?",
+            (filename,),
+        ).fetchone()
+
+        start = 0
+        if state and 0 < state[0] <= len(messages):
+            if fingerprint(messages[state[0] - 1]) == state[1]:
+                # Same conversation, just longer. Only add the new messages.
+                start = state[0]
+        if start == 0 and state:
+            self.connection.execute(
+                "DELETE FROM messages_fts WHERE filename = ?", (filename,)
+            )
+
+        self.connection.executemany(
+            "INSERT INTO messages_fts (content, filename, position, role) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    message["content"][:MAX_INDEXED_LENGTH],
+                    filename,
+                    position,
+                    message.get("role"),
+                )
+                for position, message in enumerate(messages[start:], start)
+                if message.get("type") in SEARCHABLE_TYPES
+                and isinstance(message.get("content"), str)
+                and message["content"].strip()
+            ],
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO fts_state VALUES (?, ?, ?)",
+            (
+                filename,
+                len(messages),
+                fingerprint(messages[-1]) if messages else None,
+            ),
+        )
+
+    def refresh(self, force=False):
+        """
+        Brings the index up to date with the folder. Only files that are new or changed
+        (by mtime and size) are read. Cheap if nothing was added or removed.
+        """
+        try:
+            dir_mtime = str(os.stat(self.conversations_dir).st_mtime)
+        except OSError:
+            return
+        if not force and self._get_meta("dir_mtime") == dir_mtime:
+            return
+
+        indexed = {
+            row["filename"]: (row["mtime"], row["size"])
+            for row in self.connection.execute(
+                "SELECT filename, mtime, size FROM conversations"
+            )
+        }
+
+        # (Conversations indexed before there was full-text search need adding to it)
+        in_full_text = None
+        if self.has_full_text:
+            in_full_text = {
+                row[0]
+                for row in self.connection.execute("SELECT filename FROM fts_state")
+            }
+
+        seen = set()
+        with os.scandir(self.conversations_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_conversation_file(entry.name):
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                if indexed.get(entry.name) != (stat.st_mtime, stat.st_size) or (
+                    in_full_text is not None and entry.name not in in_full_text
+                ):
+                    self.update(entry.name)
+
+        for filename in indexed.keys() - seen:
+            self.remove(filename)
+        self._set_meta("dir_mtime", dir_mtime)
+
+    def list(self, offset=0, limit=20, query=None):
+        """
+        Returns conversations (as dicts), newest first. `query` matches the title or the
+        first user message.
+        """
+        where, params = _where(query)
+        rows = self.connection.execute(
+            f"SELECT * FROM conversations {where} ORDER BY mtime DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        )
+        return [dict(row) for row in rows]
+
+    def count(self, query=None):
+        where, params = _where(query)
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM conversations {where}", params
+        ).fetchone()[0]
+
+    def search(self, query, offset=0, limit=20):
+        """
+        Full-text search over what was said in every conversation. Returns conversations
+        (as dicts, like `list`), best match first, each with a "snippet" of the best match.
+        Without FTS5, this is `list(query=query)`.
+        """
+        match = _match_expression(query)
+        if not self.has_full_text or not match:
+            return self.list(offset=offset, limit=limit, query=query)
+
+        # (SQLite fills in the other columns from the row with the MIN)
+        rows = self.connection.execute(
+            """
+            SELECT filename, rowid, MIN(rank) AS best FROM messages_fts
+            WHERE messages_fts MATCH ?
+            GROUP BY filename ORDER BY best LIMIT ? OFFSET ?
+            """,
+            (match, limit, offset),
+        ).fetchall()
+
+        results = []
+        for row in rows:
+            conversation = self.connection.execute(
+                "SELECT * FROM conversations WHERE filename = ?", (row["filename"],)
+            ).fetchone()
+            if conversation is None:
+                continue
+            snippet = self.connection.execute(
+                """
+                SELECT snippet(messages_fts, 0, '**', '**', '…', 12) FROM messages_fts
+                WHERE messages_fts MATCH ? AND rowid = ?
+                """,
+                (match, row["rowid"]),
+            ).fetchone()
+            results.append(
+                {**dict(conversation), "snippet": snippet[0] if snippet else ""}
+            )
+        return results
+
+    def count_matches(self, query):
+        """
+        How many conversations `search(query)` would find.
+        """
+        match = _match_expression(query)
+        if not self.has_full_text or not match:
+            return self.count(query)
+        return self.connection.execute(
+            "SELECT COUNT(DISTINCT filename) FROM messages_fts WHERE messages_fts MATCH ?",
+            (match,),
+        ).fetchone()[0]
+
+    def _get_meta(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+            )
+
+
+def title_from_filename(filename):
+    """
+    "First_few_words__May_01_2024_10-00-00.jsonl" -> "First few words... (May 01 2024 10-00-00)"
+    """
+    return os.path.splitext(filename)[0].replace("__", "... (").replace("_", " ") + ")"
+
+
+def _row(filename, stat, messages):
+    first_user_message = ""
+    for message in messages:
+        if (
+            message.get("role") == "user"
+            and message.get("type") == "message"
+            and isinstance(message.get("content"), str)
+        ):
+            first_user_message = message["content"][:PREVIEW_LENGTH]
+            break
+    return (
+        filename,
+        title_from_filename(filename),
+        stat.st_mtime,
+        stat.st_size,
+        len(messages),
+        first_user_message,
+    )
+
+
+def _where(query):
+    if not query:
+        return "", []
+    pattern = (
+        "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    )
+    return (
+        "WHERE title LIKE ? ESCAPE '\\' OR first_user_message LIKE ? ESCAPE '\\'",
+        [pattern, pattern],
+    )
+
+
+def _match_expression(query):
+    """
+    Turns what someone typed into an FTS5 query: every word must appear, the last one
+    can be the start of a word. Quoted, so FTS5 syntax in the query is just text.
+    """
+    words = re.findall(r"\w+", query or "")
+    if not words:
+        return None
+    terms = ['"' + word + '"' for word in words]
+    if len(words[-1]) >= 3:
+        # (Shorter prefixes match so many words that the query gets slow)
+        terms[-1] += "*"
+    return " ".join(terms)
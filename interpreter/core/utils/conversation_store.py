@@ -0,0 +1,248 @@
+"""
+Saves conversations as append-only JSONL, so each turn writes only the new messages.
+
+Every line is an LMC message, except for `{"_truncate": n}` lines, which mean "forget
+everything after the first n messages" (written when earlier messages were edited or
+removed, which is rare). Large base64 images are stored once, out of line, in a
+`blobs` folder next to the conversations, keyed by the hash of their bytes. The message
+keeps `"blob": "<sha256>"` in place of its content, and is loaded back with a BlobRef
+to that file (see blob_store.py), so the image isn't read until it's needed.
+
+    store = ConversationStore("~/.../conversations/Hello__May_1.jsonl")
+    store.save(interpreter.messages)  # Appends whatever's new
+    messages = load_conversation(path)  # Also reads the old .json files
+"""
+
+import base64
+import hashlib
+import json
+import os
+
+from .blob_store import BlobRef, blob_store, json_default
+
+# Base64 image content longer than this is moved into a blob
+BLOB_THRESHOLD = 16 * 1024
+
+# Content longer than this is fingerprinted by its length and ends, not hashed in full
+FINGERPRINT_LIMIT = 64 * 1024
+
+
+class ConversationStore:
+    def __init__(self, path, blobs_path=None, snapshots_path=None):
+        self.path = path
+        self.blobs_path = blobs_path or os.path.join(os.path.dirname(path), "blobs")
+        self.snapshots_path = snapshots_path or os.path.join(
+            os.path.dirname(path), "snapshots"
+        )
+        # Fingerprints of the messages the file currently holds, in order
+        self._saved = None
+        # Lines in the file that no longer hold a live message
+        self._dead_lines = 0
+
+    @property
+    def snapshot_path(self):
+        """
+        Where the Python kernel's variables are kept for this conversation (see
+        Terminal.snapshot), so resuming it doesn't mean running everything again.
+        """
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        return os.path.join(self.snapshots_path, name + ".pkl")
+
+    def save(self, messages):
+        """
+        Brings the file up to date with `messages`, appending as little as possible.
+        """
+        if self._saved is None:
+            self._read_state()
+
+        fingerprints = [fingerprint(message) for message in messages]
+
+        # How much of what's saved is still right?
+        keep = 0
+        for saved, current in zip(self._saved, fingerprints):
+            if saved != current:
+                break
+            keep += 1
+
+        lines = []
+        if keep < len(self._saved):
+            lines.append(json.dumps({"_truncate": keep}))
+            self._dead_lines += len(self._saved) - keep + 1
+        for message in messages[keep:]:
+            lines.append(
+                json.dumps(self._stored_message(message), default=json_default)
+            )
+
+        if lines:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        self._saved = fingerprints
+
+        if self._dead_lines > max(100, len(self._saved)):
+            self.compact()
+
+    def load(self):
+        """
+        Returns the conversation's messages, with images read back from their blobs.
+        """
+        messages = self._read_messages()
+        self._saved = [fingerprint(message) for message in messages]
+        return messages
+
+    def compact(self):
+        """
+        Rewrites the file with only the live messages (dropping truncated ones).
+        """
+        messages = [
+            self._stored_message(message, write_blob=False)
+            for message in self._read_messages(resolve_blobs=False)
+        ]
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            for message in messages:
+                f.write(json.dumps(message, default=json_default) + "\n")
+        os.replace(temp_path, self.path)
+        self._dead_lines = 0
+
+    def _read_state(self):
+        if os.path.exists(self.path):
+            self.load()
+        else:
+            self._saved = []
+
+    def _read_messages(self, resolve_blobs=True):
+        messages = []
+        self._dead_lines = 0
+        if not os.path.exists(self.path):
+            return messages
+        with open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Probably a line we were writing when we crashed
+                    self._dead_lines += 1
+                    continue
+                if "_truncate" in record:
+                    self._dead_lines += len(messages) - record["_truncate"] + 1
+                    del messages[record["_truncate"] :]
+                    continue
+                if resolve_blobs and "blob" in record:
+                    record = self._resolve_blob(record)
+                messages.append(record)
+        return messages
+
+    def _stored_message(self, message, write_blob=True):
+        content = message.get("content")
+        if (
+            message.get("type") == "image"
+            and "base64" in message.get("format", "")
+            and isinstance(content, (str, BlobRef))
+            and len(content) > BLOB_THRESHOLD
+        ):
+            if isinstance(content, BlobRef):
+                # Already hashed, and only read if the blob isn't written yet
+                digest, data = content.hash, content.bytes
+            else:
+                data = base64.b64decode(content)
+                digest = hashlib.sha256(data).hexdigest()
+            if write_blob:
+                self._write_blob(digest, data)
+            stored = {key: value for key, value in message.items() if key != "content"}
+            stored["blob"] = digest
+            return stored
+        return message
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_path, digest[:2], digest)
+
+    def _write_blob(self, digest, data):
+        # (`data` can be a function returning the bytes, so they're only read if needed)
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            # Same image as before. That's the point.
+            return
+        if callable(data):
+            data = data()
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temp_path = f"{blob_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, blob_path)
+
+    def _resolve_blob(self, record):
+        message = {key: value for key, value in record.items() if key != "blob"}
+        try:
+            message["content"] = blob_store.add_file(
+                record["blob"], self._blob_path(record["blob"])
+            )
+        except OSError:
+            # The image is gone. Keep the rest of the conversation.
+            message = {
+                "role": record.get("role", "computer"),
+                "type": "message",
+                "content": "[An image was here, but it could not be found.]",
+            }
+        return message
+
+
+def fingerprint(message):
+    """
+    A cheap stand-in for comparing a message with the one we saved.
+    """
+    content = message.get("content")
+    digest = image_digest(message)
+    if digest:
+        # The same image gets the same fingerprint, whether it's a BlobRef or base64
+        rest = {key: value for key, value in message.items() if key != "content"}
+        key = json.dumps(rest, sort_keys=True) + digest
+    elif isinstance(content, str) and len(content) > FINGERPRINT_LIMIT:
+        # Big contents (images, long outputs) aren't edited in place, so this is plenty
+        rest = {key: value for key, value in message.items() if key != "content"}
+        key = json.dumps(rest, sort_keys=True) + str(len(content))
+        key += content[:256] + content[-256:]
+    else:
+        key = json.dumps(message, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def image_digest(message):
+    """
+    The sha256 of an image message's bytes (what its blob is named by), or None if it
+    isn't a base64 image.
+    """
+    content = message.get("content")
+    if isinstance(content, BlobRef):
+        return content.hash
+    if (
+        message.get("type") == "image"
+        and "base64" in message.get("format", "")
+        and isinstance(content, str)
+    ):
+        try:
+            return hashlib.sha256(base64.b64decode(content)).hexdigest()
+        except ValueError:
+            return None
+    return None
+
+
+def is_conversation_file(filename):
+    return filename.endswith((".json", ".jsonl"))
+
+
+def load_conversation(path, resolve_blobs=True):
+    """
+    Loads a saved conversation, old (.json) or new (.jsonl). With `resolve_blobs=False`,
+    images stored out of line keep their "blob" hash instead of being read back in.
+    """
+    if path.endswith(".jsonl"):
+        store = ConversationStore(path)
+        if not resolve_blobs:
+            return store._read_messages(resolve_blobs=False)
+        return store.load()
+    with open(path, "r") as f:
+        return json.load(f)
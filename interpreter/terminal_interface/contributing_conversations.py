@@ -6,6 +6,11 @@ from typing import List, TypedDict
 from importlib.metadata import version, PackageNotFoundError
 import requests
 
+from interpreter.core.utils.blob_store import materialize
+from interpreter.core.utils.conversation_store import (
+    is_conversation_file,
+    load_conversation,
+)
 from interpreter.terminal_interface.profiles.profiles import write_key_to_profile
 from interpreter.terminal_interface.utils.display_markdown_message import (
     display_markdown_message,
@@ -143,22 +148,16 @@ def write_to_contribution_cache(contribution_cache: ContributionCache):
 
 
 def get_all_conversations(interpreter) -> List[List]:
-    def is_conversation_path(path: str):
-        _, ext = os.path.splitext(path)
-        return ext == ".json"
-
     history_path = interpreter.conversation_history_path
     all_conversations: List[List] = []
     conversation_files = (
         os.listdir(history_path) if os.path.exists(history_path) else []
     )
     for mpath in conversation_files:
-        if not is_conversation_path(mpath):
+        if not is_conversation_file(mpath):
             continue
         full_path = os.path.join(history_path, mpath)
-        with open(full_path, "r") as cfile:
-            conversation = json.load(cfile)
-            all_conversations.append(conversation)
+        all_conversations.append(load_conversation(full_path))
     return all_conversations
 
 
@@ -177,7 +176,7 @@ def contribute_conversations(
 
     payload = {
         "conversation_id": conversation_id,
-        "conversations": conversations,
+        "conversations": materialize(conversations),
         "oi_version": oi_version,
         "feedback": feedback,
     }
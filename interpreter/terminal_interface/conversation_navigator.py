@@ -9,9 +9,13 @@ import subprocess
 
 import inquirer
 
+from ..core.utils.conversation_index import ConversationIndex
+from ..core.utils.conversation_store import ConversationStore, load_conversation
 from .render_past_conversation import render_past_conversation
 from .utils.local_storage_path import get_storage_path
 
+PAGE_SIZE = 20
+
 
 def conversation_navigator(interpreter):
     import time
@@ -30,55 +34,96 @@ def conversation_navigator(interpreter):
         print(f"No conversations found in {conversations_dir}")
         return None
 
-    # Get list of all JSON files in the directory and sort them by modification time, newest first
-    json_files = sorted(
-        [f for f in os.listdir(conversations_dir) if f.endswith(".json")],
-        key=lambda x: os.path.getmtime(os.path.join(conversations_dir, x)),
-        reverse=True,
-    )
-
-    # Make a dict that maps reformatted "First few words... (September 23rd)" -> "First_few_words__September_23rd.json" (original file name)
-    readable_names_and_filenames = {}
-    for filename in json_files:
-        name = (
-            filename.replace(".json", "")
-            .replace(".JSON", "")
-            .replace("__", "... (")
-            .replace("_", " ")
-            + ")"
-        )
-        readable_names_and_filenames[name] = filename
-
-    # Add the option to open the folder. This doesn't map to a filename, we'll catch it
-    readable_names_and_filenames_list = list(readable_names_and_filenames.keys())
-    readable_names_and_filenames_list = [
-        "Open Folder →"
-    ] + readable_names_and_filenames_list
-
-    # Use inquirer to let the user select a file
-    questions = [
-        inquirer.List(
-            "name",
-            message="",
-            choices=readable_names_and_filenames_list,
-        ),
-    ]
-    answers = inquirer.prompt(questions)
-
-    # User chose to exit
-    if not answers:
-        return
-
-    # If the user selected to open the folder, do so and return
-    if answers["name"] == "Open Folder →":
-        open_folder(conversations_dir)
-        return
-
-    selected_filename = readable_names_and_filenames[answers["name"]]
-
-    # Open the selected file and load the JSON data
-    with open(os.path.join(conversations_dir, selected_filename), "r") as f:
-        messages = json.load(f)
+    index = ConversationIndex(conversations_dir)
+    index.refresh()
+
+    query = None
+    page = 0
+    while True:
+        if query:
+            # Full-text search over everything said, best match first
+            total = index.count_matches(query)
+            conversations = index.search(
+                query, offset=page * PAGE_SIZE, limit=PAGE_SIZE
+            )
+        else:
+            total = index.count()
+            conversations = index.list(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
+
+        # Map "First few words... (September 23rd)" -> "First_few_words__September_23rd.jsonl"
+        readable_names_and_filenames = {}
+        for conversation in conversations:
+            name = conversation["title"]
+            if conversation.get("snippet"):
+                name += "  " + " ".join(conversation["snippet"].split())[:80]
+            while name in readable_names_and_filenames:
+                name += " "  # inquirer needs every choice to be different
+            readable_names_and_filenames[name] = conversation["filename"]
+
+        # Add the options to open the folder, search and turn the page. These don't map to a filename, we'll catch them
+        choices = ["Open Folder →", "Search →"]
+        if query:
+            choices.append("Show All →")
+        if page > 0:
+            choices.append("← Previous Page")
+        choices += list(readable_names_and_filenames.keys())
+        if (page + 1) * PAGE_SIZE < total:
+            choices.append("Next Page →")
+
+        # Use inquirer to let the user select a file
+        questions = [
+            inquirer.List(
+                "name",
+                message=f"{total} conversations"
+                + (f' matching "{query}"' if query else "")
+                + (f" (page {page + 1})" if total > PAGE_SIZE else ""),
+                choices=choices,
+            ),
+        ]
+        answers = inquirer.prompt(questions)
+
+        # User chose to exit
+        if not answers:
+            return
+
+        # If the user selected to open the folder, do so and return
+        if answers["name"] == "Open Folder →":
+            open_folder(conversations_dir)
+            return
+        if answers["name"] == "Search →":
+            search = inquirer.prompt([inquirer.Text("query", message="Search")])
+            query = search["query"].strip() if search else None
+            page = 0
+            continue
+        if answers["name"] == "Show All →":
+            query = None
+            page = 0
+            continue
+        if answers["name"] == "← Previous Page":
+            page -= 1
+            continue
+        if answers["name"] == "Next Page →":
+            page += 1
+            continue
+
+        selected_filename = readable_names_and_filenames[answers["name"]]
+        break
+
+    # Only now do we read the conversation itself
+    messages = load_conversation(os.path.join(conversations_dir, selected_filename))
+
+    # Bring back the variables it left in Python, if they were saved. (Snapshots are
+    # pickles, which can run any code when they're loaded. This only loads them with
+    # kernel_snapshots on, from your own conversations folder)
+    snapshot_path = ConversationStore(
+        os.path.join(conversations_dir, selected_filename)
+    ).snapshot_path
+    if interpreter.kernel_snapshots and os.path.exists(snapshot_path):
+        try:
+            interpreter.computer.terminal.restore(snapshot_path)
+        except Exception:
+            if interpreter.debug:
+                raise
 
     # Pass the data into render_past_conversation
     render_past_conversation(messages)
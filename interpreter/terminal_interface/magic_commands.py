@@ -5,6 +5,8 @@ import sys
 import time
 from datetime import datetime
 
+from ..core.utils.blob_store import json_default
+from ..core.utils.conversation_index import ConversationIndex
 from ..core.utils.system_debug_info import system_info
 from .utils.count_tokens import count_messages_tokens
 from .utils.export_to_markdown import export_to_markdown
@@ -15,11 +17,11 @@ def handle_undo(self, arguments):
     # Therefore user can jump back to the latest point of conversation.
     # Also gives a visual representation of the messages removed.
 
-    if len(self.messages) == 0:
+    if len(self._messages) == 0:
         return
     # Find the index of the last 'role': 'user' entry
     last_user_index = None
-    for i, message in enumerate(self.messages):
+    for i, message in enumerate(self._messages):
         if message.get("role") == "user":
             last_user_index = i
 
@@ -28,7 +30,7 @@ def handle_undo(self, arguments):
     # Remove all messages after the last 'role': 'user'
     if last_user_index is not None:
         removed_messages = self.messages[last_user_index:]
-        self.messages = self.messages[:last_user_index]
+        self._messages = self._messages[:last_user_index]
 
     print("")  # Aesthetics.
 
@@ -59,6 +61,7 @@ def handle_help(self, arguments):
         "%info": "Show system and interpreter information",
         "%jupyter": "Export the conversation to a Jupyter notebook file",
         "%markdown [path]": "Export the conversation to a specified Markdown path. If no path is provided, it will be saved to the Downloads folder with a generated conversation name.",
+        "%search [query]": "Search everything said in your saved conversations. Resume one with `interpreter --conversations`.",
     }
 
     base_message = ["> **Available Commands:**\n\n"]
@@ -81,7 +84,7 @@ def handle_verbose(self, arguments=None):
     if arguments == "" or arguments == "true":
         self.display_message("> Entered verbose mode")
         print("\n\nCurrent messages:\n")
-        for message in self.messages:
+        for message in self._messages:
             message = message.copy()
             if message["type"] == "image" and message.get("format") not in [
                 "path",
@@ -104,7 +107,7 @@ def handle_debug(self, arguments=None):
     if arguments == "" or arguments == "true":
         self.display_message("> Entered debug mode")
         print("\n\nCurrent messages:\n")
-        for message in self.messages:
+        for message in self._messages:
             message = message.copy()
             if message["type"] == "image" and message.get("format") not in [
                 "path",
@@ -154,7 +157,7 @@ def handle_save_message(self, json_path):
     if not json_path.endswith(".json"):
         json_path += ".json"
     with open(json_path, "w") as f:
-        json.dump(self.messages, f, indent=2)
+        json.dump(self._messages, f, indent=2, default=json_default)
 
     self.display_message(f"> messages json export to {os.path.abspath(json_path)}")
 
@@ -171,18 +174,15 @@ def handle_load_message(self, json_path):
 
 
 def handle_count_tokens(self, prompt):
-    messages = [{"role": "system", "message": self.system_message}] + self.messages
+    messages = [
+        {"role": "system", "type": "message", "content": self.system_message}
+    ] + self.messages
 
     outputs = []
 
-    if len(self.messages) == 0:
-        (conversation_tokens, conversation_cost) = count_messages_tokens(
-            messages=messages, model=self.llm.model
-        )
-    else:
-        (conversation_tokens, conversation_cost) = count_messages_tokens(
-            messages=messages, model=self.llm.model
-        )
+    (conversation_tokens, conversation_cost) = count_messages_tokens(
+        messages=messages, model=self.llm.model
+    )
 
     outputs.append(
         (
@@ -269,7 +269,7 @@ def jupyter(self, arguments):
     nb = new_notebook()
     cells = []
 
-    for msg in self.messages:
+    for msg in self._messages:
         if msg["role"] == "user" and msg["type"] == "message":
             # Prefix user messages with '>' to render them as block quotes, so they stand out
             content = f"> {msg['content']}"
@@ -299,17 +299,51 @@ def jupyter(self, arguments):
 
 def markdown(self, export_path: str):
     # If it's an empty conversations
-    if len(self.messages) == 0:
+    if len(self._messages) == 0:
         print("No messages to export.")
         return
 
     # If user doesn't specify the export path, then save the exported PDF in '~/Downloads'
     if not export_path:
-        export_path = get_downloads_path() + f"/{self.conversation_filename[:-4]}md"
+        export_path = (
+            get_downloads_path()
+            + f"/{os.path.splitext(self.conversation_filename)[0]}.md"
+        )
 
     export_to_markdown(self.messages, export_path)
 
 
+def handle_search(self, query):
+    if not query:
+        self.display_message("> Usage: `%search [query]`")
+        return
+
+    index = ConversationIndex(self.conversation_history_path)
+    try:
+        index.refresh()
+        total = index.count_matches(query)
+        results = index.search(query, limit=10)
+    finally:
+        index.close()
+
+    if not results:
+        self.display_message(f"> No saved conversations mention `{query}`.")
+        return
+
+    lines = [f"> **{total} conversations** mention `{query}`:\n"]
+    for result in results:
+        date = datetime.fromtimestamp(result["mtime"]).strftime("%b %d, %Y")
+        lines.append(f"- **{result['title']}** ({date})")
+        snippet = result.get("snippet") or result["first_user_message"]
+        if snippet:
+            snippet = " ".join(snippet.split())
+            lines.append(f"  {snippet}")
+    if total > len(results):
+        lines.append(f"\n...and {total - len(results)} more.")
+    lines.append("\nRun `interpreter --conversations` and search to resume one.")
+    self.display_message("\n".join(lines))
+
+
 def handle_magic_command(self, user_input):
     # Handle shell
     if user_input.startswith("%%"):
@@ -332,6 +366,7 @@ def handle_magic_command(self, user_input):
         "info": handle_info,
         "jupyter": jupyter,
         "markdown": markdown,
+        "search": handle_search,
     }
 
     user_input = user_input[1:].strip()  # Capture the part after the `%`
@@ -307,7 +307,7 @@ def start_terminal_interface(interpreter):
     # i shortcut
     if len(sys.argv) > 1 and not sys.argv[1].startswith("-"):
         message = " ".join(sys.argv[1:])
-        interpreter.messages.append(
+        interpreter._messages.append(
             {"role": "user", "type": "message", "content": "I " + message}
         )
         sys.argv = sys.argv[:1]
@@ -616,7 +616,7 @@ def main():
 
             if not interpreter.offline and not interpreter.disable_telemetry:
                 feedback = None
-                if len(interpreter.messages) > 3:
+                if len(interpreter._messages) > 3:
                     feedback = (
                         input("\n\nWas Open Interpreter helpful? (y/n): ")
                         .strip()
@@ -47,11 +47,11 @@ except:
 def terminal_interface(interpreter, message):
     # Auto run and offline (this.. this isn't right) don't display messages.
     # Probably worth abstracting this to something like "debug_cli" at some point.
-    # If (len(interpreter.messages) == 1), they probably used the advanced "i {command}" entry, so no message should be displayed.
+    # If (len(interpreter._messages) == 1), they probably used the advanced "i {command}" entry, so no message should be displayed.
     if (
         not interpreter.auto_run
         and not interpreter.offline
-        and not (len(interpreter.messages) == 1)
+        and not (len(interpreter._messages) == 1)
     ):
         interpreter_intro_message = [
             "**Open Interpreter** will require approval before running code."
@@ -83,13 +83,13 @@ def terminal_interface(interpreter, message):
     while True:
         if interactive:
             if (
-                len(interpreter.messages) == 1
-                and interpreter.messages[-1]["role"] == "user"
-                and interpreter.messages[-1]["type"] == "message"
+                len(interpreter._messages) == 1
+                and interpreter._messages[-1]["role"] == "user"
+                and interpreter._messages[-1]["type"] == "message"
             ):
                 # They passed in a message already, probably via "i {command}"!
-                message = interpreter.messages[-1]["content"]
-                interpreter.messages = interpreter.messages[:-1]
+                message = interpreter._messages[-1]["content"]
+                interpreter._messages = interpreter._messages[:-1]
             else:
                 ### This is the primary input for Open Interpreter.
                 try:
@@ -142,7 +142,7 @@ def terminal_interface(interpreter, message):
                 ## If we found an image, add it to the message
                 if image_path:
                     # Add the text interpreter's message history
-                    interpreter.messages.append(
+                    interpreter._messages.append(
                         {
                             "role": "user",
                             "type": "message",
@@ -249,7 +249,7 @@ def terminal_interface(interpreter, message):
                             with open(tf.name, "r") as tf:
                                 code = tf.read()
 
-                            interpreter.messages[-1]["content"] = code  # Give it code
+                            interpreter._messages[-1]["content"] = code  # Give it code
 
                             # Delete the temporary file
                             os.unlink(tf.name)
@@ -259,7 +259,7 @@ def terminal_interface(interpreter, message):
                             active_block.code = code
                         else:
                             # User declined to run code.
-                            interpreter.messages.append(
+                            interpreter._messages.append(
                                 {
                                     "role": "user",
                                     "type": "message",
@@ -301,7 +301,7 @@ def terminal_interface(interpreter, message):
                         active_block.message += chunk["content"]
 
                     if "end" in chunk and interpreter.os:
-                        last_message = interpreter.messages[-1]["content"]
+                        last_message = interpreter._messages[-1]["content"]
 
                         # Remove markdown lists and the line above markdown lists
                         lines = last_message.split("\n")
@@ -370,7 +370,7 @@ def terminal_interface(interpreter, message):
 
                     assistant_code_blocks = [
                         m
-                        for m in interpreter.messages
+                        for m in interpreter._messages
                         if m.get("role") == "assistant" and m.get("type") == "code"
                     ]
                     if assistant_code_blocks:
@@ -398,12 +398,12 @@ def terminal_interface(interpreter, message):
                     # and that if we made a new block here with "recipient: assistant" it wouldn't add new console outputs to that block (thus hiding them from the user)
 
                     if (
-                        interpreter.messages[-1].get("format") != "output"
-                        or interpreter.messages[-1]["role"] != "computer"
-                        or interpreter.messages[-1]["type"] != "console"
+                        interpreter._messages[-1].get("format") != "output"
+                        or interpreter._messages[-1]["role"] != "computer"
+                        or interpreter._messages[-1]["type"] != "console"
                     ):
                         # If the last message isn't a console output, make a new block
-                        interpreter.messages.append(
+                        interpreter._messages.append(
                             {
                                 "role": "computer",
                                 "type": "console",
@@ -413,12 +413,12 @@ def terminal_interface(interpreter, message):
                         )
                     else:
                         # If the last message is a console output, simply append the extra output to it
-                        interpreter.messages[-1]["content"] += (
+                        interpreter._messages[-1]["content"] += (
                             "\n" + extra_computer_output
                         )
-                        interpreter.messages[-1]["content"] = interpreter.messages[-1][
-                            "content"
-                        ].strip()
+                        interpreter._messages[-1]["content"] = interpreter._messages[
+                            -1
+                        ]["content"].strip()
 
                 # Console
                 if chunk["type"] == "console":
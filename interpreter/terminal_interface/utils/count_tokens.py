@@ -1,3 +1,7 @@
+import functools
+
+from ...core.llm.utils.image_retention import estimate_image_tokens, image_dimensions
+
 try:
     import tiktoken
     from litellm import cost_per_token
@@ -5,31 +9,77 @@ except:
     # Non-essential feature
     pass
 
+# Tokens OpenAI adds around every message ("<|start|>role\n...<|end|>"), and to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REQUEST = 3
 
-def count_tokens(text="", model="gpt-4"):
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model="gpt-4"):
     """
-    Count the number of tokens in a string
+    Returns the tiktoken encoder for `model`, or None if we can't load one.
+    Encoders are loaded once per model and shared by everything in the process.
     """
-    try:
-        # Fix bug where models starting with openai/ for example can't find tokenizer
-        if "/" in model:
-            model = model.split("/")[-1]
+    model = model or "gpt-4"
 
+    # Fix bug where models starting with openai/ for example can't find tokenizer
+    if "/" in model:
+        model = model.split("/")[-1]
+
+    try:
         # At least give an estimate if we can't find the tokenizer
         try:
-            encoder = tiktoken.encoding_for_model(model)
+            return tiktoken.encoding_for_model(model)
         except KeyError:
+            # (Only printed once per model, this is cached)
             print(
                 f"Could not find tokenizer for {model}. Defaulting to gpt-4 tokenizer."
             )
-            encoder = tiktoken.encoding_for_model("gpt-4")
+            return tiktoken.encoding_for_model("gpt-4")
+    except:
+        # tiktoken isn't installed, or couldn't download the encoding
+        return None
 
-        return len(encoder.encode(text))
+
+def count_tokens(text="", model="gpt-4"):
+    """
+    Count the number of tokens in a string
+    """
+    encoder = get_encoder(model)
+    if encoder is None:
+        return len(text) // 4
+    try:
+        return len(encoder.encode(text, disallowed_special=()))
     except:
         # Non-essential feature
         return 0
 
 
+def encode_batch(texts, model="gpt-4"):
+    """
+    Tokenizes many strings at once (tiktoken spreads them over threads).
+    Returns a list of token lists, or None if there's no encoder for this model.
+    """
+    encoder = get_encoder(model)
+    if encoder is None:
+        return None
+    return encoder.encode_batch(list(texts), disallowed_special=())
+
+
+def count_tokens_batch(texts, model="gpt-4"):
+    """
+    Count the number of tokens in each of a list of strings
+    """
+    texts = list(texts)
+    try:
+        encoded = encode_batch(texts, model=model)
+    except:
+        encoded = None
+    if encoded is None:
+        return [len(text) // 4 for text in texts]
+    return [len(tokens) for tokens in encoded]
+
+
 def token_cost(tokens=0, model="gpt-4"):
     """
     Calculate the cost of the current number of tokens
@@ -44,24 +94,72 @@ def token_cost(tokens=0, model="gpt-4"):
         return 0
 
 
-def count_messages_tokens(messages=[], model=None):
+def messages_tokens(messages=[], model=None, overhead=False):
     """
-    Count the number of tokens in a list of messages
+    Count the number of tokens in a list of messages: LMC messages (`interpreter.messages`),
+    OpenAI-style messages, old-style {"message", "code", "output"} messages or strings.
+    Images are estimated from their size. With `overhead`, adds the tokens a chat API wraps
+    each message in (for checking a request against the context window).
     """
-    try:
-        tokens_used = 0
+    texts = []
+    tokens_used = 0
+
+    for message in messages:
+        if isinstance(message, str):
+            texts.append(message)
+            continue
+
+        if overhead:
+            tokens_used += TOKENS_PER_MESSAGE
+
+        if message.get("type") == "image":
+            tokens_used += _image_tokens(
+                message.get("format", ""),
+                message.get("content", ""),
+                message.get("detail"),
+                model,
+            )
+            continue
+
+        # Legacy keys
+        for key in ["message", "code", "output"]:
+            if isinstance(message.get(key), str):
+                texts.append(message[key])
 
-        for message in messages:
-            if isinstance(message, str):
-                tokens_used += count_tokens(message, model=model)
-            elif "message" in message:
-                tokens_used += count_tokens(message["message"], model=model)
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            # OpenAI-style content parts
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    image_url = part.get("image_url", {})
+                    tokens_used += _image_tokens(
+                        "url", image_url.get("url", ""), image_url.get("detail"), model
+                    )
+        elif content is not None:
+            texts.append(str(content))
 
-                if "code" in message:
-                    tokens_used += count_tokens(message["code"], model=model)
+        # Tool calls
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            texts.append(function.get("name", ""))
+            texts.append(function.get("arguments", ""))
 
-                if "output" in message:
-                    tokens_used += count_tokens(message["output"], model=model)
+    if overhead and messages:
+        tokens_used += TOKENS_PER_REQUEST
+
+    return tokens_used + sum(count_tokens_batch(texts, model=model))
+
+
+def count_messages_tokens(messages=[], model=None):
+    """
+    Count the number of tokens in a list of messages
+    """
+    try:
+        tokens_used = messages_tokens(messages, model=model)
 
         prompt_cost = token_cost(tokens_used, model=model)
 
@@ -69,3 +167,13 @@ def count_messages_tokens(messages=[], model=None):
     except:
         # Non-essential feature
         return (0, 0)
+
+
+def _image_tokens(format, content, detail, model):
+    if format == "url":
+        if not content.startswith("data:"):
+            # Can't know its size without downloading it
+            return estimate_image_tokens(None, None, detail, model)
+        format, content = "base64", content.split(",", 1)[1]
+    width, height = image_dimensions(format, content)
+    return estimate_image_tokens(width, height, detail, model)
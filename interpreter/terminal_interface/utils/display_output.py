@@ -1,9 +1,9 @@
-import base64
 import os
 import platform
 import subprocess
 import tempfile
 
+from ...core.utils.blob_store import image_bytes
 from .in_jupyter_notebook import in_jupyter_notebook
 
 
@@ -16,7 +16,7 @@ def display_output(output):
         elif output["type"] == "image":
             if "base64" in output["format"]:
                 # Decode the base64 image data
-                image_data = base64.b64decode(output["content"])
+                image_data = image_bytes(output["content"])
                 display(Image(image_data))
             elif output["format"] == "path":
                 # Display the image file on the system
@@ -46,7 +46,7 @@ def display_output_cli(output):
             with tempfile.NamedTemporaryFile(
                 delete=False, suffix="." + extension
             ) as tmp_file:
-                image_data = base64.b64decode(output["content"])
+                image_data = image_bytes(output["content"])
                 tmp_file.write(image_data)
 
                 # # Display in Terminal (DISABLED, i couldn't get it to work)
@@ -1,9 +1,16 @@
-import os
-
+from ...core.utils.conversation_index import ConversationIndex
 from .local_storage_path import get_storage_path
 
 
-def get_conversations():
-    conversations_dir = get_storage_path("conversations")
-    json_files = [f for f in os.listdir(conversations_dir) if f.endswith(".json")]
-    return json_files
+def get_conversations(offset=0, limit=None, query=None):
+    """
+    Returns the filenames of saved conversations, newest first.
+    """
+    index = ConversationIndex(get_storage_path("conversations"))
+    index.refresh()
+    if limit is None:
+        limit = -1  # (No limit, to SQLite)
+    return [
+        conversation["filename"]
+        for conversation in index.list(offset=offset, limit=limit, query=query)
+    ]
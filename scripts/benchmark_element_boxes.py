@@ -0,0 +1,82 @@
+"""
+Times the element box pipeline used by `computer.display.find` on synthetic desktop
+screenshots (windows, toolbars, icon grids and text) at common screen sizes.
+
+    python scripts/benchmark_element_boxes.py [repeats]
+"""
+
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from interpreter.core.computer.display.point.boxes import (
+    combine_boxes,
+    element_boxes,
+    expand_boxes,
+    within_size,
+)
+
+SIZES = [(1366, 768), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+
+def synthetic_screenshot(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width), 236, dtype=np.uint8)
+
+    # Menu bar and dock
+    cv2.rectangle(image, (0, 0), (width, 28), 210, -1)
+    cv2.rectangle(image, (width // 4, height - 80), (3 * width // 4, height), 200, -1)
+    for x in range(width // 4 + 16, 3 * width // 4 - 48, 64):
+        cv2.rectangle(image, (x, height - 68), (x + 48, height - 20), 90, -1)
+
+    # Some windows, each with a toolbar full of icons and lines of text
+    for _ in range(6):
+        x0 = int(rng.integers(0, width - 600))
+        y0 = int(rng.integers(30, height - 500))
+        x1, y1 = x0 + int(rng.integers(400, 600)), y0 + int(rng.integers(300, 500))
+        cv2.rectangle(image, (x0, y0), (x1, y1), 250, -1)
+        cv2.rectangle(image, (x0, y0), (x1, y1), 120, 1)
+        for x in range(x0 + 10, x1 - 30, 36):
+            cv2.circle(image, (x + 12, y0 + 20), 10, int(rng.integers(40, 160)), 2)
+        for y in range(y0 + 60, y1 - 20, 22):
+            cv2.putText(
+                image,
+                "Lorem ipsum dolor sit amet",
+                (x0 + 12, y),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                30,
+                1,
+            )
+
+    return image
+
+
+def run(gray):
+    width, height = gray.shape[1], gray.shape[0]
+    boxes = element_boxes(gray)
+    boxes = boxes[within_size(boxes, 10, 500, 10, 500)]
+    boxes = expand_boxes(boxes, 7, (width, height))
+    boxes, _ = combine_boxes(boxes)
+    return boxes
+
+
+def main(repeats=5):
+    for width, height in SIZES:
+        gray = synthetic_screenshot(width, height)
+        run(gray)  # Warm up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            boxes = run(gray)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{width}x{height}: {len(boxes)} boxes, "
+            f"median {np.median(timings) * 1000:.1f} ms, best {min(timings) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
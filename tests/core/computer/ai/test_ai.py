@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.ai import ai
+from interpreter.core.computer.ai.ai import Ai, group_responses
+
+
+class FakeLlm:
+    """
+    Answers each call with "<n words>", and remembers how many calls ran at once.
+    """
+
+    model = "gpt-4o"
+    api_key = api_base = api_version = max_tokens = None
+    temperature = 0
+    _is_loaded = True
+
+    def __init__(self, fail_first=0):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+        self.fail_first = fail_first
+
+    def completions(self, **params):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            fail = self.calls <= self.fail_first
+        try:
+            time.sleep(0.01)
+            if fail:
+                raise ConnectionError("Try again")
+            words = len(params["messages"][1]["content"].split())
+            yield {"choices": [{"delta": {"content": f"<{words} words>"}}]}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestAi(unittest.TestCase):
+    def setUp(self):
+        self.llm = FakeLlm()
+        computer = mock.Mock()
+        computer.interpreter.llm = self.llm
+        self.ai = Ai(computer)
+        self.ai.chunk_size = 100
+        self.ai.overlap = 0
+        self.ai.max_workers = 3
+
+    def test_group_responses_always_shrinks(self):
+        count_tokens = len
+
+        groups = group_responses(["aaaa", "bbbb", "cccc", "dd", "e"], 5, count_tokens)
+
+        self.assertEqual(groups, [["aaaa", "bbbb"], ["cccc", "dd", "e"]])
+
+    def test_query_reduces_to_one_answer_with_bounded_concurrency(self):
+        progress = []
+        text = "word " * 20000
+
+        result = self.ai.query(
+            text, "Summarize", progress=lambda *p: progress.append(p)
+        )
+
+        self.assertRegex(result, r"^<\d+ words>$")
+        self.assertLessEqual(self.llm.max_running, 3)
+        map_updates = [p for p in progress if p[0] == "map"]
+        self.assertEqual(map_updates[-1][1], len(map_updates))
+        self.assertTrue(any(p[0].startswith("reduce") for p in progress))
+
+    def test_failed_chunks_are_retried(self):
+        self.llm.fail_first = 2
+
+        with mock.patch.object(ai, "RETRY_BACKOFF", 0):
+            result = self.ai.query("word " * 10, "Summarize")
+
+        self.assertEqual(result, "<10 words>")
+        self.assertEqual(self.llm.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import unittest
+from unittest import mock
+
+import tiktoken
+
+from interpreter.core.computer.ai import chunking
+from interpreter.core.computer.ai.chunking import get_encoding, iter_chunks, iter_tokens
+
+TEXT = "".join(
+    f"Line {i}: the quick brown fox jumps over the lazy dog!\n    indented {i * 7}\n"
+    for i in range(500)
+)
+
+# cl100k_base's pre-tokenizer, with a small vocabulary so we don't need to download one
+CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+
+
+def small_encoding():
+    ranks = {bytes([i]): i for i in range(256)}
+    for word in ["Line", " the", " quick", " brown", " fox", " indented", "!\n", "   "]:
+        word = word.encode()
+        for end in range(2, len(word) + 1):
+            ranks.setdefault(word[:end], len(ranks))
+    return tiktoken.Encoding(
+        "small", pat_str=CL100K_PATTERN, mergeable_ranks=ranks, special_tokens={}
+    )
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        self.encoding = small_encoding()
+        patcher = mock.patch.object(
+            chunking, "get_encoding", lambda model: self.encoding
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_incremental_tokens_match_whole_text(self):
+        encoding = self.encoding
+
+        tokens = []
+        for block in iter_tokens(io.StringIO(TEXT), encoding, block_size=1000):
+            tokens.extend(block)
+
+        self.assertEqual(tokens, encoding.encode(TEXT, disallowed_special=()))
+
+    def test_chunks_overlap_and_cover_everything(self):
+        encoding = self.encoding
+        tokens = encoding.encode(TEXT, disallowed_special=())
+
+        chunks = list(
+            iter_chunks(io.BytesIO(TEXT.encode()), 300, "gpt-4o", 20, block_size=1000)
+        )
+
+        expected = [
+            encoding.decode(tokens[i : i + 300])
+            for i in range(0, len(tokens) - 20, 280)
+        ]
+        self.assertEqual(chunks, expected)
+
+    def test_sources(self):
+        from_string = list(iter_chunks(TEXT, 100, "gpt-4o"))
+        from_iterator = list(iter_chunks(iter(TEXT.splitlines(True)), 100, "gpt-4o"))
+
+        self.assertEqual(from_string, from_iterator)
+        self.assertEqual("".join(from_string), TEXT)
+
+    def test_encoders_are_cached(self):
+        # (The real one)
+        self.assertIs(get_encoding("gpt-4o"), get_encoding("gpt-4o"))
+
+
+if __name__ == "__main__":
+    unittest.main()
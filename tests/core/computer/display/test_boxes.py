@@ -0,0 +1,56 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from interpreter.core.computer.display.point.boxes import (
+    combine_boxes,
+    element_boxes,
+    expand_boxes,
+    overlaps_any,
+)
+
+
+class TestBoxes(unittest.TestCase):
+    def test_element_boxes_finds_shapes(self):
+        # Arrange
+        gray = np.full((200, 300), 240, dtype=np.uint8)
+        cv2.rectangle(gray, (20, 30), (59, 69), 20, -1)
+        cv2.rectangle(gray, (150, 100), (199, 129), 20, -1)
+
+        # Act
+        boxes = element_boxes(gray)
+
+        # Assert
+        boxes = {tuple(box) for box in boxes.tolist()}
+        self.assertIn((20, 30, 40, 40), boxes)
+        self.assertIn((150, 100, 50, 30), boxes)
+
+    def test_combine_boxes_merges_chains(self):
+        # Arrange
+        # 0 and 1 overlap, their union then overlaps 2. 3 is on its own.
+        boxes = np.array(
+            [[0, 0, 10, 10], [5, 5, 10, 10], [14, 0, 10, 3], [100, 100, 5, 5]]
+        )
+
+        # Act
+        combined, first_member = combine_boxes(boxes, cell_size=8)
+
+        # Assert
+        self.assertEqual(combined.tolist(), [[0, 0, 24, 15], [100, 100, 5, 5]])
+        self.assertEqual(first_member.tolist(), [0, 3])
+
+    def test_overlaps_any(self):
+        boxes = np.array([[0, 0, 10, 10], [10, 0, 10, 10], [50, 50, 5, 5]])
+        text = np.array([[9, 9, 1, 1]])
+
+        mask = overlaps_any(boxes, text, (100, 100))
+
+        self.assertEqual(mask.tolist(), [True, False, False])
+
+    def test_expand_boxes_stays_on_screen(self):
+        boxes = np.array([[2, 2, 10, 10], [90, 90, 10, 10]])
+
+        expanded = expand_boxes(boxes, 5, (100, 100))
+
+        self.assertEqual(expanded.tolist(), [[0, 0, 17, 17], [85, 85, 15, 15]])
@@ -0,0 +1,91 @@
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from interpreter.core.computer.display.point.embedding_cache import EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_persists_across_instances(self):
+        # Arrange
+        cache = EmbeddingCache(self.path, max_entries=10)
+        embedding = np.arange(4, dtype=np.float32)
+
+        # Act
+        cache["icon"] = embedding
+        reopened = EmbeddingCache(self.path, max_entries=10)
+
+        # Assert
+        self.assertIn("icon", reopened)
+        np.testing.assert_array_equal(reopened["icon"], embedding)
+
+    def test_evicts_least_recently_used(self):
+        # Arrange
+        cache = EmbeddingCache(self.path, max_entries=2)
+        cache.update({"a": np.ones(4), "b": np.ones(4) * 2})
+        time.sleep(0.01)
+        cache.get("a")  # "b" is now the least recently used
+
+        # Act
+        cache["c"] = np.ones(4) * 3
+
+        # Assert
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_sees_writes_from_other_instances(self):
+        # Arrange
+        first = EmbeddingCache(self.path, max_entries=10, refresh_interval=0)
+        second = EmbeddingCache(self.path, max_entries=10, refresh_interval=0)
+
+        # Act
+        first["a"] = np.ones(4)
+        second["b"] = np.ones(4) * 2
+
+        # Assert
+        self.assertIn("b", first)
+        self.assertIn("a", second)
+        np.testing.assert_array_equal(first["b"], np.ones(4) * 2)
+
+    def test_never_returns_a_row_another_instance_reused(self):
+        # Arrange
+        reader = EmbeddingCache(self.path, max_entries=1, refresh_interval=3600)
+        writer = EmbeddingCache(self.path, max_entries=1, refresh_interval=3600)
+        writer["a"] = np.ones(4)
+        reader.refresh(force=True)
+
+        # Act
+        writer["b"] = np.ones(4) * 2  # Evicts "a" and reuses its row
+
+        # Assert
+        self.assertIsNone(reader.get("a"))
+        self.assertEqual(reader.get_many(["a", "b"]).keys(), {"b"})
+
+    def test_new_embedding_size_resets_cache(self):
+        # Arrange
+        cache = EmbeddingCache(self.path, max_entries=10)
+        cache["a"] = np.ones(4)
+
+        # Act
+        cache["b"] = np.ones(8)
+
+        # Assert
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache["b"].shape, (8,))
+
+    def test_missing_key_raises_key_error(self):
+        cache = EmbeddingCache(self.path)
+
+        with self.assertRaises(KeyError):
+            cache["missing"]
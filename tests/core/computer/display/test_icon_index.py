@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+
+from interpreter.core.computer.display.point.icon_index import IconIndex
+
+
+class TestIconIndex(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        # Arrange
+        rng = np.random.default_rng(0)
+        icons = rng.normal(size=(50, 16))
+        queries = rng.normal(size=(3, 16))
+        index = IconIndex(icons)
+
+        # Act
+        results = index.search(queries, top_k=5)
+
+        # Assert
+        normalized = icons / np.linalg.norm(icons, axis=1, keepdims=True)
+        for query, hits in zip(queries, results):
+            scores = normalized @ (query / np.linalg.norm(query))
+            expected = list(np.argsort(-scores)[:5])
+            self.assertEqual([row for row, _ in hits], expected)
+            self.assertAlmostEqual(hits[0][1], scores[expected[0]], places=5)
+
+    def test_top_k_larger_than_index(self):
+        index = IconIndex(np.eye(3))
+
+        results = index.search(np.array([0.0, 1.0, 0.0]), top_k=10)
+
+        self.assertEqual([row for row, _ in results[0]][0], 1)
+        self.assertEqual(len(results[0]), 3)
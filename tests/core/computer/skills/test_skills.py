@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.skills.skills import SKILL_FAILED_MARKER, Skills
+
+
+class TestSkills(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.computer = mock.MagicMock()
+        self.computer.interpreter.debug = False
+        self.computer.terminal._active_languages = {"python": object()}
+        self.computer.run.return_value = []
+        self.skills = Skills(self.computer)
+        self.skills.path = directory.name
+
+    def write_skill(self, name, code):
+        path = os.path.join(self.skills.path, name + ".py")
+        with open(path, "w") as f:
+            f.write(code)
+        return path
+
+    def imported_files(self):
+        code = self.computer.run.call_args[0][1]
+        return sorted(name for name in os.listdir(self.skills.path) if name in code)
+
+    def test_only_new_or_changed_skills_are_run_again(self):
+        self.write_skill("hello", "def hello():\n    print('hi')\n")
+        broken = self.write_skill("broken", "raise ValueError\n")
+        self.computer.run.return_value = [
+            {"type": "console", "format": "output", "content": "Traceback...\n"},
+            {
+                "type": "console",
+                "format": "output",
+                "content": f"{SKILL_FAILED_MARKER} {broken}\n",
+            },
+        ]
+        with mock.patch("builtins.print") as printed:
+            self.skills.import_skills()
+        self.assertEqual(self.imported_files(), ["broken.py", "hello.py"])
+        self.assertIn(broken, printed.call_args[0][0])
+
+        self.computer.run.reset_mock()
+        self.skills.import_skills()
+        self.computer.run.assert_not_called()
+
+        self.write_skill("bye", "def bye():\n    print('bye')\n")
+        self.skills.import_skills()
+        self.assertEqual(self.imported_files(), ["bye.py"])
+
+        # A new Python kernel has none of them
+        self.computer.terminal._active_languages["python"] = object()
+        self.skills.import_skills()
+        self.assertEqual(self.imported_files(), ["broken.py", "bye.py", "hello.py"])
+
+    def test_search_uses_names_and_docstrings(self):
+        self.write_skill(
+            "resize_images",
+            'def resize_images(folder, width):\n    """\n    Makes every image in a folder smaller.\n    """\n',
+        )
+        self.write_skill(
+            "send_email",
+            'def send_email(to, body):\n    """Sends an email from my account."""\n',
+        )
+
+        self.assertEqual(
+            self.skills.search("shrink the images in a folder"),
+            ["resize_images(): Makes every image in a folder smaller."],
+        )
+        self.assertEqual(
+            self.skills.search("email"),
+            ["send_email(): Sends an email from my account."],
+        )
+        self.assertEqual(len(self.skills.search("")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
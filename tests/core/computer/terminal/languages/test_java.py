@@ -0,0 +1,51 @@
+import unittest
+
+from interpreter.core.computer.terminal.languages.java import preprocess_jshell
+
+
+class TestPreprocessJshell(unittest.TestCase):
+    def test_markers_go_between_top_level_statements(self):
+        code = "\n".join(
+            [
+                "int x = 1;",
+                "if (x > 0) {",
+                '    System.out.println("{");',
+                "}",
+                "else {",
+                "}",
+                "System.out.println(x);",
+            ]
+        )
+        lines = preprocess_jshell(code).split("\n")
+        markers = [line for line in lines if "##active_line" in line]
+        self.assertEqual(
+            markers,
+            [
+                'System.out.println("##active_line1##");',
+                'System.out.println("##active_line2##");',
+                'System.out.println("##active_line7##");',
+            ],
+        )
+        self.assertEqual(lines[-1], 'System.out.println("##end_of_execution##");')
+
+    def test_classes_with_main_are_run(self):
+        code = "\n".join(
+            [
+                "package example;",
+                "public class Helper {}",
+                "public class Main {",
+                "    public static void main(String[] args) {",
+                '        System.out.println("hi");',
+                "    }",
+                "}",
+            ]
+        )
+        processed = preprocess_jshell(code)
+        self.assertNotIn("package", processed)
+        self.assertIn("\nclass Main {", processed)
+        self.assertEqual(processed.count("##active_line"), 2)
+        self.assertIn("\nMain.main(new String[0]);\n", processed)
+
+
+if __name__ == "__main__":
+    unittest.main()
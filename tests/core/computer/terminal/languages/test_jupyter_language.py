@@ -0,0 +1,29 @@
+import os
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.terminal.languages.jupyter_language import (
+    _preprocess_python,
+    preprocess_python,
+)
+
+
+class TestPreprocessPython(unittest.TestCase):
+    def test_repeated_code_is_only_processed_once(self):
+        code = "x = 1\n\nfor i in range(3):\n    x += i\nprint(x)"
+        with mock.patch.dict(os.environ, {"INTERPRETER_ACTIVE_LINE_DETECTION": "True"}):
+            processed = preprocess_python(code)
+            hits = _preprocess_python.cache_info().hits
+            self.assertEqual(preprocess_python(code), processed)
+            self.assertEqual(_preprocess_python.cache_info().hits, hits + 1)
+        self.assertIn("##active_line1##", processed)
+
+        # The setting is part of the key
+        with mock.patch.dict(
+            os.environ, {"INTERPRETER_ACTIVE_LINE_DETECTION": "False"}
+        ):
+            self.assertNotIn("##active_line", preprocess_python(code))
+
+
+if __name__ == "__main__":
+    unittest.main()
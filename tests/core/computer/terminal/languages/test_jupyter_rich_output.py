@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.terminal.languages.jupyter_rich_output import (
+    DATA_MIMETYPE,
+    MAX_FILES,
+    describe_array,
+    install,
+    load_data,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestRichOutput(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_formatter_is_used_for_display(self):
+        from IPython.core.interactiveshell import InteractiveShell
+
+        class Table:
+            pass
+
+        shell = InteractiveShell.instance()
+        formatter = install(shell)
+        formatter.for_type(Table, lambda table: {"summary": "a table"})
+
+        data, _ = shell.display_formatter.format(Table())
+        self.assertEqual(data[DATA_MIMETYPE], {"summary": "a table"})
+        self.assertIn("text/plain", data)
+
+        data, _ = shell.display_formatter.format(object())
+        self.assertNotIn(DATA_MIMETYPE, data)
+
+    @unittest.skipIf(np is None, "Needs numpy")
+    def test_arrays_are_summarized_and_saved(self):
+        array = np.arange(1000, dtype=float).reshape(100, 10)
+        described = describe_array(array, self.directory)
+
+        self.assertIn(
+            "shape (100, 10), dtype float64, min 0, mean 499.5", described["summary"]
+        )
+        self.assertEqual(os.path.dirname(described["path"]), self.directory)
+        loaded = load_data({"format": "npy", "content": described["path"]})
+        self.assertTrue((loaded == array).all())
+
+        self.assertIsNone(describe_array(np.arange(3), self.directory))
+
+    @unittest.skipIf(np is None, "Needs numpy")
+    def test_only_the_latest_files_are_kept(self):
+        array = np.zeros(1000)
+        paths = [describe_array(array, self.directory)["path"] for _ in range(15)]
+
+        self.assertEqual(len(os.listdir(self.directory)), MAX_FILES)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[-1]))
+
+    @unittest.skipIf(np is None, "Needs numpy")
+    def test_no_room_means_summary_only(self):
+        with mock.patch("numpy.save", side_effect=OSError(28, "No space left")):
+            described = describe_array(np.zeros(1000), self.directory)
+
+        self.assertIsNone(described["path"])
+        self.assertIn("shape (1000,)", described["summary"])
+
+
+if __name__ == "__main__":
+    unittest.main()
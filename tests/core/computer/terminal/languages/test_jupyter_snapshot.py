@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import threading
+import types
+import unittest
+
+from interpreter.core.computer.terminal.languages.jupyter_snapshot import (
+    restore,
+    snapshot,
+)
+
+
+def fake_shell(user_ns):
+    return types.SimpleNamespace(user_ns=user_ns, user_ns_hidden={"In": []})
+
+
+class TestJupyterSnapshot(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "snapshots", "Hi__May_01.pkl")
+
+    def test_round_trip(self):
+        # (Defined in the session, so it's pickled by value, not by reference)
+        namespace = {}
+        exec("def double(x):\n    return x * 2", namespace)
+        shell = fake_shell(
+            {
+                "json": json,
+                "data": {"rows": [1, 2, 3]},
+                "double": namespace["double"],
+                "lock": threading.Lock(),
+                "computer": object(),
+                "_private": 1,
+            }
+        )
+        shell.user_ns["In"] = shell.user_ns_hidden["In"]
+
+        result = snapshot(shell, self.path, exclude=["computer"])
+        self.assertEqual(result["saved"], ["json", "data", "double"])
+        self.assertEqual(result["skipped"], ["lock"])
+
+        restored_shell = fake_shell({})
+        result = restore(restored_shell, self.path)
+        self.assertEqual(result, {"restored": ["data", "double", "json"], "failed": []})
+        self.assertIs(restored_shell.user_ns["json"], json)
+        self.assertEqual(restored_shell.user_ns["data"], {"rows": [1, 2, 3]})
+        self.assertEqual(restored_shell.user_ns["double"](21), 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
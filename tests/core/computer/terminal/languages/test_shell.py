@@ -0,0 +1,62 @@
+import os
+import platform
+import time
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.terminal.languages.shell import Shell
+
+
+@unittest.skipIf(platform.system() == "Windows", "No PTYs on Windows")
+class TestPtyShell(unittest.TestCase):
+    def setUp(self):
+        self.shell = Shell()
+        self.shell.start_cmd = ["bash"]
+        self.addCleanup(self.shell.terminate)
+
+    def output(self, code):
+        return "".join(
+            chunk["content"]
+            for chunk in self.shell.run(code)
+            if chunk["format"] == "output"
+        )
+
+    def test_partial_lines_arrive_before_the_rest(self):
+        start = time.time()
+        for chunk in self.shell.run('printf "Continue? "; sleep 1; echo yes'):
+            if chunk["format"] == "output" and "Continue?" in chunk["content"]:
+                break
+        self.assertLess(time.time() - start, 0.8)
+
+    def test_partial_lines_with_a_hash_arrive_before_the_rest(self):
+        start = time.time()
+        for chunk in self.shell.run('printf "Item #: "; sleep 2; echo 3'):
+            if chunk["format"] == "output" and "Item #:" in chunk["content"]:
+                break
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_stdout_and_stderr_keep_their_order(self):
+        output = self.output("echo one; echo two >&2; echo three")
+        self.assertEqual(output.split(), ["one", "two", "three"])
+
+    def test_output_is_decoded_across_reads(self):
+        self.assertIn("é", self.output(r'printf "\xc3"; sleep 0.1; printf "\xa9\n"'))
+
+    def test_restarts_after_the_shell_exits(self):
+        self.assertIn("exited with code 3", self.output("x=1; exit 3"))
+        self.assertFalse(self.shell.is_alive())
+        self.assertEqual(self.output("echo again").strip(), "again")
+
+    @mock.patch.dict(os.environ, {"INTERPRETER_ACTIVE_LINE_DETECTION": "sampled"})
+    def test_sampled_active_lines_stay_out_of_the_output(self):
+        code = "echo a\n" * 100 + "sleep 0.3\necho b"
+        chunks = list(self.shell.run(code))
+
+        self.assertNotIn("##", self.output(code))
+        lines = [c["content"] for c in chunks if c["format"] == "active_line"]
+        self.assertIn(101, lines)  # The sleep
+        self.assertLess(len(lines), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
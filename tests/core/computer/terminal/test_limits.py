@@ -0,0 +1,59 @@
+import os
+import platform
+import subprocess
+import sys
+import time
+import unittest
+
+from interpreter.core.computer.terminal.limits import (
+    ResourceMonitor,
+    looks_like_input_prompt,
+    waiting_for_input,
+)
+
+
+class TestLimits(unittest.TestCase):
+    def test_input_prompts(self):
+        for output in [
+            "Overwrite file.txt? [y/N] ",
+            "Proceed (y/n)? ",
+            "Downloading...\nPassword for 'https://github.com': ",
+            "Enter your name: ",
+            "Press Enter to continue...",
+        ]:
+            self.assertTrue(looks_like_input_prompt(output), output)
+
+        for output in [
+            "",
+            "Continue? [y/N]\n",  # Followed by a newline, so not waiting on this line
+            "Downloading... 45%",
+            "Building wheel",
+        ]:
+            self.assertFalse(looks_like_input_prompt(output), output)
+
+    @unittest.skipIf(platform.system() == "Windows", "Uses /proc-style process info")
+    def test_monitor_measures_a_process(self):
+        monitor = ResourceMonitor(os.getpid())
+        sum(range(3_000_000))
+        monitor.sample()
+        usage = monitor.usage()
+        self.assertGreater(usage["cpu_time"], 0)
+        self.assertGreater(usage["max_rss"], 0)
+        self.assertIsNotNone(monitor.exceeded(cpu_limit=0.000001))
+        self.assertIsNone(monitor.exceeded(timeout=60, memory_limit=2**50))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Uses /proc")
+    def test_processes_blocked_reading_stdin(self):
+        reading = subprocess.Popen(["cat"], stdin=subprocess.PIPE)
+        sleeping = subprocess.Popen(["sleep", "10"], stdin=subprocess.PIPE)
+        for process in [reading, sleeping]:
+            self.addCleanup(process.wait)
+            self.addCleanup(process.kill)
+        time.sleep(0.5)
+
+        self.assertTrue(waiting_for_input(reading.pid))
+        self.assertFalse(waiting_for_input(sleeping.pid))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import platform
+import time
+import unittest
+from unittest import mock
+
+from interpreter.core.computer.terminal.terminal import Terminal
+
+
+@unittest.skipIf(platform.system() == "Windows", "Uses sh")
+class TestRunParallel(unittest.TestCase):
+    def setUp(self):
+        self.terminal = Terminal(mock.Mock())
+        self.addCleanup(self.terminal.terminate)
+
+    def test_independent_blocks_run_at_the_same_time(self):
+        start = time.time()
+        outputs = self.terminal.run_parallel(
+            [
+                {"id": "a", "language": "shell", "code": "sleep 1; echo A"},
+                {"id": "b", "language": "shell", "code": "sleep 1; echo B"},
+            ]
+        )
+        self.assertLess(time.time() - start, 1.9)
+        self.assertEqual(outputs["a"][0]["content"].strip(), "A")
+        self.assertEqual(outputs["b"][0]["content"].strip(), "B")
+        # The second shell is kept for next time
+        self.assertEqual(len(self.terminal._language_pool["shell"]), 1)
+
+    def test_blocks_wait_for_the_blocks_they_come_after(self):
+        chunks = list(
+            self.terminal.run_parallel(
+                [
+                    {"language": "shell", "code": "sleep 0.5; echo first"},
+                    {"language": "shell", "code": "echo second", "after": [0]},
+                ],
+                stream=True,
+            )
+        )
+        ends = [chunk["block"] for chunk in chunks if chunk["type"] == "block"]
+        self.assertEqual(ends, [0, 1])
+
+    def test_cap_on_concurrent_blocks(self):
+        start = time.time()
+        self.terminal.run_parallel(
+            [{"language": "shell", "code": "sleep 0.5"} for _ in range(2)],
+            max_parallel=1,
+        )
+        self.assertGreater(time.time() - start, 1)
+
+    def test_blocks_are_stopped_after_the_timeout(self):
+        self.terminal.timeout = 0.5
+        start = time.time()
+        output = self.terminal.run("shell", "sleep 10")
+        self.assertLess(time.time() - start, 5)
+        self.assertIn("ran for more than 0.5 seconds", output[-1]["content"])
+        self.assertGreater(self.terminal.last_usage["wall_time"], 0.5)
+
+    def test_the_rest_of_the_block_doesnt_run_after_the_timeout(self):
+        self.terminal.timeout = 1
+        output = self.terminal.run("shell", "sleep 3\necho AFTER_TIMEOUT")
+        time.sleep(3)  # (It would have run by now)
+        self.assertNotIn("AFTER_TIMEOUT", str(output))
+        self.assertIn("ran for more than 1 seconds", output[-1]["content"])
+
+        self.terminal.timeout = None
+        output = self.terminal.run("shell", "echo still works")
+        self.assertIn("still works", str(output))
+
+    def test_unknown_dependencies_are_an_error(self):
+        with self.assertRaises(ValueError):
+            self.terminal.run_parallel(
+                [{"language": "shell", "code": "echo hi", "after": ["nope"]}]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import base64
+import os
+import tempfile
+import unittest
+
+from interpreter.core.computer.vision.description_cache import DescriptionCache
+
+
+class TestDescriptionCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.image = {
+            "type": "image",
+            "format": "base64.png",
+            "content": base64.b64encode(b"not really a png").decode(),
+        }
+
+    def test_persists_across_instances(self):
+        # Arrange
+        cache = DescriptionCache(self.temp_dir.name)
+        key = cache.key(self.image, "Vision.query")
+
+        # Act
+        cache.set(key, "A cat.", "meow")
+        reopened = DescriptionCache(self.temp_dir.name)
+
+        # Assert
+        self.assertEqual(
+            reopened.get(reopened.key(self.image, "Vision.query")),
+            {"description": "A cat.", "ocr": "meow"},
+        )
+
+    def test_key_depends_on_renderer(self):
+        cache = DescriptionCache(self.temp_dir.name)
+
+        self.assertNotEqual(
+            cache.key(self.image, "Vision.query"), cache.key(self.image, "other")
+        )
+
+    def test_unreadable_image_has_no_key(self):
+        cache = DescriptionCache(self.temp_dir.name)
+
+        key = cache.key({"format": "path", "content": "/does/not/exist.png"})
+
+        self.assertIsNone(key)
+        self.assertIsNone(cache.get(key))
+
+    def test_hits_are_the_last_to_be_dropped(self):
+        # Arrange
+        cache = DescriptionCache(self.temp_dir.name, max_memory_entries=2)
+        cache.set("aa1", "first", "")
+        cache.set("bb2", "second", "")
+
+        # Act
+        cache.get("aa1")
+        cache.set("cc3", "third", "")
+
+        # Assert
+        self.assertIn("aa1", cache._memory)
+        self.assertNotIn("bb2", cache._memory)
+
+    def test_least_recently_used_files_are_pruned(self):
+        # Arrange
+        cache = DescriptionCache(self.temp_dir.name, max_disk_entries=10)
+        for i in range(10):
+            key = f"{i:02d}key"
+            cache.set(key, str(i), "")
+            os.utime(cache._entry_path(key), (i, i))
+        cache.get("00key")
+
+        # Act
+        cache.set("10key", "10", "")
+
+        # Assert
+        self.assertLessEqual(len(cache._disk_entry_paths()), 10)
+        self.assertTrue(os.path.exists(cache._entry_path("00key")))
+        self.assertTrue(os.path.exists(cache._entry_path("10key")))
+        self.assertFalse(os.path.exists(cache._entry_path("01key")))
@@ -0,0 +1,75 @@
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from interpreter.core.computer.vision.vision import Vision
+
+
+class TestVision(unittest.TestCase):
+    def test_threads_waiting_for_the_model_still_use_it(self):
+        def from_pretrained(*args, **kwargs):
+            time.sleep(0.2)  # Long enough for the other threads to be waiting
+            model = mock.MagicMock()
+            model.answer_question.return_value = "A white square."
+            return model
+
+        transformers = types.SimpleNamespace(
+            AutoModelForCausalLM=types.SimpleNamespace(from_pretrained=from_pretrained),
+            AutoTokenizer=types.SimpleNamespace(from_pretrained=mock.MagicMock()),
+        )
+        vision = Vision(computer=None)
+        vision.use_service = False
+        image = Image.new("RGB", (10, 10), "white")
+
+        answers = []
+        with mock.patch.dict(sys.modules, {"transformers": transformers}):
+            threads = [
+                threading.Thread(
+                    target=lambda: answers.append(vision.query(pil_image=image))
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(answers, ["A white square."] * 4)
+
+    def test_ocr_runs_while_moondream_is_busy(self):
+        vision = Vision(computer=None)
+        vision.use_service = False
+        generating = threading.Event()
+        release = threading.Event()
+
+        def answer_question(*args, **kwargs):
+            generating.set()
+            release.wait(5)
+            return "A white square."
+
+        vision.model = mock.MagicMock()
+        vision.model.answer_question.side_effect = answer_question
+        vision.tokenizer = mock.MagicMock()
+        vision.easyocr = mock.MagicMock()
+        vision.easyocr.readtext.return_value = [(None, "hello", 1.0)]
+        image = Image.new("RGB", (10, 10), "white")
+
+        query = threading.Thread(target=vision.query, kwargs={"pil_image": image})
+        query.start()
+        self.addCleanup(query.join)
+        self.addCleanup(release.set)
+        self.assertTrue(generating.wait(5))
+
+        # Would wait for the query (5 seconds) if they shared a lock
+        start = time.time()
+        self.assertEqual(vision.ocr(pil_image=image), "hello")
+        self.assertLess(time.time() - start, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import importlib.util
+import unittest
+
+from PIL import Image
+
+from interpreter.core.computer.vision.vision_service import (
+    VisionService,
+    _percentile,
+    _to_bytes,
+)
+
+
+class TestVisionService(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(_percentile(values, 50), 51)
+        self.assertEqual(_percentile(values, 95), 95)
+        self.assertIsNone(_percentile([], 50))
+
+    @unittest.skipIf(
+        importlib.util.find_spec("easyocr") is not None,
+        "Would load the real OCR model",
+    )
+    def test_requests_round_trip_and_are_measured(self):
+        # Arrange
+        service = VisionService(max_workers=2)
+        self.addCleanup(service.stop)
+        image = Image.new("RGB", (20, 20), "white")
+
+        # Act
+        # Without easyocr installed, ocr() prints a hint and returns ""
+        futures = [service.submit("ocr", _to_bytes(image)) for _ in range(3)]
+        results = [future.result(timeout=60) for future in futures]
+        metrics = service.metrics(timeout=60)
+
+        # Assert
+        self.assertEqual(results, ["", "", ""])
+        self.assertEqual(metrics["completed"], 3)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertIsNotNone(metrics["latency_p95"])
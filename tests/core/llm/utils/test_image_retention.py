@@ -0,0 +1,78 @@
+import base64
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from interpreter.core.llm.utils.image_retention import (
+    estimate_image_tokens,
+    retain_images,
+)
+
+
+def image_message(size=(1024, 768)):
+    buffered = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffered, format="PNG")
+    return {
+        "role": "computer",
+        "type": "image",
+        "format": "base64.png",
+        "content": base64.b64encode(buffered.getvalue()).decode("utf-8"),
+    }
+
+
+def image_size(message):
+    return Image.open(io.BytesIO(base64.b64decode(message["content"]))).size
+
+
+def fake_llm(model, image_token_budget):
+    llm = mock.Mock()
+    llm.model = model
+    llm.image_budgets = {}
+    llm.image_token_budget = image_token_budget
+    llm.interpreter.verbose = False
+    llm._get_description_cache.return_value = None
+    return llm
+
+
+class TestImageRetention(unittest.TestCase):
+    def test_estimate_image_tokens(self):
+        self.assertEqual(estimate_image_tokens(1024, 1024, "low", "gpt-4o"), 85)
+        # 768x768 after scaling = 4 tiles
+        self.assertEqual(estimate_image_tokens(1024, 1024, "high", "gpt-4o"), 765)
+        self.assertEqual(estimate_image_tokens(750, 100, None, "claude-3"), 100)
+
+    def test_older_images_degrade_progressively(self):
+        # Arrange
+        # For Claude, these are ~1050 tokens in full, ~260 at low detail and ~65 as thumbnails
+        messages = [{"role": "system", "type": "message", "content": "hi"}]
+        messages += [image_message() for _ in range(4)]
+        originals = [dict(message) for message in messages]
+
+        # Act
+        result = retain_images(messages, fake_llm("claude-3-opus", 1400))
+
+        # Assert
+        self.assertEqual(result[4], messages[4])  # Newest, sent as is
+        self.assertEqual(
+            image_size(result[3]), (512, 384)
+        )  # Claude has no "low" detail
+        self.assertEqual(image_size(result[2]), (256, 192))  # A thumbnail
+        self.assertEqual(result[1]["format"], "description")
+        self.assertEqual(messages, originals)  # Input left alone
+
+    def test_low_detail_is_a_setting_for_openai(self):
+        messages = [{**image_message(), "detail": "high"} for _ in range(2)]
+
+        result = retain_images(messages, fake_llm("gpt-4o", 340))
+
+        self.assertEqual(result[0]["detail"], "low")
+        self.assertEqual(result[0]["content"], messages[0]["content"])
+
+    def test_no_budget_keeps_everything(self):
+        messages = [image_message(), image_message()]
+
+        result = retain_images(messages, fake_llm("gpt-4o", None))
+
+        self.assertIs(result, messages)
@@ -0,0 +1,64 @@
+import base64
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from interpreter.core.llm.utils import image_sizing
+from interpreter.core.llm.utils.image_sizing import fit_image, image_budget
+
+
+def encode(img, format="PNG"):
+    buffered = io.BytesIO()
+    img.save(buffered, format=format)
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def decode(encoded_string):
+    return Image.open(io.BytesIO(base64.b64decode(encoded_string)))
+
+
+class TestImageSizing(unittest.TestCase):
+    def test_budget_lookup_prefers_overrides(self):
+        self.assertEqual(image_budget("gpt-4o")["max_side"], 512)
+        self.assertEqual(image_budget("claude-3-5-sonnet-20240620")["max_side"], 1568)
+        self.assertEqual(
+            image_budget("gpt-4o", {"gpt-4o": {"max_side": 100}}), {"max_side": 100}
+        )
+
+    def test_small_image_is_untouched(self):
+        encoded = encode(Image.new("RGB", (100, 50), "white"))
+
+        result, extension = fit_image(encoded, "png", image_budget("gpt-4o"))
+
+        self.assertIs(result, encoded)
+        self.assertEqual(extension, "png")
+
+    def test_scales_to_max_side(self):
+        encoded = encode(Image.new("RGB", (2048, 1024), "white"))
+
+        result, _ = fit_image(encoded, "png", image_budget("gpt-4o"))
+
+        self.assertEqual(decode(result).size, (512, 256))
+
+    def test_fits_byte_limit_in_at_most_two_encodes(self):
+        # Arrange
+        # Noise doesn't compress, so this PNG is ~3MB
+        pixels = np.random.default_rng(0).integers(0, 255, (1000, 1000, 3), np.uint8)
+        encoded = encode(Image.fromarray(pixels))
+        budget = {"max_bytes": 1024 * 1024}
+
+        # Act
+        with mock.patch.object(
+            image_sizing, "_encode", wraps=image_sizing._encode
+        ) as encode_spy:
+            result, extension = fit_image(encoded, "png", budget)
+
+        # Assert
+        self.assertLessEqual(encode_spy.call_count, 2)
+        self.assertLessEqual(
+            image_sizing.data_url_size(len(base64.b64decode(result)), extension),
+            budget["max_bytes"],
+        )
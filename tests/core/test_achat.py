@@ -0,0 +1,52 @@
+import asyncio
+from unittest import TestCase
+
+from interpreter import OpenInterpreter
+
+
+def delta_chunk(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+class TestAchat(TestCase):
+    def setUp(self):
+        self.interpreter = OpenInterpreter()
+        self.interpreter.llm.model = "gpt-4o"
+        self.interpreter.llm.supports_functions = False
+        self.interpreter.llm.context_window = 100000
+        self.interpreter.llm.max_tokens = 1000
+        self.interpreter.conversation_history = False
+        self.interpreter.auto_run = True
+
+    def test_achat_streams_from_acompletions(self):
+        replies = iter(
+            [
+                ["Let me check.", "\n", "```", "python\n", "print(1 + 1)\n", "```"],
+                ["It's ", "2."],
+            ]
+        )
+
+        async def acompletions(**params):
+            for content in next(replies):
+                yield delta_chunk(content)
+
+        self.interpreter.llm.acompletions = acompletions
+        self.interpreter.llm.completions = None  # The sync path shouldn't be used
+
+        async def chat():
+            chunks = []
+            async for chunk in self.interpreter.achat("What's 1 + 1?", stream=True):
+                chunks.append(chunk)
+            return chunks
+
+        chunks = asyncio.run(chat())
+        messages = self.interpreter.messages
+
+        self.assertTrue(any(chunk.get("start") for chunk in chunks))
+        self.assertEqual(messages[1]["type"], "message")
+        self.assertEqual(messages[2]["type"], "code")
+        self.assertEqual(messages[2]["content"].strip(), "print(1 + 1)")
+        self.assertEqual(messages[3]["role"], "computer")
+        self.assertIn("2", messages[3]["content"])
+        self.assertEqual(messages[-1]["content"], "It's 2.")
+        self.interpreter.computer.terminate()
@@ -0,0 +1,115 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from interpreter import OpenInterpreter
+from interpreter.core.utils.blob_store import (
+    BlobRef,
+    BlobStore,
+    image_bytes,
+    json_default,
+    materialize,
+    to_blob_ref,
+)
+from interpreter.core.utils.conversation_store import (
+    ConversationStore,
+    load_conversation,
+)
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_ref_stands_in_for_the_base64_string(self):
+        store = BlobStore()
+        data = os.urandom(1000)
+        encoded = base64.b64encode(data).decode()
+        ref = to_blob_ref(encoded, store)
+
+        self.assertIsInstance(ref, BlobRef)
+        self.assertEqual(ref.bytes(), data)
+        self.assertEqual(image_bytes(ref), image_bytes(encoded))
+        self.assertEqual(str(ref), encoded)
+        self.assertEqual(len(ref), len(encoded))
+        self.assertEqual(ref[:30], encoded[:30])
+        self.assertEqual(ref, encoded)
+        self.assertNotEqual(ref, "")
+        self.assertEqual(ref, to_blob_ref(encoded, store))  # Same bytes, same blob
+
+        message = {"type": "image", "format": "base64.png", "content": ref}
+        self.assertEqual(materialize([message])[0]["content"], encoded)
+        self.assertIs(message["content"], ref)  # (Not changed in place)
+        self.assertEqual(
+            json.loads(json.dumps(message, default=json_default))["content"], encoded
+        )
+
+    def test_spills_least_recently_used_blobs_to_disk(self):
+        store = BlobStore(memory_budget=2500, spill_path=self.directory)
+        refs = [store.put(bytes([i]) * 1000) for i in range(3)]
+
+        self.assertEqual(
+            store.path(refs[0].hash), os.path.join(self.directory, refs[0].hash)
+        )
+        self.assertIsNone(store.path(refs[2].hash))
+        self.assertEqual(refs[0].bytes(), bytes([0]) * 1000)
+
+    def test_conversations_load_images_lazily(self):
+        path = os.path.join(self.directory, "Hi__May_01.jsonl")
+        ref = to_blob_ref(base64.b64encode(os.urandom(30000)).decode())
+        messages = [
+            {
+                "role": "computer",
+                "type": "image",
+                "format": "base64.png",
+                "content": ref,
+            }
+        ]
+        ConversationStore(path).save(messages)
+
+        loaded = load_conversation(path)
+        self.assertIsInstance(loaded[0]["content"], BlobRef)
+        self.assertEqual(loaded[0]["content"].hash, ref.hash)
+        self.assertEqual(loaded, messages)
+
+    def test_chat_returns_plain_base64(self):
+        interpreter = OpenInterpreter()
+        interpreter.llm.model = "gpt-4o"
+        interpreter.llm.supports_functions = False
+        interpreter.llm.context_window = 100000
+        interpreter.llm.max_tokens = 1000
+        interpreter.conversation_history = False
+        interpreter.auto_run = True
+
+        replies = iter([["```python\n", "plot()\n", "```"], ["Done."]])
+
+        def completions(**params):
+            for content in next(replies):
+                yield {"choices": [{"delta": {"content": content}}]}
+
+        interpreter.llm.completions = completions
+        data = os.urandom(1000)
+        image = {
+            "type": "image",
+            "format": "base64.png",
+            "content": base64.b64encode(data).decode(),
+        }
+        with mock.patch.object(interpreter.computer, "run", return_value=iter([image])):
+            messages = interpreter.chat("Plot it", display=False)
+
+        images = [m for m in messages if m["type"] == "image"]
+        self.assertEqual(base64.b64decode(images[0]["content"]), data)
+        json.dumps(messages)
+        json.dumps(interpreter.messages)
+        # (Copies. Inside, the image is still in the blob store)
+        stored = [m for m in interpreter._messages if m["type"] == "image"]
+        self.assertIsInstance(stored[0]["content"], BlobRef)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from interpreter.core.utils.conversation_index import ConversationIndex
+from interpreter.core.utils.conversation_store import ConversationStore
+
+
+class TestConversationIndex(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.index = ConversationIndex(self.directory)
+        self.addCleanup(self.index.close)
+
+    def save(self, filename, first_message, mtime):
+        path = os.path.join(self.directory, filename)
+        messages = [
+            {"role": "user", "type": "message", "content": first_message},
+            {"role": "assistant", "type": "message", "content": "Sure."},
+        ]
+        if filename.endswith(".jsonl"):
+            ConversationStore(path).save(messages)
+        else:
+            with open(path, "w") as f:
+                json.dump(messages, f)
+        os.utime(path, (mtime, mtime))
+
+    def test_lists_newest_first_with_pagination_and_search(self):
+        now = time.time()
+        for i in range(25):
+            self.save(f"Task_{i}__May_01.jsonl", f"Please do task {i}", now - i)
+        self.save("Old_one__Jan_01.json", "Plot the weather data", now - 100)
+
+        self.index.refresh()
+
+        self.assertEqual(self.index.count(), 26)
+        first_page = self.index.list(limit=10)
+        self.assertEqual(first_page[0]["filename"], "Task_0__May_01.jsonl")
+        self.assertEqual(first_page[0]["message_count"], 2)
+        self.assertEqual(first_page[0]["first_user_message"], "Please do task 0")
+        self.assertEqual(len(self.index.list(offset=20, limit=10)), 6)
+        self.assertEqual(
+            [c["filename"] for c in self.index.list(query="weather")],
+            ["Old_one__Jan_01.json"],
+        )
+        self.assertEqual(self.index.count(query="100%"), 0)
+
+    def test_refresh_only_rereads_changed_files(self):
+        self.save("A__May_01.jsonl", "First", time.time())
+        self.index.refresh()
+        updated = []
+        self.index.update = lambda filename, messages=None: updated.append(filename)
+
+        self.index.refresh(force=True)
+        self.assertEqual(updated, [])
+
+        self.save("B__May_02.jsonl", "Second", time.time())
+        os.remove(os.path.join(self.directory, "A__May_01.jsonl"))
+        self.index.refresh(force=True)
+
+        self.assertEqual(updated, ["B__May_02.jsonl"])
+        self.assertEqual(self.index.count(), 0)  # A was removed (B was "updated" by us)
+
+    def test_full_text_search_is_incremental(self):
+        if not self.index.has_full_text:
+            self.skipTest("SQLite was built without FTS5")
+
+        path = os.path.join(self.directory, "Plot__May_01.jsonl")
+        store = ConversationStore(path)
+        messages = [
+            {"role": "user", "type": "message", "content": "Plot my temperatures"},
+            {
+                "role": "assistant",
+                "type": "code",
+                "format": "python",
+                "content": "import matplotlib",
+            },
+        ]
+        store.save(messages)
+        self.index.update("Plot__May_01.jsonl", messages)
+        messages.append(
+            {
+                "role": "computer",
+                "type": "console",
+                "format": "output",
+                "content": "Saved chart.png",
+            }
+        )
+        store.save(messages)
+        self.index.update("Plot__May_01.jsonl", messages)
+        self.save("Other__May_02.jsonl", "Something else", time.time())
+        self.index.refresh(force=True)
+
+        rows = self.index.connection.execute(
+            "SELECT COUNT(*) FROM messages_fts WHERE filename = ?",
+            ("Plot__May_01.jsonl",),
+        ).fetchone()[0]
+        self.assertEqual(rows, 3)  # Nothing indexed twice
+
+        results = self.index.search("matplot")  # (Prefix of the last word)
+        self.assertEqual([r["filename"] for r in results], ["Plot__May_01.jsonl"])
+        self.assertIn("**matplotlib**", results[0]["snippet"])
+        self.assertEqual(self.index.count_matches("chart png"), 1)
+        self.assertEqual(self.index.count_matches('"OR" NEAR('), 0)  # Not FTS syntax
+
+
+if __name__ == "__main__":
+    unittest.main()
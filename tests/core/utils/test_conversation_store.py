@@ -0,0 +1,106 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+
+from interpreter.core.utils.blob_store import materialize
+from interpreter.core.utils.conversation_store import (
+    ConversationStore,
+    load_conversation,
+)
+
+
+def image_message(seed):
+    content = base64.b64encode(bytes([seed]) * 30000).decode()
+    return {
+        "role": "computer",
+        "type": "image",
+        "format": "base64.png",
+        "content": content,
+    }
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "Hello__May_01.jsonl")
+
+    def lines(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_only_new_messages_are_appended(self):
+        store = ConversationStore(self.path)
+        messages = [{"role": "user", "type": "message", "content": "Hi"}]
+        store.save(messages)
+        messages += [
+            {"role": "assistant", "type": "message", "content": "Hello!"},
+            image_message(1),
+        ]
+        store.save(messages)
+        store.save(messages)
+
+        lines = self.lines()
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn("content", lines[2])  # It's in a blob
+        self.assertEqual(load_conversation(self.path), messages)
+
+    def test_loaded_images_dont_count_as_changes(self):
+        store = ConversationStore(self.path)
+        messages = [
+            {"role": "user", "type": "message", "content": "Hi"},
+            image_message(1),
+        ]
+        store.save(messages)
+
+        # Loaded back as BlobRefs, then turned back into base64 (interpreter.messages)
+        resumed = ConversationStore(self.path)
+        messages = materialize(resumed.load())
+        messages.append({"role": "assistant", "type": "message", "content": "Hey"})
+        resumed.save(messages)
+
+        lines = self.lines()
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn("_truncate", str(lines))
+
+    def test_same_image_is_stored_once(self):
+        store = ConversationStore(self.path)
+        store.save([image_message(1), image_message(1), image_message(2)])
+
+        blobs = [files for _, _, files in os.walk(store.blobs_path) if files]
+        self.assertEqual(sum(len(files) for files in blobs), 2)
+
+    def test_edits_truncate_and_compaction_keeps_live_messages(self):
+        store = ConversationStore(self.path)
+        messages = [
+            {"role": "user", "type": "message", "content": "Hi"},
+            {"role": "assistant", "type": "message", "content": "Hello"},
+        ]
+        store.save(messages)
+        messages[1]["content"] += " there"
+        messages.append({"role": "user", "type": "message", "content": "Bye"})
+
+        # A new store (e.g. a resumed conversation) picks up where the file left off
+        ConversationStore(self.path).save(messages)
+
+        self.assertEqual(len(self.lines()), 5)
+        self.assertEqual(load_conversation(self.path), messages)
+
+        store = ConversationStore(self.path)
+        store.load()
+        store.compact()
+        self.assertEqual(self.lines(), messages)
+
+    def test_loads_old_json_conversations(self):
+        old_path = self.path[:-1]
+        messages = [{"role": "user", "type": "message", "content": "Hi"}]
+        with open(old_path, "w") as f:
+            json.dump(messages, f)
+
+        self.assertEqual(load_conversation(old_path), messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import base64
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from interpreter.terminal_interface.utils import count_tokens
+from interpreter.terminal_interface.utils.count_tokens import (
+    count_tokens_batch,
+    get_encoder,
+    messages_tokens,
+)
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestCountTokens(unittest.TestCase):
+    def setUp(self):
+        get_encoder.cache_clear()
+        self.addCleanup(get_encoder.cache_clear)
+
+    def test_encoders_are_loaded_once_and_warn_once(self):
+        def encoding_for_model(model):
+            if model != "gpt-4":
+                raise KeyError(model)
+            return mock.sentinel.gpt4_encoder
+
+        fake_tiktoken = mock.Mock()
+        fake_tiktoken.encoding_for_model.side_effect = encoding_for_model
+
+        with mock.patch.object(count_tokens, "tiktoken", fake_tiktoken), mock.patch(
+            "builtins.print"
+        ) as fake_print:
+            encoders = [get_encoder("ollama/llama3") for _ in range(5)]
+
+        self.assertEqual(encoders, [mock.sentinel.gpt4_encoder] * 5)
+        self.assertEqual(fake_print.call_count, 1)
+        self.assertEqual(fake_tiktoken.encoding_for_model.call_count, 2)
+
+    def test_lmc_content_is_counted(self):
+        text = "The quick brown fox jumps over the lazy dog. " * 20
+        lmc = [{"role": "user", "type": "message", "content": text}]
+        legacy = [{"role": "user", "message": text}]
+
+        self.assertGreater(messages_tokens(lmc, "gpt-4o"), 100)
+        self.assertEqual(
+            messages_tokens(lmc, "gpt-4o"), messages_tokens(legacy, "gpt-4o")
+        )
+        self.assertEqual(
+            sum(count_tokens_batch([text, text], "gpt-4o")),
+            2 * count_tokens.count_tokens(text, "gpt-4o"),
+        )
+
+    def test_images_are_estimated_from_their_size(self):
+        small = {"role": "user", "type": "image", "format": "base64.png"}
+        big = dict(small)
+        small["content"] = png(100, 100)
+        big["content"] = png(1500, 1000)
+        openai_style = {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "data:image/png;base64," + big["content"]},
+                }
+            ],
+        }
+
+        small_tokens = messages_tokens([small], "claude-3-5-sonnet")
+        big_tokens = messages_tokens([big], "claude-3-5-sonnet")
+
+        self.assertLess(small_tokens, big_tokens)
+        self.assertEqual(
+            messages_tokens([openai_style], "claude-3-5-sonnet"), big_tokens
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()